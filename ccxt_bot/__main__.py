@@ -3,48 +3,24 @@
 import asyncio
 
 import ccxt
-from ccxt_bot.trade.bot import Ccxt_bot
 from ccxt_bot.core.logger import logger
-from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+from ccxt_bot.trade.runner import BotRunner
+from ccxt_bot.trade.shard import ShardSupervisor
 from ccxt_bot.core import config
 import ccxt_bot
-import schedule
 
 async def main():
     logger.info(f"ccxt version: {ccxt.__version__}")
     logger.info(f"ccxt bot commit hash: {ccxt_bot.__commit_hash__}")
-    # 4h KD bot
-    bot = Ccxt_bot(
-        api_key=config.BINANCE_API_KEY,
-        secret=config.BINANCE_SECRET,
-        exchange_id="binance",
-        symbol="ETH/USDT",
-        timeframe="4h",
-        line_token=config.LINE_TOKEN,
-        backtest=config.BACKTEST,
-        sandbox=config.SANDBOX,
-    )
-    bot.register_strategy(KD50Strategy())
-    bot.join_schedule(scheduler=schedule)
+    logger.info(f"bots config: {config.BOTS_CONFIG}")
     
-    # 1h impluse MACD bot
-    bot1 = Ccxt_bot(
-        api_key=config.BINANCE_API_KEY,
-        secret=config.BINANCE_SECRET,
-        exchange_id="binance",
-        symbol="ETH/USDT",
-        timeframe="1h",
-        line_token=config.LINE_TOKEN,
-        backtest=config.BACKTEST,
-        sandbox=config.SANDBOX,
-    )
-    bot1.register_strategy(KD50Strategy())
-    bot1.register_strategy(ImpulseMACDStrategy())
-    bot1.join_schedule(scheduler=schedule)
-    
-    while True:
-        schedule.run_pending()
-        await asyncio.sleep(1)
+    # 依照設定檔建立所有 bot, 預設為 4h KD bot 與 1h impluse MACD bot
+    if config.SHARD_WORKERS > 0:
+        # 指標與策略分配到多個 process 計算
+        runner = ShardSupervisor.from_toml(config.BOTS_CONFIG, workers=config.SHARD_WORKERS)
+    else:
+        runner = BotRunner.from_toml(config.BOTS_CONFIG)
+    await runner.run(stream=config.STREAM)
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import os
+
 from decouple import config
 
 
@@ -8,4 +10,11 @@ BINANCE_SECRET  = config('BINANCE_SECRET',  cast=str,  default='')
 LINE_TOKEN      = config('LINE_TOKEN',      cast=str,  default='')
 APP_NAME        = config('APP_NAME',        cast=str,  default='ccxt_bot')
 BACKTEST        = config('BACKTEST',        cast=bool, default=False)
-SANDBOX         = config('SANDBOX',         cast=bool, default=True)
\ No newline at end of file
+SANDBOX         = config('SANDBOX',         cast=bool, default=True)
+VERIFY_INDICATOR = config('VERIFY_INDICATOR', cast=bool, default=False)
+ARCHIVE_DIR     = config('ARCHIVE_DIR',     cast=str,  default='')
+STREAM          = config('STREAM',          cast=bool, default=False)
+BOTS_CONFIG     = config('BOTS_CONFIG',     cast=str,  default=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bots.toml'))
+SHARD_WORKERS   = config('SHARD_WORKERS',   cast=int,  default=0)
+TRACE_FILE      = config('TRACE_FILE',      cast=str,  default='')
+METRICS_FILE    = config('METRICS_FILE',    cast=str,  default='')
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import contextvars
+import itertools
+import json
+import os
+import time
+from typing import Dict, IO, List, Optional, Tuple
+
+from ccxt_bot.core import config
+from ccxt_bot.core.logger import logger
+
+
+# 秒, 涵蓋 指標計算(ms) 到 REST 請求重試(數十秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram():
+    """Prometheus 格式的 histogram, counts[i] 為 <= buckets[i] 的數量 (不累加)"""
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, 累計數量), 最後一個為 +Inf"""
+        les = [repr(float(b)) for b in self.buckets] + ['+Inf']
+        return list(zip(les, itertools.accumulate(self.counts)))
+
+
+class Span():
+    """一個階段的計時, 以 with 使用, 結束時記錄到 Tracer"""
+    def __init__(self, tracer: 'Tracer', name: str, labels: Dict[str, str], root: bool):
+        self._tracer = tracer
+        self.name = name
+        self.labels = labels
+        self._root = root
+        self.trace_id: Optional[int] = None
+        self.parent: Optional[str] = None
+        self.duration = 0.0
+
+    def __enter__(self) -> 'Span':
+        current = _current.get()
+        if self._root or current is None:
+            self.trace_id = next(self._tracer._ids)
+        else:
+            self.trace_id = current.trace_id
+            self.parent = current.name
+            # 子階段繼承 symbol timeframe 等標籤
+            self.labels = {**current.labels, **self.labels}
+        self._token = _current.set(self)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        self._tracer._finish(self, exc_type)
+
+
+# 目前所在的 span, 在 asyncio task 之間以 context 傳遞
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('span', default=None)
+
+
+class Tracer():
+    """Tracer
+
+    記錄每個 tick 各階段的耗時 (k線 指標 策略 通知 每筆下單)
+        1. 以名稱與標籤累計 histogram, prometheus() 輸出 Prometheus text format
+        2. 有設定 trace_file 時 每個 span 寫入一行 JSON, 同一個 tick 的 span 有相同的 trace id
+        3. 有設定 metrics_file 時 每個 tick 結束後 更新 Prometheus text file (ex. node_exporter textfile collector)
+
+    ex.
+        with tracer.trace('tick', symbol='ETH/USDT'):
+            with tracer.span('fetch'):
+                ...
+    """
+    def __init__(self, trace_file: Optional[str] = None, metrics_file: Optional[str] = None, prefix: str = 'ccxt_bot'):
+        """
+        Args:
+            trace_file (Optional[str], optional): JSON lines 的 trace 檔案.
+            metrics_file (Optional[str], optional): Prometheus text format 的檔案.
+            prefix (str, optional): metric 名稱的前綴. Defaults to 'ccxt_bot'.
+        """
+        self._trace_file = trace_file
+        self._metrics_file = metrics_file
+        self._prefix = prefix
+        self._histograms: Dict[Tuple[str, _Labels], Histogram] = {}
+        self._ids = itertools.count(1)
+        self._file: Optional[IO[str]] = None
+
+    def trace(self, name: str, **labels: str) -> Span:
+        """開始新的 trace (ex. 一次 tick), 其中的 span 都屬於此 trace"""
+        return Span(self, name, labels, root=True)
+
+    def span(self, name: str, **labels: str) -> Span:
+        """目前 trace 中的一個階段, 不在 trace 中則自成一個 trace"""
+        return Span(self, name, labels, root=False)
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """記錄在其他地方量測的耗時"""
+        current = _current.get()
+        labels = {**current.labels, **labels} if current is not None else labels
+        self._histogram(name, labels).observe(seconds)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self._histograms.get((name, _key(labels)))
+
+    def prometheus(self) -> str:
+        """所有 histogram 的 Prometheus text format"""
+        metric = f"{self._prefix}_span_seconds"
+        lines = [
+            f"# HELP {metric} Duration of each stage of the signal-to-order pipeline.",
+            f"# TYPE {metric} histogram",
+        ]
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            base = [('span', name), *labels]
+            for le, count in histogram.cumulative():
+                lines.append(f"{metric}_bucket{_format(base + [('le', le)])} {count}")
+            lines.append(f"{metric}_sum{_format(base)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format(base)} {histogram.count}")
+
+        return '\n'.join(lines) + '\n'
+
+    def write_metrics(self, path: Optional[str] = None) -> None:
+        """寫入 Prometheus text file, 先寫入暫存檔再取代 讀取端不會讀到一半的檔案"""
+        path = path or self._metrics_file
+        if not path: return
+
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp, path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _histogram(self, name: str, labels: Dict[str, str]) -> Histogram:
+        key = (name, _key(labels))
+        if key not in self._histograms:
+            self._histograms[key] = Histogram()
+        return self._histograms[key]
+
+    def _finish(self, span: Span, exc_type) -> None:
+        self._histogram(span.name, span.labels).observe(span.duration)
+
+        try:
+            if self._trace_file:
+                if self._file is None:
+                    self._file = open(self._trace_file, 'a', buffering=1)
+                self._file.write(json.dumps({
+                    'trace': span.trace_id,
+                    'span': span.name,
+                    'parent': span.parent,
+                    'start': span._wall,
+                    'duration_ms': round(span.duration * 1000, 3),
+                    **span.labels,
+                    **({'error': exc_type.__name__} if exc_type is not None else {}),
+                }, default=str) + '\n')
+
+            if span.parent is None and self._metrics_file:
+                self.write_metrics()
+        except OSError as e:
+            logger.warning(f"write trace failed, {type(e).__name__}, {e}")
+
+
+def _key(labels: Dict[str, str]) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(labels: List[Tuple[str, str]]) -> str:
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+# 所有 bot 共用的 tracer
+tracer = Tracer(trace_file=config.TRACE_FILE or None, metrics_file=config.METRICS_FILE or None)
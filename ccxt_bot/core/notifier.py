@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Dict, List, Optional, Protocol, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.metrics import tracer
+
+
+LINE_NOTIFY_URL = "https://notify-api.line.me/api/notify"
+LINE_MAX_CHARS = 1000 # LINE Notify 單則訊息的長度上限
+
+
+class Sink(Protocol):
+    def send(self, token: str, msg: str) -> None:
+        """發送一則訊息, 在背景的 thread 執行 可以阻塞"""
+        ...
+
+
+class LineSink():
+    """LineSink
+
+    以共用的 requests.Session 發送 LINE Notify, 連線會被重複使用
+    連線錯誤 429 與 5xx 會以指數退避重試
+    """
+    def __init__(self, timeout: Tuple[float, float] = (3.05, 10), retries: int = 3, backoff: float = 0.5):
+        """
+        Args:
+            timeout (Tuple[float, float], optional): (連線, 讀取) 逾時秒數. Defaults to (3.05, 10).
+            retries (int, optional): 最多重試幾次. Defaults to 3.
+            backoff (float, optional): 重試的退避秒數. Defaults to 0.5.
+        """
+        self._timeout = timeout
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(max_retries=Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            respect_retry_after_header=True,
+        )))
+
+    def send(self, token: str, msg: str) -> None:
+        # send line notify by Line API
+        response = self._session.post(
+            LINE_NOTIFY_URL,
+            headers={"Authorization": f"Bearer {token}"},
+            data={'message': msg},
+            timeout=self._timeout,
+        )
+        response.raise_for_status()
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class FakeSink():
+    """FakeSink
+
+    測試用, 只記錄收到的訊息
+    """
+    def __init__(self):
+        self.messages: List[Tuple[str, str]] = []
+
+    def send(self, token: str, msg: str) -> None:
+        self.messages.append((token, msg))
+
+
+def chunk_message(msg: str, max_chars: int = LINE_MAX_CHARS) -> List[str]:
+    """chunk_message
+    將訊息切成不超過 max_chars 的片段, 盡量在換行處切開
+
+    Args:
+        msg (str): 訊息
+        max_chars (int, optional): 每個片段的長度上限. Defaults to LINE_MAX_CHARS.
+
+    Returns:
+        List[str]: 訊息片段
+    """
+    chunks = []
+    while len(msg) > max_chars:
+        cut = msg.rfind('\n', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        chunks.append(msg[:cut])
+        msg = msg[cut:].lstrip('\n')
+    if msg:
+        chunks.append(msg)
+
+    return chunks
+
+
+class Notifier():
+    """Notifier
+
+    在背景發送通知, notify 只把訊息放進 queue 不會等待 HTTP 請求, 下單不會被通知延遲
+    短時間內的多則訊息 (ex. 回測重播) 會在 linger 秒內合併, 依照 token 組成不超過 max_chars 的訊息再發送
+    發送失敗只會記錄 log
+
+    ex.
+        notifier.notify(token, msg)
+        await notifier.close()
+    """
+    def __init__(
+        self,
+        sink: Optional[Sink] = None,
+        linger: float = 0.5,
+        max_chars: int = LINE_MAX_CHARS,
+        max_queue: int = 1000,
+    ):
+        """
+        Args:
+            sink (Optional[Sink], optional): 發送訊息的方式. Defaults to LineSink().
+            linger (float, optional): 收到訊息後 等待幾秒合併後續的訊息. Defaults to 0.5.
+            max_chars (int, optional): 每則訊息的長度上限. Defaults to LINE_MAX_CHARS.
+            max_queue (int, optional): 最多保留幾則尚未發送的訊息, 超過的訊息會被丟棄. Defaults to 1000.
+        """
+        self._sink = sink or LineSink()
+        self._linger = linger
+        self._max_chars = max_chars
+        self._max_queue = max_queue
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def sink(self) -> Sink:
+        return self._sink
+
+    def notify(self, token: str, msg: str) -> None:
+        """notify
+        將訊息放進 queue 後立即返回, 沒有執行中的 event loop 時直接發送
+
+        Args:
+            token (str): line token, 沒有 token 則不發送
+            msg (str): 訊息
+        """
+        if not token: return
+
+        try:
+            self._ensure_started()
+        except RuntimeError:
+            self._send(token, msg)
+            return
+
+        try:
+            self._queue.put_nowait((token, msg))
+        except asyncio.QueueFull:
+            logger.warning(f"notification queue is full, drop message: {msg[:50]}")
+
+    async def flush(self) -> None:
+        """等待 queue 中的訊息都發送完成"""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """發送剩餘的訊息 並停止背景的 task"""
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+        self._loop, self._queue, self._task = None, None, None
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+            self._task = loop.create_task(self._run(self._queue))
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            # 合併 linger 秒內的訊息
+            deadline = loop.time() + self._linger
+            while (timeout := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            messages: Dict[str, List[str]] = {}
+            for token, msg in batch:
+                messages.setdefault(token, []).append(msg)
+
+            for token, msgs in messages.items():
+                for chunk in self._pack(msgs):
+                    with tracer.span('notify_send'):
+                        await loop.run_in_executor(None, self._send, token, chunk)
+
+            for _ in batch:
+                queue.task_done()
+
+    def _pack(self, msgs: List[str]) -> List[str]:
+        """將多則訊息組成不超過 max_chars 的訊息, 單則過長的訊息會被切開"""
+        packed, current = [], ''
+        for msg in msgs:
+            for chunk in chunk_message(msg, self._max_chars):
+                if current and len(current) + 1 + len(chunk) > self._max_chars:
+                    packed.append(current)
+                    current = ''
+                current = f"{current}\n{chunk}" if current else chunk
+        if current:
+            packed.append(current)
+
+        return packed
+
+    def _send(self, token: str, msg: str) -> None:
+        try:
+            self._sink.send(token, msg)
+        except Exception as e:
+            logger.error(f"notify failed, {type(e).__name__}, {e}")
+
+
+# 所有 bot 共用的通知
+notifier = Notifier()
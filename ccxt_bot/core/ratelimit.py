@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+import ccxt
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.metrics import tracer
+
+
+T = TypeVar('T')
+
+
+class Priority(IntEnum):
+    """請求的優先順序, 數字越小越先取得額度"""
+    ORDER = 0       # 下單 取消 借款 還款
+    ACCOUNT = 1     # 餘額 委託單 等私有資料
+    MARKET_DATA = 2 # k線 價格 等公開資料
+
+
+class QueueStats():
+    """取得額度前的等待時間統計(秒)"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def add(self, delay: float) -> None:
+        self.count += 1
+        self.total += delay
+        self.max = max(self.max, delay)
+
+    def __repr__(self) -> str:
+        return f"QueueStats(count={self.count}, mean={self.mean:.3f}, max={self.max:.3f})"
+
+
+# 目前請求的優先順序, 由 RateLimiter.attach 包裝的 fetch2 設定
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar('priority', default=Priority.MARKET_DATA)
+
+
+def request_priority(api: Any, method: str, path: str) -> Priority:
+    """依照 ccxt 的 api 類型與 HTTP method 判斷請求的優先順序"""
+    if method in ('POST', 'DELETE', 'PUT') and api != 'public':
+        return Priority.ORDER
+    if api == 'public' or (isinstance(api, (list, tuple)) and 'public' in api):
+        return Priority.MARKET_DATA
+    return Priority.ACCOUNT
+
+
+class RateLimiter():
+    """RateLimiter
+
+    以 token bucket 限制同一個交易所所有 client 的請求權重 (ex. Binance 的 request weight 以 IP 計算)
+    每秒補充 rate 個額度, 最多累積 burst 秒的額度
+    等待中的請求依照 Priority 排序, 同一個優先順序先到先取得, 下單不會被大量的k線請求延遲
+
+    ex.
+        limiter = RateLimiter(rate=20)
+        limiter.attach(exchange) # 使用 ccxt 每個 endpoint 的 cost 作為權重
+    """
+    def __init__(self, rate: float, burst: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate (float): 每秒補充的額度
+            burst (float, optional): 最多累積幾秒的額度. Defaults to 5.0.
+            clock (Callable[[], float], optional): 時間來源. Defaults to time.monotonic.
+        """
+        self._rate = rate
+        self._capacity = rate * burst
+        self._clock = clock
+        self._tokens = self._capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, float]] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._stats: Dict[Priority, QueueStats] = {priority: QueueStats() for priority in Priority}
+
+    @property
+    def stats(self) -> Dict[Priority, QueueStats]:
+        """每個優先順序的等待時間統計"""
+        return self._stats
+
+    @property
+    def queued(self) -> int:
+        """等待中的請求數量"""
+        return len(self._waiters)
+
+    def pause(self, seconds: float) -> None:
+        """收到 429/418 後 暫停所有請求 seconds 秒"""
+        now = self._clock()
+        self._refill(now)
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        logger.warning(f"rate limited, pause requests for {seconds:.1f}s")
+
+    async def acquire(self, weight: float = 1, priority: Priority = Priority.MARKET_DATA) -> float:
+        """acquire
+        等待到有足夠的額度 並扣除
+
+        Args:
+            weight (float, optional): 請求的權重. Defaults to 1.
+            priority (Priority, optional): 優先順序. Defaults to Priority.MARKET_DATA.
+
+        Returns:
+            float: 等待的秒數
+        """
+        # 超過容量的請求 等到額度滿了就放行, 不會永遠等待
+        weight = min(weight, self._capacity)
+        start = self._clock()
+        entry = (int(priority), next(self._seq), weight)
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                now = self._clock()
+                self._refill(now)
+                if self._waiters[0] is entry:
+                    delay = max(self._paused_until - now, (weight - self._tokens) / self._rate)
+                    if delay <= 0:
+                        break
+                else:
+                    delay = None
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._changed.set()
+            raise
+
+        heapq.heappop(self._waiters)
+        self._tokens -= weight
+        # 喚醒下一個等待的請求
+        self._changed.set()
+
+        waited = self._clock() - start
+        self._stats[priority].add(waited)
+        tracer.observe('ratelimit_wait', waited, priority=priority.name)
+        return waited
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def attach(self, exchange) -> None:
+        """attach
+        讓 ccxt client 的請求經過此 limiter, 權重為 ccxt 每個 endpoint 的 cost, 優先順序由 request_priority 判斷
+        client 需要開啟 enableRateLimit, 原本的 throttle 會被取代
+
+        Args:
+            exchange (ccxt_async.Exchange): 交易所 client
+        """
+        fetch2 = exchange.fetch2
+
+        async def prioritized_fetch2(path, api='public', method='GET', *args, **kwargs):
+            token = _priority.set(request_priority(api, method, path))
+            try:
+                return await fetch2(path, api, method, *args, **kwargs)
+            finally:
+                _priority.reset(token)
+
+        async def throttle(cost=None):
+            await self.acquire(cost or 1, _priority.get())
+
+        exchange.fetch2 = prioritized_fetch2
+        exchange.throttle = throttle
+
+
+async def retry(
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = 5,
+    base: float = 0.5,
+    cap: float = 30.0,
+    retry_on: Tuple[Type[BaseException], ...] = (ccxt.NetworkError,),
+    limiter: Optional[RateLimiter] = None,
+) -> T:
+    """retry
+    發生網路錯誤時 以指數退避加上隨機抖動 (full jitter) 重試, 最多 attempts 次
+    被交易所限流 (DDoSProtection / RateLimitExceeded) 時 同時暫停 limiter 的所有請求
+
+    Args:
+        fn (Callable[[], Awaitable[T]]): 每次重試都會重新呼叫
+        attempts (int, optional): 最多執行幾次. Defaults to 5.
+        base (float, optional): 第一次重試最多等待的秒數. Defaults to 0.5.
+        cap (float, optional): 每次重試最多等待的秒數. Defaults to 30.0.
+        retry_on (Tuple[Type[BaseException], ...], optional): 需要重試的錯誤. Defaults to (ccxt.NetworkError,).
+        limiter (Optional[RateLimiter], optional): 被限流時暫停的 limiter.
+
+    Returns:
+        T: fn 的結果, 最後一次仍然失敗則拋出錯誤
+    """
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+
+            backoff = min(cap, base * 2 ** attempt)
+            if limiter is not None and isinstance(e, ccxt.DDoSProtection):
+                limiter.pause(backoff)
+            delay = random.uniform(0, backoff)
+            logger.warning(f"retry {attempt + 1}/{attempts - 1} in {delay:.2f}s, {type(e).__name__}, {e}")
+            await asyncio.sleep(delay)
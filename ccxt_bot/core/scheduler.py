@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from ccxt_bot.core.logger import logger
+
+
+_SCALES = {
+    's': 1000,
+    'm': 60 * 1000,
+    'h': 3600 * 1000,
+    'd': 86400 * 1000,
+    'w': 7 * 86400 * 1000,
+}
+# 1970-01-01 是星期四, 週k線從星期一 (1970-01-05) 開始
+_MONDAY_MS = 4 * 86400 * 1000
+
+
+def parse_timeframe(timeframe: str) -> Tuple[int, str]:
+    """將 ccxt 的週期字串 (ex. 15m, 4h, 1w, 1M, 1y) 拆成 (數量, 單位)"""
+    match = re.fullmatch(r'(\d+)([smhdwMy])', timeframe)
+    if match is None:
+        raise ValueError(f"invalid timeframe: {timeframe}")
+
+    return int(match.group(1)), match.group(2)
+
+
+def next_boundary(timeframe: str, now: int) -> int:
+    """next_boundary
+    計算 now 之後 下一根k線的開始時間 (UTC)
+
+    秒/分/時/日 以 epoch 對齊, 週 從星期一開始, 月/年 以日曆對齊 (每 amount 個月/年)
+
+    Args:
+        timeframe (str): 週期, ex. 4h
+        now (int): 目前時間(ms)
+
+    Returns:
+        int: 下一根k線的開始時間(ms)
+    """
+    amount, unit = parse_timeframe(timeframe)
+
+    if unit in ('s', 'm', 'h', 'd'):
+        tf_ms = amount * _SCALES[unit]
+        return (now // tf_ms + 1) * tf_ms
+
+    if unit == 'w':
+        tf_ms = amount * _SCALES[unit]
+        return ((now - _MONDAY_MS) // tf_ms + 1) * tf_ms + _MONDAY_MS
+
+    dt = datetime.fromtimestamp(now / 1000, tz=timezone.utc)
+    if unit == 'M':
+        months = ((dt.year * 12 + dt.month - 1) // amount + 1) * amount
+        year, month = divmod(months, 12)
+        start = datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    else:
+        start = datetime((dt.year // amount + 1) * amount, 1, 1, tzinfo=timezone.utc)
+
+    return int(start.timestamp() * 1000)
+
+
+class BarScheduler():
+    """BarScheduler
+
+    在每個週期的k線收盤時 (加上 settle 秒讓交易所完成收盤) 執行註冊的工作
+    以 heap 保存每個週期的下一次收盤時間, 只睡到最近的收盤時間 不需要輪詢,
+    同一時間收盤的所有工作同時執行, 工作執行的時間不會延遲下一次收盤
+
+    有提供 exchange 時, 以 fetch_time 修正本機與交易所的時間差
+    """
+    def __init__(self, exchange=None, settle: float = 1.0, resync: float = 3600.0):
+        """
+        Args:
+            exchange (ccxt_async.Exchange, optional): 用來校正時間的交易所.
+            settle (float, optional): 收盤後等待幾秒再執行. Defaults to 1.0.
+            resync (float, optional): 每隔幾秒重新校正時間. Defaults to 3600.0.
+        """
+        self._exchange = exchange
+        self._settle = settle
+        self._resync = resync
+        self._offset = 0
+        self._synced_at: Optional[float] = None
+        self._jobs: Dict[str, List[Callable[[], Any]]] = defaultdict(list)
+        self._heap: List[Tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        # event loop 只保留 task 的弱引用, 執行中的工作需要保留引用 避免被回收
+        self._tasks: Set[asyncio.Future] = set()
+
+    def now(self) -> int:
+        """以交易所時間為準的目前時間(ms)"""
+        return int(time.time() * 1000) + self._offset
+
+    def register(self, timeframe: str, job: Callable[[], Any]) -> None:
+        """register
+        註冊每根k線收盤時執行的工作, 回傳 awaitable 的工作會以 task 執行
+
+        Args:
+            timeframe (str): 週期, ex. 4h
+            job (Callable[[], Any]): 工作
+        """
+        if timeframe not in self._jobs:
+            heapq.heappush(self._heap, (next_boundary(timeframe, self.now()), next(self._seq), timeframe))
+            self._wakeup.set()
+        self._jobs[timeframe].append(job)
+        logger.info(f"register {timeframe} job ({sum(map(len, self._jobs.values()))} jobs)")
+
+    async def sync_clock(self) -> None:
+        """以交易所的時間修正時間差, 假設請求與回應的延遲相同"""
+        before = time.time() * 1000
+        server = await self._exchange.fetch_time()
+        after = time.time() * 1000
+        self._offset = int(server - (before + after) / 2)
+        self._synced_at = time.monotonic()
+        logger.info(f"clock offset {self._offset} ms (round trip {after - before:.0f} ms)")
+
+        # 以修正後的時間重新計算下一次收盤, 還在 settle 內的收盤不會被跳過
+        now = self.now() - int(self._settle * 1000)
+        self._heap = [(next_boundary(timeframe, now), next(self._seq), timeframe) for _, _, timeframe in self._heap]
+        heapq.heapify(self._heap)
+
+    async def run(self) -> None:
+        """執行直到被取消"""
+        while True:
+            if self._exchange is not None and (self._synced_at is None or time.monotonic() - self._synced_at > self._resync):
+                try:
+                    await self.sync_clock()
+                except Exception as e:
+                    logger.warning(f"sync clock failed, {type(e).__name__}, {e}")
+
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due = self._heap[0][0]
+            delay = (due - self.now()) / 1000 + self._settle
+            if delay > 0:
+                # 睡眠期間有新註冊的週期 可能更早收盤
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, self._resync))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            timeframes = []
+            while self._heap and self._heap[0][0] == due:
+                _, _, timeframe = heapq.heappop(self._heap)
+                timeframes.append(timeframe)
+                # 錯過的收盤 (ex. 系統休眠) 不會補執行
+                heapq.heappush(self._heap, (next_boundary(timeframe, self.now()), next(self._seq), timeframe))
+
+            self._dispatch(due, timeframes)
+
+    def _dispatch(self, due: int, timeframes: List[str]) -> None:
+        logger.debug(f"bar close at {due}: {timeframes}")
+        for timeframe in timeframes:
+            for job in self._jobs[timeframe]:
+                try:
+                    result = job()
+                    if inspect.isawaitable(result):
+                        task = asyncio.ensure_future(result)
+                        self._tasks.add(task)
+                        task.add_done_callback(self._done)
+                except Exception as e:
+                    logger.error(f"{timeframe} job {type(e).__name__}, {e.args}, {e}")
+
+    def _done(self, task: asyncio.Future) -> None:
+        self._tasks.discard(task)
+        _log_exception(task)
+
+
+def _log_exception(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        e = task.exception()
+        logger.error(f"job {type(e).__name__}, {e.args}, {e}")
@@ -1,25 +1,53 @@
 # -*- coding: utf-8 -*-
 
-import requests
-
-def notify_line(token: str, msg: str):
-    if not token: return
-    
-    # message you want to send
-    # tpe_date = datetime.now(tz=timezone(timedelta(hours=+8))).strftime("%Y/%m/%d")
-
-    # HTTP headers and message
-    headers = {"Authorization": f"Bearer {token}"}
-    data = { 'message': msg }
-
-    # Image want to sens
-    # image = open('my_image.jpg', 'rb')
-    # files = { 'imageFile': image }
-
-    # send line notify by Line API
-    requests.post(
-        "https://notify-api.line.me/api/notify",
-        headers = headers,
-        data = data,
-        # files = files
-    )
\ No newline at end of file
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache():
+    """TTLCache
+
+    保存有期限的值, 過期或被 invalidate 之後 get_or_fetch 會重新獲取
+    同一個 key 同時只會有一個獲取中的請求, 其他呼叫會等待同一個結果
+    """
+    def __init__(self, ttl: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            ttl (float): 預設的有效秒數
+            clock (Callable[[], float], optional): 時間來源. Defaults to time.monotonic.
+        """
+        self._ttl = ttl
+        self._clock = clock
+        self._values: Dict[Hashable, Tuple[float, Any]] = {}
+        self._generations: Dict[Hashable, int] = defaultdict(int)
+        self._locks: Dict[Hashable, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        expires, value = self._values.get(key, (0.0, default))
+        return value if expires > self._clock() else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._values[key] = (self._clock() + (self._ttl if ttl is None else ttl), value)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """清除 key 的值, 沒有指定 key 則清除全部"""
+        keys = set(self._values) | set(self._generations) if key is None else {key}
+        for k in keys:
+            self._values.pop(k, None)
+            # 獲取中的結果可能是 invalidate 之前的狀態, 不保存
+            self._generations[k] += 1
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        async with self._locks[key]:
+            expires, value = self._values.get(key, (0.0, None))
+            if expires > self._clock():
+                return value
+
+            generation = self._generations[key]
+            value = await fetch()
+            if generation == self._generations[key]:
+                self.set(key, value, ttl)
+
+            return value
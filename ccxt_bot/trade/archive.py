@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ccxt_bot.core.logger import logger
+
+
+KBAR_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+
+class CandleArchive():
+    """CandleArchive
+
+    將已收盤的k線 依 交易所/交易對/週期 存成只能附加的二進位檔 (numpy structured array)
+    讀取時使用 memory map, 回傳的陣列直接對應到檔案 不需要複製
+    寫入中斷留下的不完整紀錄 讀取時會被忽略, 下次附加前截掉
+
+    檔案位置: {root}/{exchange_id}/{symbol}/{timeframe}.bin, symbol 中的 / 與 : 會換成 _
+    """
+    def __init__(self, root: str):
+        self._root = root
+        self._last_ts: Dict[Tuple[str, str, str], Optional[int]] = {}
+
+    def path(self, exchange_id: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(
+            self._root,
+            exchange_id,
+            symbol.replace('/', '_').replace(':', '_'),
+            f"{timeframe}.bin",
+        )
+
+    def read(self, exchange_id: str, symbol: str, timeframe: str, start: Optional[int] = None, end: Optional[int] = None) -> np.ndarray:
+        """read
+        讀取 [start, end] 之間的k線
+
+        Args:
+            exchange_id (str): 交易所的id, ex. binance
+            symbol (str): 交易對, ex. ETH/USDT
+            timeframe (str): 週期, ex. 1h
+            start (Optional[int], optional): 開始時間(ms), 預設從頭開始.
+            end (Optional[int], optional): 結束時間(ms), 預設到最後.
+
+        Returns:
+            np.ndarray: KBAR_DTYPE 的唯讀陣列
+        """
+        path = self.path(exchange_id, symbol, timeframe)
+        if not os.path.exists(path) or os.path.getsize(path) < KBAR_DTYPE.itemsize:
+            return np.empty(0, dtype=KBAR_DTYPE)
+
+        # 只讀取完整的紀錄, 寫入中斷時檔案結尾可能有不完整的紀錄
+        count = os.path.getsize(path) // KBAR_DTYPE.itemsize
+        kbars = np.memmap(path, dtype=KBAR_DTYPE, mode='r', shape=(count,))
+        timestamps = kbars['timestamp']
+        lo = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+        hi = len(kbars) if end is None else np.searchsorted(timestamps, end, side='right')
+
+        return kbars[lo:hi]
+
+    def last_timestamp(self, exchange_id: str, symbol: str, timeframe: str) -> Optional[int]:
+        key = (exchange_id, symbol, timeframe)
+        if key not in self._last_ts:
+            kbars = self.read(exchange_id, symbol, timeframe)
+            self._last_ts[key] = int(kbars['timestamp'][-1]) if len(kbars) else None
+
+        return self._last_ts[key]
+
+    def append(self, exchange_id: str, symbol: str, timeframe: str, kbars: List[list]) -> int:
+        """append
+        附加已收盤的k線, 早於或等於最後一根的k線會被忽略
+
+        Returns:
+            int: 寫入的k線數量
+        """
+        last_ts = self.last_timestamp(exchange_id, symbol, timeframe)
+        kbars = sorted(
+            (kbar for kbar in kbars if last_ts is None or kbar[0] > last_ts),
+            key=lambda kbar: kbar[0],
+        )
+        if not kbars:
+            return 0
+
+        records = np.array([tuple(kbar[:6]) for kbar in kbars], dtype=KBAR_DTYPE)
+        path = self.path(exchange_id, symbol, timeframe)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as f:
+            size = f.tell()
+            if size % KBAR_DTYPE.itemsize:
+                logger.warning(f"truncate partial record at the end of {path}")
+                f.truncate(size - size % KBAR_DTYPE.itemsize)
+            f.write(records.tobytes())
+
+        self._last_ts[(exchange_id, symbol, timeframe)] = int(records['timestamp'][-1])
+
+        return len(records)
+
+    async def backfill(self, exchange, symbol: str, timeframe: str, since: Optional[int] = None, limit: int = 1000) -> int:
+        """backfill
+        從最後一根k線(或 since)開始 分頁下載歷史k線直到現在
+
+        Args:
+            exchange (ccxt_async.Exchange): 交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            timeframe (str): 週期, ex. 1h
+            since (Optional[int], optional): 檔案沒有資料時的開始時間(ms).
+            limit (int, optional): 每次請求的k線數量. Defaults to 1000.
+
+        Returns:
+            int: 寫入的k線數量
+        """
+        tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        last_ts = self.last_timestamp(exchange.id, symbol, timeframe)
+        if last_ts is not None:
+            since = last_ts + tf_ms
+        if since is None:
+            raise ValueError(f"no candles archived for {exchange.id} {symbol} {timeframe}, since is required")
+
+        total = 0
+        while since + tf_ms <= exchange.milliseconds():
+            kbars = await exchange.fetch_ohlcv(symbol=symbol, timeframe=timeframe, since=since, limit=limit)
+            # 只保存已收盤的k線
+            closed = [kbar for kbar in kbars if kbar[0] + tf_ms <= exchange.milliseconds()]
+            if not closed:
+                break
+
+            total += self.append(exchange.id, symbol, timeframe, closed)
+            since = closed[-1][0] + tf_ms
+            logger.info(f"backfill {exchange.id} {symbol} {timeframe}: {total} bars, until {pd.to_datetime(since, unit='ms')}")
+
+        return total
+
+
+def records_to_frame(kbars: np.ndarray) -> pd.DataFrame:
+    """將 CandleArchive.read 的結果轉成以時間為 index 的 DataFrame (會複製資料)"""
+    df = pd.DataFrame(kbars)
+    df['dt'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df.set_index('dt', inplace=True)
+
+    return df
+
+
+async def main():
+    import ccxt.async_support as ccxt_async
+
+    parser = argparse.ArgumentParser(description="下載歷史k線到本地的 CandleArchive")
+    parser.add_argument('symbol', help="ex. ETH/USDT")
+    parser.add_argument('timeframe', help="ex. 1h")
+    parser.add_argument('--exchange', default='binance')
+    parser.add_argument('--root', default='candles')
+    parser.add_argument('--since', default=None, help="檔案沒有資料時的開始日期, ex. 2021-01-01")
+    args = parser.parse_args()
+
+    exchange = getattr(ccxt_async, args.exchange)({'enableRateLimit': True})
+    since = int(pd.Timestamp(args.since, tz='UTC').timestamp() * 1000) if args.since else None
+
+    try:
+        total = await CandleArchive(args.root).backfill(exchange, args.symbol, args.timeframe, since=since)
+    finally:
+        await exchange.close()
+    logger.info(f"backfill done, {total} bars")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from ccxt_bot.trade.base import SignalBatch, Strategy, StrategyResult, Suggestion
+from ccxt_bot.trade.candle import Candles
+
+
+TRADE_COLUMNS = [
+    'entry_idx', 'exit_idx', 'side', 'qty',
+    'entry_price', 'exit_price', 'fee', 'borrow_cost', 'pnl', 'reason',
+]
+_INT_COLUMNS = ('entry_idx', 'exit_idx', 'side', 'reason')
+
+_YEAR_NS = 365 * 24 * 3600 * 10**9
+
+
+class BacktestReport(BaseModel):
+    """回測結果, 交易紀錄 與 權益曲線 皆為 numpy 陣列
+
+    trades 的 side 為 1(多) 或 -1(空), reason 為平倉原因的 Suggestion 值 (DoNothing 代表回測結束時仍持倉)
+    """
+    trades: Dict[str, np.ndarray]
+    equity: np.ndarray
+    drawdown: np.ndarray
+    total_return: float
+    max_drawdown: float
+    sharpe: float
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def summary(self) -> str:
+        pnl = self.trades['pnl']
+        win_rate = float((pnl > 0).mean()) if len(pnl) else 0.0
+
+        return (
+            f"trades: {len(pnl)}, win rate: {win_rate:.2%}, "
+            f"return: {self.total_return:.2%}, max drawdown: {self.max_drawdown:.2%}, sharpe: {self.sharpe:.2f}"
+        )
+
+
+class Backtester():
+    """Backtester
+
+    以策略結果模擬成交:
+        訊號在下一根k線的開盤價成交, 停損(stop_price) 與 停利(tp_price) 以k線的最高價/最低價判斷是否觸發
+        同一根k線同時觸發停損與停利時 視為停損
+        反向訊號會先平倉再開倉, 同方向的訊號則忽略
+        每次開倉使用當下權益的 percent_of_equity%, 進出場都收取 fee_rate 的手續費
+        做空時 每根k線收取借款金額 borrow_rate 的利息
+    """
+    def __init__(
+        self,
+        initial_capital: float = 10000.0,
+        percent_of_equity: float = 30,
+        fee_rate: float = 0.001,
+        borrow_rate: float = 0.0,
+        periods_per_year: Optional[float] = None,
+    ):
+        """
+        Args:
+            initial_capital (float, optional): 初始資金. Defaults to 10000.0.
+            percent_of_equity (float, optional): 每次開倉使用的權益百分比. Defaults to 30.
+            fee_rate (float, optional): 手續費率. Defaults to 0.001.
+            borrow_rate (float, optional): 做空借款 每根k線的利率. Defaults to 0.0.
+            periods_per_year (Optional[float], optional): 一年有幾根k線, 計算 sharpe 用, 預設由k線時間推算.
+        """
+        self._initial_capital = initial_capital
+        self._percent_of_equity = percent_of_equity
+        self._fee_rate = fee_rate
+        self._borrow_rate = borrow_rate
+        self._periods_per_year = periods_per_year
+
+    def run_strategy(self, strategy: Strategy, datas: Union[Candles, pd.DataFrame]) -> BacktestReport:
+        """執行策略的 signals (沒有則執行 backtest) 並模擬成交"""
+        signals = strategy.signals(datas) if hasattr(strategy, 'signals') else strategy.backtest(datas)
+        return self.run(datas, signals)
+
+    def run(self, datas: Union[Candles, pd.DataFrame], results: Union[SignalBatch, List[StrategyResult]]) -> BacktestReport:
+        """run
+
+        Args:
+            datas (Union[Candles, pd.DataFrame]): 包含 open high low close 的k線資料
+            results (Union[SignalBatch, List[StrategyResult]]): 策略結果, date 為產生訊號的k線時間
+
+        Returns:
+            BacktestReport: 回測結果
+        """
+        opens = np.asarray(datas['open'], dtype=float)
+        highs = np.asarray(datas['high'], dtype=float)
+        lows = np.asarray(datas['low'], dtype=float)
+        closes = np.asarray(datas['close'], dtype=float)
+        n = len(datas)
+
+        if not isinstance(results, SignalBatch):
+            results = SignalBatch.from_results(results)
+        # 沒有時間(NaT) 的訊號 位置為 -1
+        keep = results.codes != Suggestion.DoNothing.value
+        signal_idxs = datas.index.get_indexer(results.dates[keep])
+        signals = zip(
+            results.codes[keep].tolist(), signal_idxs.tolist(),
+            results.stop_prices[keep].tolist(), results.tp_prices[keep].tolist(),
+        )
+
+        self._trades = {col: [] for col in TRADE_COLUMNS}
+        self._cash = self._initial_capital
+        pos = None
+
+        for code, i, stop, tp in signals:
+            # 在下一根k線的開盤成交
+            j = i + 1
+            if i < 0 or j >= n:
+                continue
+
+            pos = self._check_exit(pos, opens, highs, lows, j)
+            price = opens[j]
+            suggestion = Suggestion(code)
+
+            if suggestion in (Suggestion.Long, Suggestion.Short):
+                side = 1 if suggestion == Suggestion.Long else -1
+                if pos is not None and pos['side'] == side:
+                    continue
+                if pos is not None:
+                    self._close(pos, j, price, suggestion)
+                pos = self._open(side, j, price, stop, tp)
+            elif pos is not None and (
+                (pos['side'] == 1 and suggestion in (Suggestion.Long_SL, Suggestion.Long_TP)) or
+                (pos['side'] == -1 and suggestion in (Suggestion.Short_SL, Suggestion.Short_TP))
+            ):
+                self._close(pos, j, price, suggestion)
+                pos = None
+
+        pos = self._check_exit(pos, opens, highs, lows, n)
+        if pos is not None:
+            # 回測結束時仍持倉 以最後的收盤價計算
+            self._close(pos, n - 1, closes[-1], Suggestion.DoNothing)
+
+        trades = {
+            col: np.asarray(values, dtype=np.int64 if col in _INT_COLUMNS else float)
+            for col, values in self._trades.items()
+        }
+        equity = self._equity_curve(trades, closes)
+        drawdown = equity / np.maximum.accumulate(equity) - 1
+
+        return BacktestReport(
+            trades=trades,
+            equity=equity,
+            drawdown=drawdown,
+            total_return=float(equity[-1] / self._initial_capital - 1) if n else 0.0,
+            max_drawdown=float(drawdown.min()) if n else 0.0,
+            sharpe=self._sharpe(equity, datas.index),
+        )
+
+    def _open(self, side: int, idx: int, price: float, stop: float, tp: float) -> dict:
+        qty = self._cash * self._percent_of_equity / 100 / price
+
+        return {
+            'side': side,
+            'qty': qty,
+            'entry_idx': idx,
+            'entry_price': price,
+            'stop': stop,
+            'tp': tp,
+            # 從哪一根k線開始檢查停損停利
+            'check_from': idx,
+        }
+
+    def _close(self, pos: dict, idx: int, price: float, reason: Suggestion) -> None:
+        side, qty, entry_price = pos['side'], pos['qty'], pos['entry_price']
+        fee = (entry_price + price) * qty * self._fee_rate
+        borrow_cost = entry_price * qty * self._borrow_rate * max(idx - pos['entry_idx'], 1) if side < 0 else 0.0
+        pnl = side * qty * (price - entry_price) - fee - borrow_cost
+        self._cash += pnl
+
+        for col, value in zip(TRADE_COLUMNS, (
+            pos['entry_idx'], idx, side, qty, entry_price, price, fee, borrow_cost, pnl, reason.value,
+        )):
+            self._trades[col].append(value)
+
+    def _check_exit(self, pos: Optional[dict], opens, highs, lows, end: int) -> Optional[dict]:
+        """檢查 [check_from, end) 之間是否觸發停損或停利, 觸發則平倉並回傳 None"""
+        if pos is None:
+            return None
+
+        start = pos['check_from']
+        pos['check_from'] = end
+        if start >= end:
+            return pos
+
+        long = pos['side'] == 1
+        stop, tp = pos['stop'], pos['tp']
+        stop_hit = (lows[start:end] <= stop) if long else (highs[start:end] >= stop)
+        tp_hit = (highs[start:end] >= tp) if long else (lows[start:end] <= tp)
+        hit = np.flatnonzero(stop_hit | tp_hit)
+        if not len(hit):
+            return pos
+
+        idx = start + hit[0]
+        # 開盤跳空超過停損/停利價 則以開盤價成交
+        if stop_hit[hit[0]]:
+            price = min(opens[idx], stop) if long else max(opens[idx], stop)
+            reason = Suggestion.Long_SL if long else Suggestion.Short_SL
+        else:
+            price = max(opens[idx], tp) if long else min(opens[idx], tp)
+            reason = Suggestion.Long_TP if long else Suggestion.Short_TP
+
+        self._close(pos, idx, price, reason)
+
+        return None
+
+    def _equity_curve(self, trades: Dict[str, np.ndarray], closes: np.ndarray) -> np.ndarray:
+        n = len(closes)
+        realized = np.zeros(n)
+        np.add.at(realized, trades['exit_idx'], trades['pnl'])
+        equity = self._initial_capital + np.cumsum(realized)
+
+        # 持倉期間加上未實現損益
+        for entry_idx, exit_idx, side, qty, price in zip(
+            trades['entry_idx'], trades['exit_idx'], trades['side'], trades['qty'], trades['entry_price']
+        ):
+            held = np.arange(1, exit_idx - entry_idx + 1)
+            borrow = price * qty * self._borrow_rate * held if side < 0 else 0.0
+            equity[entry_idx:exit_idx] += side * qty * (closes[entry_idx:exit_idx] - price) - price * qty * self._fee_rate - borrow
+
+        return equity
+
+    def _sharpe(self, equity: np.ndarray, index: pd.Index) -> float:
+        if len(equity) < 2:
+            return 0.0
+
+        returns = np.diff(equity) / equity[:-1]
+        std = returns.std()
+        if not std:
+            return 0.0
+
+        periods_per_year = self._periods_per_year
+        if periods_per_year is None:
+            periods_per_year = _YEAR_NS / np.median(np.diff(index.asi8))
+
+        return float(returns.mean() / std * np.sqrt(periods_per_year))
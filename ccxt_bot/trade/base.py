@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from typing import Protocol, Optional, List
+from datetime import datetime
+from typing import Callable, Protocol, Optional, List, Sequence
 from enum import Enum, auto
+
+import numpy as np
+import pandas as pd
 from pydantic import BaseModel
 
 class Suggestion(Enum):
@@ -19,9 +23,114 @@ class StrategyResult(BaseModel):
     name: str
     suggestion: Optional[Suggestion] = Suggestion.DoNothing
     msg: Optional[str] = ""
+    date: Optional[datetime] = None # 產生訊號的k線時間
     stop_price: Optional[float] = None
     tp_price: Optional[float] = None
 
+def match_transition(codes: Sequence[int], before: int, after: int, length: int = 2) -> np.ndarray:
+    """match_transition
+    找出連續 length 根 before 之後 接著連續 length 根 after 的位置 (ex. 紅紅綠綠)
+
+    Args:
+        codes (Sequence[int]): 每根k線的狀態編碼, ex. ImpulseColor
+        before (int): 前段的狀態
+        after (int): 後段的狀態
+        length (int, optional): 每段的k線數量. Defaults to 2.
+
+    Returns:
+        np.ndarray: bool 陣列, 第 i 個為 True 代表 pattern 在第 i 根k線結束
+    """
+    codes = np.asarray(codes)
+    # IntEnum 轉成 int, numpy 比較 Python 物件較慢
+    before, after = int(before), int(after)
+    n = len(codes)
+    matched = np.zeros(n, dtype=bool)
+    if n < 2 * length:
+        return matched
+
+    # pattern 在第 i 根結束: codes[i-2*length+1 : i-length+1] 都是 before, codes[i-length+1 : i+1] 都是 after
+    m = n - 2*length + 1
+    tail = matched[2*length-1:]
+    tail[:] = True
+    for k in range(length):
+        tail &= codes[k:k+m] == before
+        tail &= codes[length+k:length+k+m] == after
+
+    return matched
+
+class SignalBatch():
+    """SignalBatch
+
+    一個策略在多根k線的訊號, 每個欄位是一個 numpy 陣列, 回測時不需要為每個訊號建立 StrategyResult
+    沒有停損/停利價以 NaN 表示, 訊息只在 message / to_results 時才產生
+
+    ex.
+        batch = strategy.signals(datas)
+        report = Backtester().run(datas, batch)
+        results = batch.to_results() # 發送通知 與 下單時使用
+    """
+    __slots__ = ('name', 'codes', 'dates', 'stop_prices', 'tp_prices', '_message')
+
+    def __init__(
+        self,
+        name: str,
+        codes: Sequence[int],
+        dates: Sequence[datetime],
+        stop_prices: Optional[Sequence[float]] = None,
+        tp_prices: Optional[Sequence[float]] = None,
+        message: Optional[Callable[[int], str]] = None,
+    ):
+        """
+        Args:
+            name (str): 策略名稱
+            codes (Sequence[int]): 每個訊號的 Suggestion 值
+            dates (Sequence[datetime]): 產生訊號的k線時間
+            stop_prices (Optional[Sequence[float]], optional): 停損價. Defaults to NaN.
+            tp_prices (Optional[Sequence[float]], optional): 停利價. Defaults to NaN.
+            message (Optional[Callable[[int], str]], optional): 以訊號的位置產生訊息. Defaults to 空字串.
+        """
+        n = len(codes)
+        self.name = name
+        self.codes = np.asarray(codes, dtype=np.int8)
+        self.dates = pd.DatetimeIndex(dates)
+        self.stop_prices = np.full(n, np.nan) if stop_prices is None else np.asarray(stop_prices, dtype=float)
+        self.tp_prices = np.full(n, np.nan) if tp_prices is None else np.asarray(tp_prices, dtype=float)
+        self._message = message
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def message(self, i: int) -> str:
+        return self._message(i) if self._message is not None else ""
+
+    def to_results(self) -> List[StrategyResult]:
+        """轉換成 StrategyResult, 並產生每個訊號的訊息"""
+        return [
+            StrategyResult(
+                name=self.name,
+                suggestion=Suggestion(code),
+                msg=self.message(i),
+                date=None if date is pd.NaT else date,
+                stop_price=None if np.isnan(stop) else stop,
+                tp_price=None if np.isnan(tp) else tp,
+            )
+            for i, (code, date, stop, tp) in enumerate(zip(
+                self.codes.tolist(), self.dates, self.stop_prices.tolist(), self.tp_prices.tolist()
+            ))
+        ]
+
+    @classmethod
+    def from_results(cls, results: List[StrategyResult]) -> 'SignalBatch':
+        """由 StrategyResult 建立, 沒有 date 的訊號時間為 NaT"""
+        return cls(
+            name=results[0].name if results else '',
+            codes=[(r.suggestion or Suggestion.DoNothing).value for r in results],
+            dates=[r.date for r in results],
+            stop_prices=[np.nan if r.stop_price is None else r.stop_price for r in results],
+            tp_prices=[np.nan if r.tp_price is None else r.tp_price for r in results],
+            message=lambda i: results[i].msg,
+        )
+
 class Strategy(Protocol):
     def run(self, datas) -> StrategyResult:
         ...
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from ccxt_bot.core.logger import logger
+
+
+_DONE = ('closed', 'canceled', 'cancelled', 'expired', 'rejected')
+_FILLED_HISTORY = 1000 # 保留最近幾筆已結束訂單的成交量, 避免重複的事件被計算兩次
+
+
+def cancel_targets(orders: Iterable[dict], symbol: str, side: str) -> List[str]:
+    """cancel_targets
+    找出需要取消的委託單, OCO 的兩張委託只需要取消其中一張
+
+    Args:
+        orders (Iterable[dict]): ccxt 格式的委託單
+        symbol (str): 交易對, ex. ETH/USDT
+        side (str): buy or sell
+
+    Returns:
+        List[str]: 委託單id
+    """
+    order_ids = {}
+    for order in orders:
+        if order['symbol'] == symbol and order['side'] == side.lower():
+            list_id = _list_id(order)
+            order_ids.setdefault(order['id'] if list_id is None else ('list', list_id), order['id'])
+
+    return list(order_ids.values())
+
+
+def _list_id(order: dict) -> Optional[str]:
+    """OCO 的 orderListId (REST 為 orderListId, user data stream 為 g), 不是 OCO 則為 None"""
+    info = order.get('info') or {}
+    list_id = info.get('orderListId', info.get('g', -1))
+    return None if list_id in (-1, '-1', None) else str(list_id)
+
+
+class AccountBook():
+    """AccountBook
+
+    在本機保存一個交易對的委託單與持倉, 不需要每次平倉都向交易所請求委託單
+        1. 以 watch_orders (user data stream) 的訂單更新與自己下單的回應 更新委託單與成交量
+        2. 每隔 reconcile 秒以 fetch_open_orders 與 fetch_balance 校正, 並記錄與本機的差異
+
+    持倉 = 基礎貨幣的 total - debt, 以訂單累計成交量的增量更新, 同一筆更新重複收到也只計算一次
+    """
+    def __init__(self, exchange, symbol: str, reconcile: float = 300.0, dust: Optional[float] = None):
+        """
+        Args:
+            exchange (ccxt_pro.Exchange): 支援 watch_orders 的交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            reconcile (float, optional): 每隔幾秒與交易所校正. Defaults to 300.0.
+            dust (Optional[float], optional): 小於此數量的持倉視為沒有持倉, 預設為交易所的最小下單數量.
+        """
+        self._exchange = exchange
+        self._symbol = symbol
+        self._reconcile = reconcile
+        self._dust = dust
+        self._orders: Dict[str, dict] = {}
+        self._filled: Dict[str, float] = {}
+        self._position = 0.0
+        self._synced = False
+
+    @property
+    def synced(self) -> bool:
+        """是否已經與交易所校正過, 校正之前本機的資料不完整"""
+        return self._synced
+
+    @property
+    def position(self) -> float:
+        """持倉數量, 做空為負數"""
+        return self._position
+
+    @property
+    def direction(self) -> int:
+        """持倉方向 1: 多單, -1: 空單, 0: 沒有持倉"""
+        if self._dust is None:
+            market = (getattr(self._exchange, 'markets', None) or {}).get(self._symbol, {})
+            self._dust = ((market.get('limits') or {}).get('amount') or {}).get('min') or 0.0
+
+        if self._position > self._dust:
+            return 1
+        if self._position < -self._dust:
+            return -1
+        return 0
+
+    def open_orders(self, side: Optional[str] = None) -> List[dict]:
+        """委託中的訂單
+
+        Args:
+            side (Optional[str], optional): buy or sell, 預設為全部.
+        """
+        return [order for order in self._orders.values() if side is None or order['side'] == side.lower()]
+
+    def cancel_targets(self, side: str) -> List[str]:
+        """本機的委託單中 需要取消的委託單id, 參考 cancel_targets"""
+        return cancel_targets(self._orders.values(), self._symbol, side)
+
+    def apply(self, order: dict) -> None:
+        """apply
+        以訂單的更新 (watch_orders 或下單的回應) 更新委託單與持倉
+
+        Args:
+            order (dict): ccxt 格式的訂單
+        """
+        if order.get('symbol') != self._symbol or order.get('id') is None:
+            return
+
+        order_id = str(order['id'])
+        filled = order.get('filled') or 0.0
+        delta = filled - self._filled.get(order_id, 0.0)
+        if delta > 0:
+            self._position += delta if order['side'] == 'buy' else -delta
+            self._filled[order_id] = filled
+            if len(self._filled) > _FILLED_HISTORY:
+                oldest = next((k for k in self._filled if k not in self._orders), None)
+                if oldest is not None: del self._filled[oldest]
+
+        if order.get('status') in _DONE:
+            self._orders.pop(order_id, None)
+        else:
+            self._orders[order_id] = order
+
+    def remove(self, order_id: str) -> None:
+        """移除已取消的委託, 同一個 OCO 的委託一起移除"""
+        order = self._orders.pop(str(order_id), None)
+        if order is None:
+            return
+
+        list_id = _list_id(order)
+        if list_id is not None:
+            for other_id, other in list(self._orders.items()):
+                if _list_id(other) == list_id:
+                    del self._orders[other_id]
+
+    async def reconcile(self) -> None:
+        """以交易所的委託單與餘額校正本機的資料"""
+        open_orders, balance = await asyncio.gather(
+            self._exchange.fetch_open_orders(symbol=self._symbol, params={'type':'margin'}),
+            self._exchange.fetch_balance(params={'type':'margin', 'isIsolated': 'TRUE'}),
+        )
+
+        base = self._symbol.split('/')[0]
+        position = balance[base]['total'] - (balance[base].get('debt') or 0.0)
+        orders = {str(order['id']): order for order in open_orders}
+
+        if self._synced and (set(orders) != set(self._orders) or abs(position - self._position) > 1e-12):
+            logger.warning(
+                f"{self._symbol} book drift: position {self._position} -> {position}, "
+                f"orders {sorted(self._orders)} -> {sorted(orders)}"
+            )
+
+        self._orders = orders
+        self._position = position
+        for order_id, order in orders.items():
+            self._filled[order_id] = order.get('filled') or 0.0
+        self._synced = True
+
+    async def run(self) -> None:
+        """訂閱訂單更新 並定期校正, 執行直到被取消"""
+        async def reconcile_forever():
+            while True:
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    logger.warning(f"{self._symbol} reconcile failed, {type(e).__name__}, {e}")
+                await asyncio.sleep(self._reconcile)
+
+        reconciler = asyncio.get_running_loop().create_task(reconcile_forever())
+        try:
+            while True:
+                try:
+                    for order in await self._exchange.watch_orders(self._symbol):
+                        self.apply(order)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # 斷線期間的更新會在下一次校正時補上
+                    logger.warning(f"{self._symbol} watch orders {type(e).__name__}, {e}")
+                    self._synced = False
+                    await asyncio.sleep(1)
+                    try:
+                        await self.reconcile()
+                    except Exception as e:
+                        logger.warning(f"{self._symbol} reconcile failed, {type(e).__name__}, {e}")
+        finally:
+            reconciler.cancel()
@@ -1,36 +1,29 @@
 # -*- coding: utf-8 -*-
 
-from typing import List, Union
-import ccxt
+from typing import List, Optional, Union
 import asyncio
+import contextlib
 import pandas as pd
 import pandas_ta as ta
 import numpy as np
-from schedule import Scheduler
 
-from ccxt_bot.trade.base import Strategy, StrategyResult, Suggestion
+from ccxt_bot.trade.base import SignalBatch, Strategy, StrategyResult, Suggestion
 from ccxt_bot.core import config
-from ccxt_bot.core.utils import notify_line
+from ccxt_bot.core.ratelimit import retry
+from ccxt_bot.core.scheduler import BarScheduler
+from ccxt_bot.core.metrics import tracer
+from ccxt_bot.core.notifier import Notifier, notifier
 from ccxt_bot.core.logger import logger
 from ccxt_bot.trade.trader import Trader
+from ccxt_bot.trade.backtest import Backtester
+from ccxt_bot.trade.book import AccountBook
+from ccxt_bot.trade.candle import Candles
+from ccxt_bot.trade.exchange import ExchangePool, exchange_pool
+from ccxt_bot.trade.market import MarketDataHub, market_hub
+from ccxt_bot.trade.stream import KlineStream
+from ccxt_bot.trade.indicator import IndicatorParams, generate_indicator, calc_smma, calc_zlema
 
 
-# help functions
-def calc_smma(src: pd.DataFrame, length: int):
-    smma = ta.sma(src, length)
-
-    for i in range(length, len(src)):
-        smma[i] = (smma[i-1] * (length - 1) + src[i])/length
-        
-    return smma
-
-def calc_zlema(src, length):
-    ema1 = ta.ema(src, length)
-    ema2 = ta.ema(ema1, length)
-    d = ema1 - ema2
-
-    return ema1 + d
-
 class Ccxt_bot():
     def __init__(
         self, 
@@ -42,6 +35,14 @@ class Ccxt_bot():
         line_token: str,
         backtest: bool = False,
         sandbox: bool = False,
+        hub: MarketDataHub = market_hub,
+        indicator_params: IndicatorParams = IndicatorParams(),
+        pool: ExchangePool = exchange_pool,
+        percent_of_equity: float = 30,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        book: Optional[AccountBook] = None,
+        notifier: Notifier = notifier,
+        position_sync: bool = True,
     ):
         """Ccxt_bot
         這是一個執行 已註冊策略 進行自動操作 與 通知 的加密貨幣機器人 
@@ -55,23 +56,41 @@ class Ccxt_bot():
             line_token (str): 發送訊息到line的line token
             backtest (bool, optional): 回測功能. Defaults to False.
             sandbox (bool, optional): 下單功能，如果開啟 則不會真實下單 僅顯示log. Defaults to False.
+            hub (MarketDataHub, optional): k線與指標, 預設所有 bot 共用同一個.
+            indicator_params (IndicatorParams, optional): 指標參數.
+            pool (ExchangePool, optional): 交易所 client, 預設相同帳號的 bot 共用同一個.
+            percent_of_equity (float, optional): 每次開倉使用的權益百分比. Defaults to 30.
+            semaphore (Optional[asyncio.Semaphore], optional): 與其他 bot 共用 限制同時執行的數量.
+            book (Optional[AccountBook], optional): 交易所的委託單與持倉, 平倉時使用 並修正策略的持倉.
+            notifier (Notifier, optional): 在背景發送通知, 預設所有 bot 共用同一個.
+            position_sync (bool, optional): 以 book 的持倉修正策略的持倉, 同一個交易對有多個策略下單時 book 的持倉不屬於任何一個策略 需要關閉. Defaults to True.
         """
-        exchange_class = getattr(ccxt, exchange_id)
-        self._exchange: ccxt.binance = exchange_class({
-            'apiKey': api_key,
-            'secret': secret,
-            # 'options': {
+        self._exchange = pool.get(
+            exchange_id,
+            api_key=api_key,
+            secret=secret,
+            # options={
             #     'defaultType': 'margin', # 槓桿
             #     'createMarketBuyOrderRequiresPrice': False
             # }
-        })
+        )
         self._symbol = symbol
         self._timeframe = timeframe
         self._line_token = line_token
+        self._notifier = notifier
         self._strategies = []
         self._backtest = backtest
         self._sandbox = sandbox
-        self._trader = Trader(exchange=self._exchange, symbol=symbol, sandbox=sandbox)
+        self._hub = hub
+        self._limiter = pool.limiter(exchange_id, self._exchange)
+        self._indicator_params = indicator_params
+        self._hub.subscribe(self._exchange, symbol, timeframe, indicator_params)
+        self._book = book
+        self._position_sync = position_sync
+        self._trader = Trader(exchange=self._exchange, symbol=symbol, sandbox=sandbox, book=book)
+        self._percent_of_equity = percent_of_equity
+        self._semaphore = semaphore or contextlib.nullcontext()
+        self._task: Optional[asyncio.Task] = None
         
     def register_strategy(self, strategy: Strategy) -> List[Strategy]:
         """register_strategy
@@ -97,63 +116,9 @@ class Ccxt_bot():
         Returns:
             pd.DataFrame: k線資料並包含計算後的indicator
         """
-        data['rsi']  = data.ta.rsi(lenght=10)
-        data['ema'] = ta.ema(data['close'], length=21)
-        # df.ta.kdj 是 pandas_ta 庫中計算 KDJ 指標的函數。該函數會在 DataFrame 對象中添加三列新的數據列，分別是 K 值、D 值和 J 值。函數的返回值是修改後的 DataFrame 對象。
-
-        # 以下是 df.ta.kdj 函數的參數和返回值的簡要說明：
-
-        # 參數：
+        return generate_indicator(data, self._indicator_params)
 
-        # high：指定 High 值的列名或位置，用於計算 KDJ 指標
-        # low：指定 Low 值的列名或位置，用於計算 KDJ 指標
-        # close：指定 Close 值的列名或位置，用於計算 KDJ 指標
-        # window：指定 KDJ 指標的窗口大小，即計算 K 值、D 值和 J 值的周期數量
-        # fillna：如果存在缺失值，指定是否填充，默認為 True
-        # append：指定是否將計算結果添加到原始 DataFrame 對象中，默認為 True
-        # 返回值：
-
-        # 修改後的 DataFrame 對象，其中新增三列數據：K 值、D 值和 J 值。
-        data[['kdj_k', 'kdj_d', 'kdj_j']]  = ta.kdj(high=data['high'], low=data['low'], close=data['close'], window=9, fillna=True, append=False)
-        # df.ta.macd 是 pandas_ta 庫中計算 MACD 指標的函數。該函數會在 DataFrame 對象中添加三列新的數據列，分別是 MACD、MACD 信號線和 MACD 柱狀圖。函數的返回值是修改後的 DataFrame 對象。
-
-        # 以下是 df.ta.macd 函數的參數和返回值的簡要說明：
-
-        # 參數：
-
-        # close：指定 Close 值的列名或位置，用於計算 MACD 指標
-        # fast：指定快速移動平均線的周期數
-        # slow：指定慢速移動平均線的周期數
-        # signal：指定 MACD 信號線的周期數
-        # fillna：如果存在缺失值，指定是否填充，默認為 True
-        # append：指定是否將計算結果添加到原始 DataFrame 對象中，默認為 True
-        # 返回值：
-
-        # 修改後的 DataFrame 對象，其中新增三列數據：MACD、MACD 信號線和 MACD 柱狀圖。
-        data[['macd', 'macd_signal', 'macd_hist']] = ta.macd(close=data['close'], fast=12, slow=26, signal=9, fillna=True, append=False)
-        
-        data['kdj_j_diff'] = data['kdj_j'] - 50 - data['macd']
-        data['kdj_j_diff_prev'] = data['kdj_j_diff'].shift(1)
-        
-        lengthMA = 34
-        lengthSignal = 9
-        src = data[['high', 'low', 'close']].mean(axis=1)
-        data['hi'] = calc_smma(data['high'], lengthMA)
-        data['lo'] = calc_smma(data['low'], lengthMA)
-        data['mi'] = calc_zlema(src, lengthMA)
-        
-        data['md'] = np.where(data['mi'] > data['hi'], data['mi'] - data['hi'], np.where(data['mi'] < data['lo'], data['mi'] - data['lo'], 0))
-        data['sb'] = ta.sma(data['md'], lengthSignal)
-        data['sh'] = data['md'] - data['sb']
-        data['mdc'] = np.where(src > data['mi'], np.where(src > data['hi'], 'lime', 'green'), np.where(src < data['lo'], 'red', 'orange'))
-        data['atr'] = ta.atr(data['high'], data['low'], data['close'], length=14, mamode="rma")
-        
-        # logger.info(f"data['atr']:{data['atr']}")
-        # logger.info(f"data['close']:{data['close']}")
-        
-        return data
-
-    def fetch_datas(self, limit: int=200) -> pd.DataFrame:
+    async def fetch_datas(self, limit: int=200) -> Candles:
         """fetch_datas
         獲取股票k線資料
 
@@ -161,36 +126,31 @@ class Ccxt_bot():
             limit (int, optional): 最後輸出的資料. Defaults to 200.
 
         Raises:
-            e: _description_
+            e: 重試後仍然失敗的錯誤
 
         Returns:
-            pd.DataFrame: 輸出股票資料
+            Candles: 輸出股票資料, 欄位為唯讀的 numpy 陣列 (需要 DataFrame 時使用 to_pandas())
         """
-        while True:
-            try:
-                kbars = self._exchange.fetch_ohlcv(
+        try:
+            # 網路錯誤以指數退避重試, 被限流時暫停同一個交易所的所有請求
+            df = await retry(
+                lambda: self._hub.get(
+                    exchange=self._exchange,
                     symbol=self._symbol,
                     timeframe=self._timeframe,
-                    limit=300
-                )
-                break
-            except ccxt.base.errors.RequestTimeout as e:
-                logger.warning(f"retry {type(e).__name__}, {e.args}, {e}")
-                pass
+                    params=self._indicator_params,
+                ),
+                limiter=self._limiter,
+            )
+        except Exception as e:
+            logger.error(f"{type(e).__name__}, {e.args}, {e}")
+            raise e
             
-            except Exception as e:
-                logger.error(f"{type(e).__name__}, {e.args}, {e}")
-                raise e
-            
-        df = pd.DataFrame(kbars[:], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['dt'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('dt', inplace=True)
-        df = self.generate_indicator(df).tail(limit)
-        
-        return df
+        # 與其他訂閱相同k線的 bot 共用, 不可修改
+        return df.tail(limit)
     
     def notify_line(self, result: StrategyResult) -> None:
-        """發送策略判斷的結果到Line
+        """發送策略判斷的結果到Line, 只放進 Notifier 的 queue 不會等待發送
 
         Args:
             result (StrategyResult): _description_
@@ -206,72 +166,144 @@ class Ccxt_bot():
             
             {result.msg}
             '''
-            notify_line(token=self._line_token, msg=msg)
+            with tracer.span('notify'):
+                self._notifier.notify(token=self._line_token, msg=msg)
+        
+    def position_direction(self) -> Optional[int]:
+        """book 的持倉方向, 沒有 book, 關閉 position_sync 或尚未與交易所校正時為 None"""
+        if self._book is None or not self._position_sync or not self._book.synced:
+            return None
+
+        return self._book.direction
+
+    def sync_positions(self) -> None:
+        """以 book 的持倉方向修正策略的持倉, 參考 position_direction"""
+        direction = self.position_direction()
+        if direction is None:
+            return
         
-    def do_strategies(self, skip_order: bool = False) -> None:
+        sync_positions(self._strategies, direction)
+        
+    def evaluate(self, df: Union[Candles, pd.DataFrame]) -> List[StrategyResult]:
+        """evaluate
+        以k線資料執行已註冊的策略 (只有計算 不會發送通知與建立訂單)
+
+        Args:
+            df (Union[Candles, pd.DataFrame]): k線資料並包含計算後的indicator
+
+        Returns:
+            List[StrategyResult]: 所有策略的結果
+        """
+        return evaluate_strategies(
+            self._strategies,
+            df,
+            backtest=self._backtest,
+            percent_of_equity=self._percent_of_equity,
+            label=f"{self._symbol} {self._timeframe}",
+        )
+
+    async def execute(self, results: List[StrategyResult], skip_order: bool = False) -> None:
+        """execute
+        發送策略結果的通知 並建立訂單
+
+        Args:
+            results (List[StrategyResult]): 策略結果
+            skip_order (bool, optional): 不建立訂單. Defaults to False.
+        """
+        for result in results:
+            self.notify_line(result)
+            # create order by strategy result
+            if not skip_order: await self._trader.create_order(result, percent_of_equity=self._percent_of_equity)
+
+    async def do_strategies(self, skip_order: bool = False) -> None:
         """do_strategies        
         執行已註冊的策略
         """
-        df = self.fetch_datas()
-        # 有註冊的策略將會把資料輸入執行 並執行發送通知與建立訂單
-        for stgy in self._strategies:
-            if self._backtest:
-                results = stgy.backtest(df)
-                for result in results:
-                    self.notify_line(result)
-                    if not skip_order: self._trader.create_order(result, percent_of_equity=30)
-            else:    
-                results = stgy.run(df)
-                for result in results:
-                    self.notify_line(result)
-                    # create order by strategy result
-                    if not skip_order: self._trader.create_order(result, percent_of_equity=30)
-    
+        # 限制同時執行的 bot 數量
+        async with self._semaphore:
+            with tracer.trace('tick', symbol=self._symbol, timeframe=self._timeframe):
+                with tracer.span('fetch'):
+                    df = await self.fetch_datas()
+                self.sync_positions()
+                # 有註冊的策略將會把資料輸入執行 並執行發送通知與建立訂單
+                await self.execute(self.evaluate(df), skip_order=skip_order)
                 
-           
-    def join_schedule(self, scheduler: Scheduler) -> None:
+    def _tick(self) -> None:
+        """在 event loop 上建立 do_strategies 的 task, 同一時間到期的 bot 會同時執行 不會互相等待"""
+        if self._task is not None and not self._task.done():
+            logger.warning(f"skip {self._symbol} {self._timeframe}, previous tick is still running")
+            return
+
+        self._task = asyncio.get_running_loop().create_task(self.do_strategies())
+        self._task.add_done_callback(self._log_exception)
+
+    def _log_exception(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            logger.error(f"{self._symbol} {self._timeframe} {type(e).__name__}, {e.args}, {e}")
+
+    async def join_schedule(self, scheduler: BarScheduler) -> None:
         """ run_forever
         
         依照每經過timeframe間隔 就獲取最新資料並執行註冊的策略
         第一次進入會無條件先執行一次, 但不會交易訂單
         """
         # Execute once when just entering, but will not execute the order
-        self.do_strategies(skip_order=False)
+        await self.do_strategies(skip_order=False)
         
-        amount = int(self._timeframe[0:-1])
-        unit = self._timeframe[-1]
-        job = self.do_strategies
-        if 'y' == unit:
-            scale = 365
-            scheduler.every(interval=scale*amount).days.at("00:00").do(job)
-        elif 'M' == unit:
-            scale = 30
-            scheduler.every(interval=scale*amount).days.at("00:00").do(job)
-        elif 'w' == unit:
-            scale = 7
-            scheduler.every(interval=scale*amount).days.at("00:00").do(job)
-        elif 'd' == unit:
-            scale = 1
-            scheduler.every(interval=scale*amount).days.at("00:00").do(job)
-        elif 'h' == unit:
-            for scale in range(24 // amount):
-                hour = scale*amount    
-                scheduler.every(interval=1).days.at(f"{hour:02}:00:01").do(job)
-                scale += 1
-        elif 'm' == unit:
-            scale = 1
-            scheduler.every(interval=scale*amount).minutes.at(":00").do(job)
-        elif 's' == unit:
-            scale = 1
-            scheduler.every(interval=scale*amount).second.do(job)
+        scheduler.register(self._timeframe, self._tick)
         
-        for s in scheduler.get_jobs():
-            logger.info(f"{s.__repr__}")
+    async def stream(self, stream: KlineStream) -> None:
+        """stream
         
+        訂閱k線串流 每根k線收盤時立即以新的k線執行註冊的策略, 不需要等 join_schedule 的收盤排程
+        第一次進入會無條件先執行一次
+        """
+        await self.do_strategies(skip_order=False)
         
+        async for closed, forming in stream.watch(self._symbol, self._timeframe):
+            await self._hub.push(self._exchange, self._symbol, self._timeframe, closed)
+            await self._hub.push(self._exchange, self._symbol, self._timeframe, forming)
+            try:
+                await self.do_strategies()
+            except Exception as e:
+                logger.error(f"{self._symbol} {self._timeframe} {type(e).__name__}, {e.args}, {e}")
         
     async def close(self)->None:
-        if self._exchange:
-            await self._exchange.close()
-            self._exchange = None
-            
\ No newline at end of file
+        # client 由 ExchangePool 共用, 在 ExchangePool.close 統一關閉
+        self._exchange = None
+
+
+def sync_positions(strategies: List[Strategy], direction: int) -> None:
+    """以交易所的持倉方向修正有追蹤持倉的策略"""
+    for stgy in strategies:
+        if hasattr(stgy, 'sync_position'):
+            stgy.sync_position(direction)
+
+
+def evaluate_strategies(
+    strategies: List[Strategy],
+    df: Union[Candles, pd.DataFrame],
+    backtest: bool = False,
+    percent_of_equity: float = 30,
+    label: str = '',
+) -> List[StrategyResult]:
+    """evaluate_strategies
+    依序執行策略, 回測模式會執行 backtest 並記錄模擬成交的結果
+
+    Returns:
+        List[StrategyResult]: 所有策略的結果
+    """
+    results = []
+    for stgy in strategies:
+        with tracer.span('strategy', strategy=stgy.__class__.__name__):
+            if backtest:
+                signals = stgy.signals(df) if hasattr(stgy, 'signals') else stgy.backtest(df)
+                report = Backtester(percent_of_equity=percent_of_equity).run(df, signals)
+                logger.info(f"[{stgy.__class__.__name__}] backtest {label}: {report.summary()}")
+                stgy_results = signals.to_results() if isinstance(signals, SignalBatch) else signals
+            else:
+                stgy_results = stgy.run(df)
+        results.extend(stgy_results)
+
+    return results
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ccxt_bot.core import config
+from ccxt_bot.core.logger import logger
+from ccxt_bot.trade.archive import CandleArchive
+
+
+class CandleStore():
+    """CandleStore
+
+    以 (交易所, 交易對, 週期) 為單位 在記憶體中保存最近 window 根k線
+    每次只向交易所請求最後一根k線(尚未收盤)之後的資料, 並取代尚未收盤的那一根
+    若資料出現斷層 或 距離上次更新太久 則重新下載整個區間
+
+    有設定 archive 時, 啟動後第一次 fetch 會先從本地檔案讀取最近的k線 只下載之後的部分,
+    並把已收盤的k線附加到 archive, 與 archive 最後一根之間有斷層時 先 backfill 補齊
+
+    window 超過交易所單次回傳的上限(page_limit)時 重新下載會分頁請求
+    """
+    def __init__(self, window: int = 300, archive: Optional[CandleArchive] = None, page_limit: int = 1000):
+        self._window = window
+        self._archive = archive
+        self._page_limit = page_limit
+        self._windows: Dict[Tuple[str, str, str], int] = {}
+        self._kbars: Dict[Tuple[str, str, str], List[list]] = {}
+
+    def reserve(self, exchange_id: str, symbol: str, timeframe: str, window: int) -> None:
+        """至少保存 window 根k線, ex. 由 1h 推導 4h 時需要更多的 1h k線"""
+        key = (exchange_id, symbol, timeframe)
+        if window > self._windows.get(key, self._window):
+            self._windows[key] = window
+            # 快取的k線不夠 下次 fetch 重新下載
+            self._kbars.pop(key, None)
+
+    async def fetch(self, exchange, symbol: str, timeframe: str) -> List[list]:
+        """fetch
+        獲取最新的k線 最後一根為尚未收盤的k線
+
+        Args:
+            exchange (ccxt_async.Exchange): 交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            timeframe (str): 週期, ex. 4h
+
+        Returns:
+            List[list]: [timestamp, open, high, low, close, volume] 的列表
+        """
+        key = (exchange.id, symbol, timeframe)
+        window = self._windows.get(key, self._window)
+        kbars = self._kbars.get(key)
+
+        if not kbars and self._archive is not None:
+            kbars = self._warm_up(exchange.id, symbol, timeframe, window)
+
+        if kbars:
+            kbars = await self._update(exchange, symbol, timeframe, kbars, window)
+
+        if not kbars:
+            kbars = await self._refresh(exchange, symbol, timeframe, window)
+
+        self._kbars[key] = kbars
+        if self._archive is not None:
+            await self._archive_closed(exchange, symbol, timeframe, kbars[:-1])
+
+        return kbars
+
+    def push(self, exchange, symbol: str, timeframe: str, kbar: list) -> Optional[List[list]]:
+        """push
+        以串流收到的k線直接更新快取: 相同時間則取代最後一根, 下一根則附加在最後
+
+        Returns:
+            Optional[List[list]]: 更新後的k線, 沒有快取 或 出現斷層時回傳 None, 需要再 fetch
+        """
+        key = (exchange.id, symbol, timeframe)
+        kbars = self._kbars.get(key)
+        if not kbars or kbar[0] < kbars[-1][0]:
+            return None
+
+        if kbar[0] == kbars[-1][0]:
+            kbars[-1] = list(kbar)
+            return kbars
+
+        if kbar[0] - kbars[-1][0] != exchange.parse_timeframe(timeframe) * 1000:
+            logger.warning(f"gap in {exchange.id} {symbol} {timeframe} after {kbars[-1][0]}")
+            self.invalidate(exchange.id, symbol, timeframe)
+            return None
+
+        kbars.append(list(kbar))
+        del kbars[:-self._windows.get(key, self._window)]
+        if self._archive is not None and not self._archive_gap(exchange, symbol, timeframe, kbars[-2:-1]):
+            self._archive.append(exchange.id, symbol, timeframe, kbars[-2:-1])
+
+        return kbars
+
+    def invalidate(self, exchange_id: str, symbol: str, timeframe: str) -> None:
+        """清除快取 下次 fetch 會重新下載整個區間"""
+        self._kbars.pop((exchange_id, symbol, timeframe), None)
+
+    def _archive_gap(self, exchange, symbol: str, timeframe: str, closed: List[list]) -> bool:
+        # 第一根新的k線不是 archive 最後一根的下一根, 直接附加會在檔案中留下斷層
+        last_ts = self._archive.last_timestamp(exchange.id, symbol, timeframe)
+        new_kbars = [kbar for kbar in closed if last_ts is None or kbar[0] > last_ts]
+        if last_ts is None or not new_kbars:
+            return False
+
+        return new_kbars[0][0] != last_ts + exchange.parse_timeframe(timeframe) * 1000
+
+    async def _archive_closed(self, exchange, symbol: str, timeframe: str, closed: List[list]) -> None:
+        if self._archive_gap(exchange, symbol, timeframe, closed):
+            logger.warning(f"gap in {exchange.id} {symbol} {timeframe} archive, backfill from {self._archive.last_timestamp(exchange.id, symbol, timeframe)}")
+            try:
+                await self._archive.backfill(exchange, symbol, timeframe, limit=self._page_limit)
+            except Exception as e:
+                logger.error(f"backfill {exchange.id} {symbol} {timeframe} failed, {type(e).__name__}, {e}")
+
+            # backfill 失敗時不附加, 下次 fetch 再補
+            if self._archive_gap(exchange, symbol, timeframe, closed):
+                return
+
+        self._archive.append(exchange.id, symbol, timeframe, closed)
+
+    def _warm_up(self, exchange_id: str, symbol: str, timeframe: str, window: int) -> Optional[List[list]]:
+        # archive 只有已收盤的k線, 最後一根會被當成尚未收盤的k線重新下載
+        kbars = self._archive.read(exchange_id, symbol, timeframe)[-window:]
+        if len(kbars) < window:
+            return None
+
+        return [list(kbar) for kbar in kbars.tolist()]
+
+    async def _refresh(self, exchange, symbol: str, timeframe: str, window: int) -> List[list]:
+        logger.info(f"full refresh {exchange.id} {symbol} {timeframe} ({window} bars)")
+
+        if window <= self._page_limit:
+            return await exchange.fetch_ohlcv(
+                symbol=symbol,
+                timeframe=timeframe,
+                limit=window
+            )
+
+        tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        since = (exchange.milliseconds() // tf_ms - window + 1) * tf_ms
+        kbars = []
+        while since <= exchange.milliseconds():
+            page = await exchange.fetch_ohlcv(
+                symbol=symbol,
+                timeframe=timeframe,
+                since=since,
+                limit=self._page_limit
+            )
+            page = [kbar for kbar in page if kbar[0] >= since]
+            if not page:
+                break
+            kbars.extend(page)
+            since = page[-1][0] + tf_ms
+
+        return kbars[-window:]
+
+    async def _update(self, exchange, symbol: str, timeframe: str, kbars: List[list], window: int) -> Optional[List[list]]:
+        tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        last_ts = kbars[-1][0]
+
+        # 從最後一根(尚未收盤)到現在 最多應該有幾根k線, 多留一根避免時鐘誤差
+        limit = (exchange.milliseconds() - last_ts) // tf_ms + 2
+        if limit >= window:
+            return None
+
+        new_kbars = await exchange.fetch_ohlcv(
+            symbol=symbol,
+            timeframe=timeframe,
+            since=last_ts,
+            limit=limit
+        )
+        new_kbars = [kbar for kbar in new_kbars if kbar[0] >= last_ts]
+
+        # 拿到的數量等於 limit 代表後面可能還有資料
+        if not new_kbars or len(new_kbars) >= limit:
+            return None
+
+        # 斷層: 第一根不是上次未收盤的k線 或 新k線之間不連續
+        if new_kbars[0][0] != last_ts or \
+            any(curr[0] - prev[0] != tf_ms for prev, curr in zip(new_kbars, new_kbars[1:])):
+            logger.warning(f"gap in {exchange.id} {symbol} {timeframe} after {last_ts}")
+            return None
+
+        return (kbars[:-1] + new_kbars)[-window:]
+
+
+class Candles():
+    """Candles
+
+    k線與指標的唯讀 snapshot, 每個欄位是 CandleBuffer 陣列的 view (不複製資料)
+    策略以 datas['close'][-2] datas.index[-2] 讀取, 與 DataFrame 的用法相同
+    snapshot 之後 只有最後一根(尚未收盤)的k線可能被更新, 需要保存時使用 to_pandas()
+    """
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self._columns = columns
+        self._index: Optional[pd.DatetimeIndex] = None
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._columns
+
+    def __len__(self) -> int:
+        return len(self._columns['timestamp'])
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        """k線的開始時間, 與 to_frame 的 index 相同, 第一次使用時才建立"""
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self._columns['timestamp'].astype('datetime64[ms]'), name='dt')
+        return self._index
+
+    def tail(self, n: int) -> 'Candles':
+        """最後 n 根k線, 同樣不複製資料"""
+        return Candles({col: values[-n:] for col, values in self._columns.items()}) if n < len(self) else self
+
+    def to_pandas(self) -> pd.DataFrame:
+        """複製成以時間為 index 的 DataFrame, 除錯或需要 pandas 的計算時使用"""
+        return pd.DataFrame({col: values.copy() for col, values in self._columns.items()}, index=self.index)
+
+
+class CandleBuffer():
+    """CandleBuffer
+
+    保存最近 capacity 根k線與指標的 ring buffer, 每個欄位是預先配置 2 倍容量的 numpy 陣列
+        1. append 新收盤的k線為 O(1), 寫到陣列尾端時 把最後 capacity 根複製到新的陣列 (平均每根 O(1))
+        2. 尚未收盤的k線寫在最後一根的下一格, 每次更新直接覆蓋
+        3. view() 回傳連續記憶體的唯讀 view, 不需要為每次 tick 建立 DataFrame
+
+    ex.
+        buffer = CandleBuffer(KBAR_COLUMNS, capacity=300)
+        buffer.append(closed)
+        buffer.set_forming(forming)
+        datas = buffer.view()
+    """
+    def __init__(self, columns: Sequence[str], capacity: int, dtypes: Optional[Dict[str, type]] = None):
+        """
+        Args:
+            columns (Sequence[str]): 欄位名稱, 需要包含 timestamp
+            capacity (int): 保留的k線數量 (包含尚未收盤的k線)
+            dtypes (Optional[Dict[str, type]], optional): 欄位的型別. Defaults to float64, timestamp 為 int64.
+        """
+        self._capacity = capacity
+        self._dtypes = {col: {'timestamp': np.int64, **(dtypes or {})}.get(col, np.float64) for col in columns}
+        self.clear()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return min(self._end - self._start + self._forming, self._capacity)
+
+    def clear(self) -> None:
+        self._data = self._allocate()
+        self._start = 0
+        self._end = 0 # 已收盤的k線為 [start, end)
+        self._forming = False
+
+    def append(self, row: Sequence) -> None:
+        """附加一根已收盤的k線, 會取代尚未收盤的k線"""
+        # 保留最後一格給尚未收盤的k線
+        if self._end + 1 >= 2 * self._capacity:
+            self._compact()
+        self._write(self._end, row)
+        self._end += 1
+        self._start = max(self._start, self._end - self._capacity)
+        self._forming = False
+
+    def set_forming(self, row: Sequence) -> None:
+        """寫入尚未收盤的k線"""
+        self._write(self._end, row)
+        self._forming = True
+
+    def view(self) -> Candles:
+        """最後 capacity 根k線的唯讀 view"""
+        end = self._end + self._forming
+        start = max(self._start, end - self._capacity)
+
+        columns = {}
+        for col, values in self._data.items():
+            view = values[start:end]
+            view.flags.writeable = False
+            columns[col] = view
+        return Candles(columns)
+
+    def _allocate(self) -> Dict[str, np.ndarray]:
+        return {col: np.empty(2 * self._capacity, dtype=dtype) for col, dtype in self._dtypes.items()}
+
+    def _compact(self) -> None:
+        # 配置新的陣列 而不是在原本的陣列中搬移, 之前的 view 不會被覆蓋
+        data = self._allocate()
+        n = self._end - self._start
+        for col, values in self._data.items():
+            data[col][:n] = values[self._start:self._end]
+        self._data, self._start, self._end = data, 0, n
+
+    def _write(self, i: int, row: Sequence) -> None:
+        for values, value in zip(self._data.values(), row):
+            values[i] = value
+
+
+# 所有 bot 共用的k線快取
+candle_store = CandleStore(archive=CandleArchive(config.ARCHIVE_DIR) if config.ARCHIVE_DIR else None)
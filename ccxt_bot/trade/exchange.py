@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import ccxt.async_support as ccxt_async
+import ccxt.pro as ccxt_pro
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.ratelimit import RateLimiter
+
+
+class ExchangePool():
+    """ExchangePool
+
+    以 (交易所, api key, secret) 為單位 共用 ccxt.async_support 的 client
+    同一組帳號的所有 bot 共用同一個 HTTP session 與 rate limit, 交易市場資訊也只需要載入一次
+    串流使用的 ccxt.pro client (websocket) 另外共用
+    同一個交易所的所有 client 共用一個 RateLimiter, 請求權重不會因為 bot 或帳號增加而超過限制
+    """
+    def __init__(self, burst: float = 5.0):
+        """
+        Args:
+            burst (float, optional): RateLimiter 最多累積幾秒的額度. Defaults to 5.0.
+        """
+        self._burst = burst
+        self._clients: Dict[Tuple[str, str, str, bool], ccxt_async.Exchange] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+
+    def get(self, exchange_id: str, api_key: str = '', secret: str = '', options: Optional[dict] = None, pro: bool = False) -> ccxt_async.Exchange:
+        """get
+        取得共用的 client, 不存在則建立
+
+        Args:
+            exchange_id (str): 交易所的id, ex. binance
+            api_key (str, optional): 向交易所申請的api key.
+            secret (str, optional): 向交易所申請的secret.
+            options (Optional[dict], optional): 第一次建立 client 時使用的 ccxt options.
+            pro (bool, optional): 使用支援 watch_* 的 ccxt.pro client. Defaults to False.
+
+        Returns:
+            ccxt_async.Exchange: 交易所 client
+        """
+        key = (exchange_id, api_key, secret, pro)
+        if key not in self._clients:
+            exchange_class = getattr(ccxt_pro if pro else ccxt_async, exchange_id)
+            self._clients[key] = exchange_class({
+                'apiKey': api_key,
+                'secret': secret,
+                'enableRateLimit': True,
+                'options': options or {},
+            })
+            self.limiter(exchange_id, self._clients[key]).attach(self._clients[key])
+            logger.info(f"create {exchange_id} client ({len(self._clients)} clients)")
+
+        return self._clients[key]
+
+    def limiter(self, exchange_id: str, exchange: Optional[ccxt_async.Exchange] = None) -> RateLimiter:
+        """limiter
+        取得交易所共用的 RateLimiter, 不存在則以 client 的 rateLimit (每單位權重的毫秒數) 建立
+
+        Args:
+            exchange_id (str): 交易所的id, ex. binance
+            exchange (Optional[ccxt_async.Exchange], optional): 用來取得 rateLimit 的 client.
+        """
+        if exchange_id not in self._limiters:
+            rate_limit = getattr(exchange, 'rateLimit', None) or 50
+            self._limiters[exchange_id] = RateLimiter(rate=1000 / rate_limit, burst=self._burst)
+
+        return self._limiters[exchange_id]
+
+    async def close(self) -> None:
+        """關閉所有 client 的 HTTP session"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+
+# 所有 bot 共用的 client
+exchange_pool = ExchangePool()
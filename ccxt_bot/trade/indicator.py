@@ -0,0 +1,427 @@
+# -*- coding: utf-8 -*-
+
+import copy
+import sys
+from collections import deque
+from enum import IntEnum
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+from pydantic import BaseModel
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.trade.candle import CandleBuffer, Candles
+
+
+KBAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+INDICATOR_COLUMNS = [
+    'rsi', 'ema',
+    'kdj_k', 'kdj_d', 'kdj_j',
+    'macd', 'macd_signal', 'macd_hist',
+    'kdj_j_diff', 'kdj_j_diff_prev',
+    'hi', 'lo', 'mi', 'md', 'sb', 'sh', 'mdc',
+    'atr',
+]
+
+
+class ImpulseColor(IntEnum):
+    """Impulse MACD 的狀態 (mdc 欄位), 以 int8 儲存"""
+    LIME = 0   # src 高於 mi 與 hi
+    GREEN = 1  # src 高於 mi
+    RED = 2    # src 低於 mi 與 lo
+    ORANGE = 3 # src 低於 mi
+
+
+class IndicatorParams(BaseModel):
+    """generate_indicator 與 IndicatorEngine 使用的指標參數"""
+    rsi_length: int = 14
+    ema_length: int = 21
+    kdj_length: int = 9
+    kdj_signal: int = 3
+    macd_fast: int = 12
+    macd_slow: int = 26
+    macd_signal: int = 9
+    impulse_length_ma: int = 34 # Impulse MACD lengthMA
+    impulse_length_signal: int = 9 # Impulse MACD lengthSignal
+    atr_length: int = 14
+
+
+# help functions
+def calc_smma(src: pd.Series, length: int) -> pd.Series:
+    """calc_smma
+    SMMA 以前 length 根k線的 SMA 作為起始值, 之後 smma[i] = (smma[i-1] * (length - 1) + src[i]) / length
+
+    即 alpha = 1/length 的 EMA, 用 ewm(adjust=False) 一次計算整個序列 取代逐筆的 python 迴圈
+
+    Args:
+        src (pd.Series): 輸入序列
+        length (int): 週期
+
+    Returns:
+        pd.Series: SMMA, 前 length-1 筆為 NaN
+    """
+    smma = pd.Series(np.nan, index=src.index)
+    if len(src) < length:
+        return smma
+
+    smma.iloc[length-1] = src.iloc[:length].mean()
+    smma.iloc[length:] = src.iloc[length:]
+
+    return smma.ewm(alpha=1/length, adjust=False).mean()
+
+def calc_zlema(src, length):
+    ema1 = ta.ema(src, length)
+    ema2 = ta.ema(ema1, length)
+    d = ema1 - ema2
+
+    return ema1 + d
+
+def to_frame(kbars: List[list], columns: List[str] = KBAR_COLUMNS) -> pd.DataFrame:
+    """將 fetch_ohlcv 的k線列表轉成以時間為 index 的 DataFrame"""
+    df = pd.DataFrame(kbars[:], columns=columns)
+    df['dt'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df.set_index('dt', inplace=True)
+
+    return df
+
+def generate_indicator(data: pd.DataFrame, params: IndicatorParams = IndicatorParams()) -> pd.DataFrame:
+    """generate_indicator
+
+    使用輸入的k線資料 計算需要的指標 並 回傳
+
+    Args:
+        data (pd.DataFrame): k線資料
+        params (IndicatorParams, optional): 指標參數.
+
+    Returns:
+        pd.DataFrame: k線資料並包含計算後的indicator
+    """
+    data['rsi']  = data.ta.rsi(length=params.rsi_length)
+    data['ema'] = ta.ema(data['close'], length=params.ema_length)
+    # df.ta.kdj 是 pandas_ta 庫中計算 KDJ 指標的函數。該函數會在 DataFrame 對象中添加三列新的數據列，分別是 K 值、D 值和 J 值。函數的返回值是修改後的 DataFrame 對象。
+
+    # 以下是 df.ta.kdj 函數的參數和返回值的簡要說明：
+
+    # 參數：
+
+    # high：指定 High 值的列名或位置，用於計算 KDJ 指標
+    # low：指定 Low 值的列名或位置，用於計算 KDJ 指標
+    # close：指定 Close 值的列名或位置，用於計算 KDJ 指標
+    # window：指定 KDJ 指標的窗口大小，即計算 K 值、D 值和 J 值的周期數量
+    # fillna：如果存在缺失值，指定是否填充，默認為 True
+    # append：指定是否將計算結果添加到原始 DataFrame 對象中，默認為 True
+    # 返回值：
+
+    # 修改後的 DataFrame 對象，其中新增三列數據：K 值、D 值和 J 值。
+    data[['kdj_k', 'kdj_d', 'kdj_j']]  = ta.kdj(high=data['high'], low=data['low'], close=data['close'], length=params.kdj_length, signal=params.kdj_signal, fillna=True, append=False)
+    # df.ta.macd 是 pandas_ta 庫中計算 MACD 指標的函數。該函數會在 DataFrame 對象中添加三列新的數據列，分別是 MACD、MACD 信號線和 MACD 柱狀圖。函數的返回值是修改後的 DataFrame 對象。
+
+    # 以下是 df.ta.macd 函數的參數和返回值的簡要說明：
+
+    # 參數：
+
+    # close：指定 Close 值的列名或位置，用於計算 MACD 指標
+    # fast：指定快速移動平均線的周期數
+    # slow：指定慢速移動平均線的周期數
+    # signal：指定 MACD 信號線的周期數
+    # fillna：如果存在缺失值，指定是否填充，默認為 True
+    # append：指定是否將計算結果添加到原始 DataFrame 對象中，默認為 True
+    # 返回值：
+
+    # 修改後的 DataFrame 對象，其中新增三列數據：MACD、MACD 信號線和 MACD 柱狀圖。
+    # 回傳欄位的順序為 MACD, MACDh, MACDs, 依名稱取用避免把柱狀圖寫進信號線
+    macd = ta.macd(close=data['close'], fast=params.macd_fast, slow=params.macd_slow, signal=params.macd_signal, fillna=True, append=False)
+    props = f"_{params.macd_fast}_{params.macd_slow}_{params.macd_signal}"
+    data['macd'] = macd[f"MACD{props}"]
+    data['macd_signal'] = macd[f"MACDs{props}"]
+    data['macd_hist'] = macd[f"MACDh{props}"]
+
+    data['kdj_j_diff'] = data['kdj_j'] - 50 - data['macd']
+    data['kdj_j_diff_prev'] = data['kdj_j_diff'].shift(1)
+
+    lengthMA = params.impulse_length_ma
+    lengthSignal = params.impulse_length_signal
+    src = data[['high', 'low', 'close']].mean(axis=1)
+    data['hi'] = calc_smma(data['high'], lengthMA)
+    data['lo'] = calc_smma(data['low'], lengthMA)
+    data['mi'] = calc_zlema(src, lengthMA)
+
+    data['md'] = np.where(data['mi'] > data['hi'], data['mi'] - data['hi'], np.where(data['mi'] < data['lo'], data['mi'] - data['lo'], 0))
+    data['sb'] = ta.sma(data['md'], lengthSignal)
+    data['sh'] = data['md'] - data['sb']
+    data['mdc'] = np.where(
+        src > data['mi'],
+        np.where(src > data['hi'], ImpulseColor.LIME, ImpulseColor.GREEN),
+        np.where(src < data['lo'], ImpulseColor.RED, ImpulseColor.ORANGE),
+    ).astype(np.int8)
+    data['atr'] = ta.atr(data['high'], data['low'], data['close'], length=params.atr_length, mamode="rma")
+
+    # logger.info(f"data['atr']:{data['atr']}")
+    # logger.info(f"data['close']:{data['close']}")
+
+    return data
+
+
+# 以下為逐根k線更新的指標, 每個指標只保存遞迴所需的狀態
+class _EMA():
+    """以前 length 筆有效資料的平均作為起始值的指數移動平均
+
+    alpha 預設為 2/(length+1), 給 1/length 即為 SMMA(RMA)
+    """
+    def __init__(self, length: int, alpha: Optional[float] = None):
+        self._length = length
+        self._alpha = 2 / (length + 1) if alpha is None else alpha
+        self._seed = []
+        self.value = np.nan
+
+    def update(self, x: float) -> float:
+        if np.isnan(x):
+            return self.value
+
+        if len(self._seed) < self._length:
+            self._seed.append(x)
+            if len(self._seed) == self._length:
+                self.value = sum(self._seed) / self._length
+            return self.value
+
+        self.value += self._alpha * (x - self.value)
+
+        return self.value
+
+
+class _RMA():
+    """與 pandas ewm(alpha=1/length, min_periods=length).mean() 相同的遞迴 (adjust=True)"""
+    def __init__(self, length: int):
+        self._length = length
+        self._decay = 1 - 1 / length
+        self._num = 0.0
+        self._den = 0.0
+        self._count = 0
+        self.value = np.nan
+
+    def update(self, x: float) -> float:
+        if np.isnan(x):
+            self._num *= self._decay
+            self._den *= self._decay
+            return self.value
+
+        self._num = x + self._decay * self._num
+        self._den = 1 + self._decay * self._den
+        self._count += 1
+        if self._count >= self._length:
+            self.value = self._num / self._den
+
+        return self.value
+
+
+class _SMA():
+    def __init__(self, length: int):
+        self._window = deque(maxlen=length)
+
+    def update(self, x: float) -> float:
+        self._window.append(x)
+        if len(self._window) < self._window.maxlen:
+            return np.nan
+
+        return sum(self._window) / len(self._window)
+
+
+def _fillna(x: float) -> float:
+    # 與 pandas_ta 的 fillna=True 相同, NaN 會被填成 1.0
+    return 1.0 if np.isnan(x) else x
+
+
+class _IndicatorState():
+    """generate_indicator 所有指標的遞迴狀態, step 輸入一根k線 輸出該根k線的指標"""
+    def __init__(self, params: IndicatorParams):
+        self.prev_close = np.nan
+        self.kdj_j_diff = np.nan
+        # rsi
+        self.rsi_gain = _EMA(params.rsi_length, alpha=1/params.rsi_length)
+        self.rsi_loss = _EMA(params.rsi_length, alpha=1/params.rsi_length)
+        # ema
+        self.ema = _EMA(params.ema_length)
+        # kdj
+        self.kdj_high = deque(maxlen=params.kdj_length)
+        self.kdj_low = deque(maxlen=params.kdj_length)
+        self.kdj_k = _RMA(params.kdj_signal)
+        self.kdj_d = _RMA(params.kdj_signal)
+        # macd
+        self.macd_fast = _EMA(params.macd_fast)
+        self.macd_slow = _EMA(params.macd_slow)
+        self.macd_signal = _EMA(params.macd_signal)
+        # impulse macd
+        length_ma = params.impulse_length_ma
+        self.hi = _EMA(length_ma, alpha=1/length_ma)
+        self.lo = _EMA(length_ma, alpha=1/length_ma)
+        self.mi_ema1 = _EMA(length_ma)
+        self.mi_ema2 = _EMA(length_ma)
+        self.sb = _SMA(params.impulse_length_signal)
+        # atr
+        self.atr = _EMA(params.atr_length, alpha=1/params.atr_length)
+
+    def step(self, kbar: list) -> list:
+        _, _, high, low, close, _ = kbar
+        prev_close = self.prev_close
+        self.prev_close = close
+
+        diff = close - prev_close
+        gain = self.rsi_gain.update(max(diff, 0.0) if not np.isnan(diff) else np.nan)
+        loss = self.rsi_loss.update(max(-diff, 0.0) if not np.isnan(diff) else np.nan)
+        rsi = 100 * gain / (gain + loss) if gain + loss else 0.0
+
+        ema = self.ema.update(close)
+
+        self.kdj_high.append(high)
+        self.kdj_low.append(low)
+        fastk = np.nan
+        if len(self.kdj_high) == self.kdj_high.maxlen:
+            highest, lowest = max(self.kdj_high), min(self.kdj_low)
+            fastk = 100 * (close - lowest) / ((highest - lowest) or sys.float_info.epsilon)
+        k = self.kdj_k.update(fastk)
+        d = self.kdj_d.update(k)
+        kdj_k, kdj_d, kdj_j = _fillna(k), _fillna(d), _fillna(3 * k - 2 * d)
+
+        macd = self.macd_fast.update(close) - self.macd_slow.update(close)
+        signal = self.macd_signal.update(macd)
+        macd, macd_signal, macd_hist = _fillna(macd), _fillna(signal), _fillna(macd - signal)
+
+        kdj_j_diff_prev = self.kdj_j_diff
+        self.kdj_j_diff = kdj_j - 50 - macd
+
+        src = (high + low + close) / 3
+        hi = self.hi.update(high)
+        lo = self.lo.update(low)
+        ema1 = self.mi_ema1.update(src)
+        mi = 2 * ema1 - self.mi_ema2.update(ema1)
+        md = mi - hi if mi > hi else mi - lo if mi < lo else 0.0
+        sb = self.sb.update(md)
+        mdc = (ImpulseColor.LIME if src > hi else ImpulseColor.GREEN) if src > mi else (ImpulseColor.RED if src < lo else ImpulseColor.ORANGE)
+
+        tr = max(high - low, abs(high - prev_close), abs(prev_close - low)) if not np.isnan(prev_close) else np.nan
+        atr = self.atr.update(tr)
+
+        return [
+            rsi, ema,
+            kdj_k, kdj_d, kdj_j,
+            macd, macd_signal, macd_hist,
+            self.kdj_j_diff, kdj_j_diff_prev,
+            hi, lo, mi, md, sb, md - sb, mdc,
+            atr,
+        ]
+
+
+class IndicatorEngine():
+    """IndicatorEngine
+
+    逐根k線更新 generate_indicator 的所有指標
+    每個指標只保存遞迴所需的狀態 (EMA/RMA 累加值, SMMA, KDJ 的滾動視窗),
+    每根新收盤的k線只需 O(1) 的計算, 尚未收盤的最後一根k線則在狀態的複本上計算
+    結果寫入 CandleBuffer, update 回傳唯讀的 Candles 不建立 DataFrame
+
+    起始值的算法與 TA-Lib 相同 (前 length 筆有效資料的平均),
+    暖機之後的結果與 generate_indicator 一致, 可以開啟 verify 在每次更新時比對
+    """
+    def __init__(
+        self,
+        params: IndicatorParams = IndicatorParams(),
+        window: int = 300,
+        verify: bool = False,
+        verify_tail: int = 50,
+        rtol: float = 1e-3,
+    ):
+        """
+        Args:
+            params (IndicatorParams, optional): 指標參數.
+            window (int, optional): 保留的k線數量. Defaults to 300.
+            verify (bool, optional): 每次更新後與 generate_indicator 的結果比對. Defaults to False.
+            verify_tail (int, optional): 比對最後幾根k線. Defaults to 50.
+            rtol (float, optional): 比對的相對誤差. Defaults to 1e-3.
+        """
+        self._params = params
+        self._window = window
+        self._verify = verify
+        self._verify_tail = verify_tail
+        self._rtol = rtol
+        self.reset()
+
+    def reset(self) -> None:
+        self._state = _IndicatorState(self._params)
+        self._buffer = CandleBuffer(KBAR_COLUMNS + INDICATOR_COLUMNS, capacity=self._window, dtypes={'mdc': np.int8})
+        self._last_ts = None
+
+    def update(self, kbars: List[list]) -> Candles:
+        """update
+        輸入最新的k線 (最後一根為尚未收盤的k線), 只計算新收盤的k線
+
+        Args:
+            kbars (List[list]): [timestamp, open, high, low, close, volume] 的列表
+
+        Returns:
+            Candles: k線資料並包含計算後的indicator, 下次 update 前有效
+        """
+        closed, forming = kbars[:-1], kbars[-1]
+
+        start = self._find_start(closed)
+        if start is None:
+            # 第一次執行 或 k線不連續 從頭計算
+            self.reset()
+            start = 0
+
+        for kbar in closed[start:]:
+            self._buffer.append([*kbar, *self._state.step(kbar)])
+            self._last_ts = kbar[0]
+
+        # 尚未收盤的k線 只在狀態的複本上計算
+        self._buffer.set_forming([*forming, *copy.deepcopy(self._state).step(forming)])
+
+        datas = self._buffer.view()
+        if self._verify:
+            self.verify(datas)
+
+        return datas
+
+    def verify(self, datas: Union[Candles, pd.DataFrame]) -> Dict[str, int]:
+        """verify
+        與 generate_indicator 全部重新計算的結果比對最後 verify_tail 根k線
+
+        Returns:
+            Dict[str, int]: 每個不一致的指標 與 不一致的k線數量
+        """
+        df = datas.to_pandas() if isinstance(datas, Candles) else datas
+        expected = generate_indicator(df[KBAR_COLUMNS].copy(), self._params)
+        tail = min(self._verify_tail, len(df))
+        # 震盪指標的範圍是 0~100, 其餘指標以價格為單位
+        price_scale = float(df['close'].iloc[-tail:].abs().mean())
+
+        mismatches = {}
+        for col in INDICATOR_COLUMNS:
+            got = df[col].iloc[-tail:]
+            exp = expected[col].iloc[-tail:]
+            if col == 'mdc':
+                count = int((got != exp).sum())
+            else:
+                scale = 100 if col in ('rsi', 'kdj_k', 'kdj_d', 'kdj_j') else price_scale
+                count = int((~np.isclose(got.astype(float), exp.astype(float), rtol=self._rtol, atol=self._rtol * scale, equal_nan=True)).sum())
+            if count:
+                mismatches[col] = count
+
+        if mismatches:
+            logger.warning(f"incremental indicator mismatch in last {tail} bars: {mismatches}")
+
+        return mismatches
+
+    def _find_start(self, closed: List[list]) -> Optional[int]:
+        if self._last_ts is None:
+            return None
+
+        # 從後面找上次計算到的k線
+        for i in range(len(closed) - 1, -1, -1):
+            if closed[i][0] == self._last_ts:
+                return i + 1
+            if closed[i][0] < self._last_ts:
+                break
+
+        return None
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from ccxt_bot.core import config
+from ccxt_bot.core.metrics import tracer
+from ccxt_bot.trade.candle import Candles, CandleStore, candle_store
+from ccxt_bot.trade.indicator import IndicatorEngine, IndicatorParams
+
+
+# k線起點為 epoch 整數倍的週期單位, 週/月/年 的起點不是 不能由較小的週期推導
+_ALIGNED_UNITS = ('s', 'm', 'h')
+
+
+class MarketDataHub():
+    """MarketDataHub
+
+    bot 以 (交易所, 交易對, 週期) 訂閱k線, 同一根k線只向交易所請求一次 指標也只計算一次,
+    所有訂閱的 bot 拿到同一個 Candles (唯讀的 numpy 陣列, 不為每次 tick 建立 DataFrame)
+
+    如果同一個交易對訂閱了可以整除的較小週期 (ex. 4h 與 1h), 較大的週期由較小週期的k線在本地合併, 不另外請求
+    """
+    def __init__(self, store: CandleStore = candle_store, window: int = 300, verify: bool = False):
+        """
+        Args:
+            store (CandleStore, optional): k線快取.
+            window (int, optional): 每個週期保留的k線數量. Defaults to 300.
+            verify (bool, optional): 指標與 generate_indicator 的結果比對. Defaults to False.
+        """
+        self._store = store
+        self._window = window
+        self._verify = verify
+        self._timeframes: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        self._engines: Dict[tuple, IndicatorEngine] = {}
+        self._kbars: Dict[Tuple[str, str, str], Tuple[int, List[list]]] = {}
+        self._frames: Dict[tuple, Tuple[int, Candles]] = {}
+        self._locks: Dict[tuple, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def subscribe(self, exchange, symbol: str, timeframe: str, params: IndicatorParams = IndicatorParams()) -> None:
+        """subscribe
+        訂閱k線與指標
+
+        Args:
+            exchange (ccxt_async.Exchange): 交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            timeframe (str): 週期, ex. 4h
+            params (IndicatorParams, optional): 指標參數.
+        """
+        key = (exchange.id, symbol, timeframe, params.json())
+        if key in self._engines:
+            return
+
+        self._engines[key] = IndicatorEngine(params=params, window=self._window, verify=self._verify)
+        self._timeframes[(exchange.id, symbol)].add(timeframe)
+
+        # 推導較大週期需要的較小週期k線數量
+        self._store.reserve(exchange.id, symbol, timeframe, self._window)
+        for tf in self._timeframes[(exchange.id, symbol)]:
+            base = self._base_timeframe(exchange, symbol, tf)
+            if base is not None:
+                ratio = exchange.parse_timeframe(tf) // exchange.parse_timeframe(base)
+                self._store.reserve(exchange.id, symbol, base, (self._window + 1) * ratio)
+
+    async def get(self, exchange, symbol: str, timeframe: str, params: IndicatorParams = IndicatorParams()) -> Candles:
+        """get
+        取得最新的k線與指標, 同一根k線內重複呼叫會拿到同一個 Candles
+
+        Returns:
+            Candles: k線資料並包含計算後的indicator, 最後一根為尚未收盤的k線
+        """
+        self.subscribe(exchange, symbol, timeframe, params)
+        key = (exchange.id, symbol, timeframe, params.json())
+
+        async with self._locks[key]:
+            with tracer.span('candles'):
+                bar, kbars = await self._fetch(exchange, symbol, timeframe)
+            cached = self._frames.get(key)
+            if cached is not None and cached[0] == bar:
+                return cached[1]
+
+            with tracer.span('indicators'):
+                datas = self._engines[key].update(kbars)
+            self._frames[key] = (bar, datas)
+
+            return datas
+
+    async def candles(self, exchange, symbol: str, timeframe: str) -> List[list]:
+        """candles
+        取得最新的k線 (不計算指標), 同一根k線內不會重複請求, 最後一根為尚未收盤的k線
+        """
+        _, kbars = await self._fetch(exchange, symbol, timeframe)
+
+        return kbars
+
+    async def push(self, exchange, symbol: str, timeframe: str, kbar: list) -> None:
+        """push
+        串流收到k線時直接更新快取, 之後的 get 不需要再向交易所請求
+
+        Args:
+            exchange (ccxt_async.Exchange): 交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            timeframe (str): 週期, ex. 1h
+            kbar (list): [timestamp, open, high, low, close, volume]
+        """
+        key = (exchange.id, symbol, timeframe)
+
+        async with self._locks[key]:
+            if self._base_timeframe(exchange, symbol, timeframe) is not None:
+                # 由較小週期推導, 下次 get 時重新合併
+                self._kbars.pop(key, None)
+                return
+
+            kbars = self._store.push(exchange, symbol, timeframe, kbar)
+            if kbars is None:
+                kbars = await self._store.fetch(exchange=exchange, symbol=symbol, timeframe=timeframe)
+            self._kbars[key] = (kbars[-1][0], kbars)
+
+        # 由這個週期推導的較大週期需要重新合併
+        for tf in self._timeframes[(exchange.id, symbol)]:
+            if self._base_timeframe(exchange, symbol, tf) == timeframe:
+                self._kbars.pop((exchange.id, symbol, tf), None)
+
+    async def _fetch(self, exchange, symbol: str, timeframe: str) -> Tuple[int, List[list]]:
+        """回傳 (最後一根k線的開始時間, k線), 交易所已經開始新的k線之前 每次都重新請求"""
+        key = (exchange.id, symbol, timeframe)
+        tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        current = exchange.milliseconds() // tf_ms * tf_ms
+
+        async with self._locks[key]:
+            cached = self._kbars.get(key)
+            if cached is not None and cached[0] >= current:
+                return cached
+
+            base = self._base_timeframe(exchange, symbol, timeframe)
+            if base is None:
+                kbars = await self._store.fetch(exchange=exchange, symbol=symbol, timeframe=timeframe)
+            else:
+                _, base_kbars = await self._fetch(exchange, symbol, base)
+                kbars = resample(base_kbars, tf_ms)
+
+            self._kbars[key] = (kbars[-1][0], kbars)
+
+            return self._kbars[key]
+
+    def _base_timeframe(self, exchange, symbol: str, timeframe: str) -> Optional[str]:
+        """找出已訂閱 可以整除 timeframe 的最大週期"""
+        if timeframe[-1] not in _ALIGNED_UNITS and timeframe != '1d':
+            return None
+
+        tf = exchange.parse_timeframe(timeframe)
+        candidates = [
+            base for base in self._timeframes[(exchange.id, symbol)]
+            if (base[-1] in _ALIGNED_UNITS or base == '1d')
+            and exchange.parse_timeframe(base) < tf
+            and tf % exchange.parse_timeframe(base) == 0
+        ]
+        if not candidates:
+            return None
+
+        return max(candidates, key=exchange.parse_timeframe)
+
+
+def resample(kbars: List[list], tf_ms: int) -> List[list]:
+    """resample
+    將較小週期的k線合併成 tf_ms 的k線, 第一根不完整的k線會被捨棄, 最後一根為尚未收盤的k線
+
+    Args:
+        kbars (List[list]): [timestamp, open, high, low, close, volume] 的列表
+        tf_ms (int): 合併後的週期(ms)
+
+    Returns:
+        List[list]: 合併後的k線
+    """
+    arr = np.asarray(kbars, dtype=float)
+    timestamps = arr[:, 0].astype(np.int64)
+    periods = timestamps // tf_ms * tf_ms
+
+    starts = np.r_[0, np.flatnonzero(np.diff(periods)) + 1]
+    ends = np.r_[starts[1:], len(arr)]
+    if timestamps[0] != periods[0]:
+        starts, ends = starts[1:], ends[1:]
+
+    return [
+        [int(ts), o, h, l, c, v]
+        for ts, o, h, l, c, v in zip(
+            periods[starts],
+            arr[starts, 1],
+            np.maximum.reduceat(arr[:, 2], starts),
+            np.minimum.reduceat(arr[:, 3], starts),
+            arr[ends - 1, 4],
+            np.add.reduceat(arr[:, 5], starts),
+        )
+    ]
+
+
+# 所有 bot 共用的k線與指標
+market_hub = MarketDataHub(verify=config.VERIFY_INDICATOR)
@@ -0,0 +1,598 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import itertools
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Type
+
+import ccxt
+import numpy as np
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.notifier import FakeSink, Notifier
+from ccxt_bot.core.ratelimit import RateLimiter
+from ccxt_bot.core.scheduler import parse_timeframe
+from ccxt_bot.trade.bot import Ccxt_bot
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.market import MarketDataHub
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+
+
+_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+class MockExchange():
+    """MockExchange
+
+    在 process 內模擬 ccxt 的 binance 全倉槓桿帳戶, 不需要網路, 相同的參數與操作會得到相同的結果
+    實作 bot 使用的 fetch_ohlcv fetch_balance(含 debt) fetch_ticker create_order sapi_post_margin_order_oco
+    borrowMargin repayMargin fetch_open_orders cancel_order watch_orders
+
+    時間由k線重播決定, advance() 讓下一根k線開始:
+        1. 剛收盤的k線的 high/low 觸發委託中的停損/限價單 (同一根k線同時觸發 OCO 的兩邊時 視為停損成交)
+        2. 市價單以目前價格(尚未收盤k線的開盤價) 加上滑價成交
+    每個請求可以加入延遲與隨機的錯誤, 用來測試重試 與 量測整個系統的吞吐量
+
+    ex.
+        exchange = MockExchange({'ETH/USDT': kbars}, timeframe='1h', balance={'USDT': 1000})
+        exchange.advance()
+    """
+    id = 'mock'
+    rateLimit = 50
+
+    def __init__(
+        self,
+        kbars: Dict[str, List[list]],
+        timeframe: str = '1h',
+        start: int = 300,
+        balance: Optional[Dict[str, float]] = None,
+        fee: float = 0.001,
+        slippage: float = 0.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error: Type[Exception] = ccxt.RequestTimeout,
+        amount_precision: int = 4,
+        price_precision: int = 2,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            kbars (Dict[str, List[list]]): 每個交易對重播的k線 [timestamp, open, high, low, close, volume]
+            timeframe (str, optional): k線的週期, fetch_ohlcv 只提供此週期. Defaults to '1h'.
+            start (int, optional): 一開始尚未收盤的k線位置, 之前的k線為歷史資料. Defaults to 300.
+            balance (Optional[Dict[str, float]], optional): 初始餘額. Defaults to {'USDT': 10000}.
+            fee (float, optional): 手續費率, 以報價貨幣收取. Defaults to 0.001.
+            slippage (float, optional): 市價單的滑價比例. Defaults to 0.0.
+            latency (float, optional): 每個請求的平均延遲秒數. Defaults to 0.0.
+            jitter (float, optional): 延遲的隨機變動秒數 (0 ~ jitter). Defaults to 0.0.
+            error_rate (float, optional): 每個請求失敗的機率. Defaults to 0.0.
+            error (Type[Exception], optional): 失敗時拋出的錯誤. Defaults to ccxt.RequestTimeout.
+            amount_precision (int, optional): 數量的小數位數. Defaults to 4.
+            price_precision (int, optional): 價格的小數位數. Defaults to 2.
+            seed (int, optional): 延遲與錯誤的亂數種子. Defaults to 0.
+        """
+        self._kbars = kbars
+        self._timeframe = timeframe
+        self._tf_ms = self.parse_timeframe(timeframe) * 1000
+        self._cursor = start
+        self._fee = fee
+        self._slippage = slippage
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._error = error
+        self._amount_precision = amount_precision
+        self._price_precision = price_precision
+        self._rng = random.Random(seed)
+
+        self.markets = {symbol: self.market(symbol) for symbol in kbars}
+        balance = balance or {'USDT': 10000.0}
+        currencies = {c for market in self.markets.values() for c in (market['base'], market['quote'])} | set(balance)
+        self._balances: Dict[str, Dict[str, float]] = {
+            currency: {'free': float(balance.get(currency, 0.0)), 'used': 0.0, 'debt': 0.0}
+            for currency in currencies
+        }
+
+        self._orders: Dict[str, dict] = {}
+        self._order_ids = itertools.count(1)
+        self._list_ids = itertools.count(1)
+        self._events: Dict[str, List[dict]] = defaultdict(list)
+        self._changed = asyncio.Event()
+        self.calls: Dict[str, int] = defaultdict(int)
+
+    # ---- 時間與交易市場資訊 ----
+
+    @staticmethod
+    def parse_timeframe(timeframe: str) -> int:
+        amount, unit = parse_timeframe(timeframe)
+        return amount * _SECONDS[unit]
+
+    def milliseconds(self) -> int:
+        """模擬的目前時間: 尚未收盤的k線開始後 1ms"""
+        symbol = next(iter(self._kbars))
+        return self._kbars[symbol][self._cursor][0] + 1
+
+    @property
+    def remaining(self) -> int:
+        """還可以 advance 幾根k線"""
+        return min(len(kbars) for kbars in self._kbars.values()) - 1 - self._cursor
+
+    def market(self, symbol: str) -> dict:
+        base, quote = symbol.split('/')
+        return {
+            'id': f"{base}{quote}",
+            'symbol': symbol,
+            'base': base,
+            'quote': quote,
+            'precision': {'amount': self._amount_precision, 'price': self._price_precision},
+            'limits': {'amount': {'min': 10 ** -self._amount_precision}},
+        }
+
+    def amount_to_precision(self, symbol: str, amount: float) -> str:
+        # 與 ccxt 相同 數量無條件捨去
+        scale = 10 ** self._amount_precision
+        return f"{math.floor(float(amount) * scale + 1e-9) / scale:.{self._amount_precision}f}"
+
+    def price_to_precision(self, symbol: str, price: float) -> str:
+        return f"{float(price):.{self._price_precision}f}"
+
+    async def load_markets(self, reload: bool = False) -> dict:
+        await self._request('load_markets')
+        return self.markets
+
+    async def fetch_time(self) -> int:
+        await self._request('fetch_time')
+        return self.milliseconds()
+
+    async def close(self) -> None:
+        pass
+
+    # ---- 重播 ----
+
+    def advance(self, bars: int = 1) -> None:
+        """下一根k線開始, 以剛收盤的k線觸發委託單"""
+        for _ in range(bars):
+            if self.remaining <= 0:
+                raise IndexError("no more kbars to replay")
+            for symbol in self._kbars:
+                self._match(symbol, self._kbars[symbol][self._cursor])
+            self._cursor += 1
+
+    def _match(self, symbol: str, kbar: list) -> None:
+        _, _, high, low, _, _ = kbar
+        for order in [o for o in self._orders.values() if o['symbol'] == symbol and o['status'] == 'open']:
+            if order['status'] != 'open':
+                # 同一個 OCO 的另一張已經成交
+                continue
+            stop = order.get('stopPrice')
+            if stop is not None:
+                triggered = low <= stop if order['side'] == 'sell' else high >= stop
+            else:
+                triggered = high >= order['price'] if order['side'] == 'sell' else low <= order['price']
+            if triggered:
+                self._fill(order, stop if stop is not None else order['price'])
+
+    def _last_price(self, symbol: str) -> float:
+        return self._kbars[symbol][self._cursor][1]
+
+    # ---- 市場資料 ----
+
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = '1m', since: Optional[int] = None, limit: Optional[int] = None, params={}) -> List[list]:
+        await self._request('fetch_ohlcv')
+        if timeframe != self._timeframe:
+            raise ccxt.BadRequest(f"{self.id} only replays {self._timeframe} kbars")
+
+        replay = self._kbars[symbol]
+        if since is not None:
+            begin = max(0, -(-(since - replay[0][0]) // self._tf_ms))
+        else:
+            begin = max(0, self._cursor + 1 - (limit or self._cursor + 1))
+        end = self._cursor + 1 if since is None or not limit else min(self._cursor + 1, begin + limit)
+
+        kbars = replay[begin:min(end, self._cursor)]
+        if end > self._cursor:
+            # 尚未收盤的k線只知道開盤價, 不會洩漏未來的資料
+            forming = replay[self._cursor]
+            kbars.append([forming[0], forming[1], forming[1], forming[1], forming[1], 0.0])
+        return kbars
+
+    async def fetch_ticker(self, symbol: str, params={}) -> dict:
+        await self._request('fetch_ticker')
+        price = self._last_price(symbol)
+        return {
+            'symbol': symbol,
+            'timestamp': self.milliseconds(),
+            'last': price,
+            'close': price,
+            'bid': price,
+            'ask': price,
+        }
+
+    # ---- 帳戶 ----
+
+    async def fetch_balance(self, params={}) -> dict:
+        await self._request('fetch_balance')
+        balance = {'info': {}, 'free': {}, 'used': {}, 'total': {}, 'debt': {}}
+        for currency, b in self._balances.items():
+            total = b['free'] + b['used']
+            balance[currency] = {'free': b['free'], 'used': b['used'], 'total': total, 'debt': b['debt']}
+            for field in ('free', 'used', 'total', 'debt'):
+                balance[field][currency] = balance[currency][field]
+        return balance
+
+    async def borrowMargin(self, code: str, amount, symbol: Optional[str] = None, params={}) -> dict:
+        await self._request('borrowMargin')
+        self._borrow(code, float(amount))
+        return {'currency': code, 'amount': float(amount)}
+
+    async def repayMargin(self, code: str, amount, symbol: Optional[str] = None, params={}) -> dict:
+        await self._request('repayMargin')
+        self._repay(code, float(amount))
+        return {'currency': code, 'amount': float(amount)}
+
+    def _borrow(self, code: str, amount: float) -> None:
+        self._balances[code]['free'] += amount
+        self._balances[code]['debt'] += amount
+
+    def _repay(self, code: str, amount: float) -> None:
+        b = self._balances[code]
+        amount = min(amount, b['debt'])
+        if amount > b['free'] + 1e-12:
+            raise ccxt.InsufficientFunds(f"repay {amount} {code}, free {b['free']}")
+        b['free'] -= amount
+        b['debt'] -= amount
+
+    # ---- 訂單 ----
+
+    async def create_order(self, symbol: str, type: str, side: str, amount, price=None, params={}) -> dict:
+        await self._request('create_order')
+        amount = float(amount)
+        market = self.markets[symbol]
+        if amount < market['limits']['amount']['min']:
+            raise ccxt.InvalidOrder(f"amount {amount} is less than the minimum")
+
+        if type == 'market':
+            order = self._new_order(symbol, 'market', side, amount)
+            base = market['base']
+            if side == 'sell' and params.get('sideEffectType') == 'MARGIN_BUY':
+                shortage = amount - self._balances[base]['free']
+                if shortage > 0: self._borrow(base, shortage)
+            self._fill(order, self._last_price(symbol) * (1 + self._slippage if side == 'buy' else 1 - self._slippage))
+            if side == 'buy' and params.get('sideEffectType') == 'AUTO_REPAY':
+                self._repay(base, min(amount, self._balances[base]['debt'], self._balances[base]['free']))
+            return self._public(order)
+
+        if type in ('stop_loss_limit', 'limit'):
+            stop = params.get('stopPrice')
+            order = self._new_order(symbol, type, side, amount, float(price), None if stop is None else float(stop))
+            return self._public(order)
+
+        raise ccxt.InvalidOrder(f"{self.id} does not support {type} orders")
+
+    async def sapi_post_margin_order_oco(self, params: dict) -> dict:
+        await self._request('sapi_post_margin_order_oco')
+        symbol = next(s for s, m in self.markets.items() if m['id'] == params['symbol'])
+        side = params['side'].lower()
+        amount = float(params['quantity'])
+        list_id = next(self._list_ids)
+
+        # 與 binance 相同: 停損單 與 限價單 共用數量, 一張成交或取消時 另一張也取消
+        stop = self._new_order(symbol, 'stop_loss_limit', side, amount, float(params['stopLimitPrice']), float(params['stopPrice']), list_id)
+        limit = self._new_order(symbol, 'limit_maker', side, amount, float(params['price']), None, list_id, lock=False)
+        return {
+            'orderListId': list_id,
+            'symbol': params['symbol'],
+            'listStatusType': 'EXEC_STARTED',
+            'orderReports': [self._report(stop), self._report(limit)],
+        }
+
+    async def fetch_open_orders(self, symbol: Optional[str] = None, since=None, limit=None, params={}) -> List[dict]:
+        await self._request('fetch_open_orders')
+        return [
+            self._public(order) for order in self._orders.values()
+            if order['status'] == 'open' and (symbol is None or order['symbol'] == symbol)
+        ]
+
+    async def cancel_order(self, id: str, symbol: Optional[str] = None, params={}) -> dict:
+        await self._request('cancel_order')
+        order = self._orders.get(str(id))
+        if order is None or order['status'] != 'open':
+            raise ccxt.OrderNotFound(f"order {id} is not open")
+
+        for other in self._siblings(order):
+            self._close(other, 'canceled')
+        return self._public(order)
+
+    async def watch_orders(self, symbol: Optional[str] = None, since=None, limit=None, params={}) -> List[dict]:
+        """等待到有訂單更新, 回傳上次呼叫之後的更新"""
+        key = symbol or '*'
+        while not self._events[key]:
+            self._changed.clear()
+            await self._changed.wait()
+        events, self._events[key] = self._events[key], []
+        return events
+
+    def parse_order(self, order: dict, market: Optional[dict] = None) -> dict:
+        """將 binance 原始格式的訂單 (ex. OCO 的 orderReports) 轉換成 ccxt 格式"""
+        return self._public(self._orders[str(order['orderId'])])
+
+    def _new_order(
+        self,
+        symbol: str,
+        type: str,
+        side: str,
+        amount: float,
+        price: Optional[float] = None,
+        stop: Optional[float] = None,
+        list_id: int = -1,
+        lock: bool = True,
+    ) -> dict:
+        order_id = str(next(self._order_ids))
+        market = self.markets[symbol]
+        order = {
+            'id': order_id,
+            'symbol': symbol,
+            'type': type,
+            'side': side,
+            'status': 'open',
+            'price': price,
+            'stopPrice': stop,
+            'amount': amount,
+            'filled': 0.0,
+            'remaining': amount,
+            'average': None,
+            'cost': 0.0,
+            'timestamp': self.milliseconds(),
+            'info': {
+                'symbol': market['id'],
+                'orderId': order_id,
+                'orderListId': list_id,
+                'side': side.upper(),
+            },
+        }
+        self._orders[order_id] = order
+
+        if type != 'market' and lock:
+            # 委託中的訂單鎖定餘額, OCO 兩張只鎖定一次
+            currency, locked = (market['base'], amount) if side == 'sell' else (market['quote'], amount * price)
+            b = self._balances[currency]
+            if locked > b['free'] + 1e-9:
+                del self._orders[order_id]
+                raise ccxt.InsufficientFunds(f"lock {locked} {currency}, free {b['free']}")
+            b['free'] -= locked
+            b['used'] += locked
+            order['locked'] = (currency, locked)
+
+        return order
+
+    def _siblings(self, order: dict) -> List[dict]:
+        list_id = order['info']['orderListId']
+        if list_id == -1:
+            return [order]
+        return [o for o in self._orders.values() if o['info']['orderListId'] == list_id and o['status'] == 'open']
+
+    def _unlock(self, orders: List[dict]) -> None:
+        for order in orders:
+            if 'locked' in order:
+                currency, locked = order.pop('locked')
+                self._balances[currency]['used'] -= locked
+                self._balances[currency]['free'] += locked
+
+    def _fill(self, order: dict, price: float) -> None:
+        market = self.markets[order['symbol']]
+        siblings = self._siblings(order)
+        self._unlock(siblings)
+
+        base, quote = self._balances[market['base']], self._balances[market['quote']]
+        amount, cost = order['amount'], order['amount'] * price
+        if order['side'] == 'buy':
+            if cost * (1 + self._fee) > quote['free'] + 1e-9:
+                order['status'] = 'rejected'
+                self._emit(order)
+                raise ccxt.InsufficientFunds(f"buy {cost} {market['quote']}, free {quote['free']}")
+            quote['free'] -= cost * (1 + self._fee)
+            base['free'] += amount
+        else:
+            if amount > base['free'] + 1e-9:
+                order['status'] = 'rejected'
+                self._emit(order)
+                raise ccxt.InsufficientFunds(f"sell {amount} {market['base']}, free {base['free']}")
+            base['free'] -= amount
+            quote['free'] += cost * (1 - self._fee)
+
+        order.update({'status': 'closed', 'filled': amount, 'remaining': 0.0, 'average': price, 'cost': cost})
+        self._emit(order)
+        for other in siblings:
+            if other is not order:
+                # OCO 的另一張 由交易所取消
+                self._close(other, 'expired')
+
+    def _close(self, order: dict, status: str) -> None:
+        self._unlock([order])
+        order['status'] = status
+        self._emit(order)
+
+    def _public(self, order: dict) -> dict:
+        return {k: v for k, v in order.items() if k != 'locked'}
+
+    def _emit(self, order: dict) -> None:
+        event = self._public(order)
+        self._events[order['symbol']].append(event)
+        self._events['*'].append(event)
+        self._changed.set()
+
+    def _report(self, order: dict) -> dict:
+        """binance 原始格式的訂單"""
+        return {
+            'symbol': order['info']['symbol'],
+            'orderId': int(order['id']),
+            'orderListId': order['info']['orderListId'],
+            'price': self.price_to_precision(order['symbol'], order['price']),
+            'origQty': self.amount_to_precision(order['symbol'], order['amount']),
+            'executedQty': self.amount_to_precision(order['symbol'], order['filled']),
+            'status': 'NEW',
+            'type': order['type'].upper(),
+            'side': order['info']['side'],
+            **({'stopPrice': self.price_to_precision(order['symbol'], order['stopPrice'])} if order['stopPrice'] is not None else {}),
+        }
+
+    async def _request(self, method: str) -> None:
+        self.calls[method] += 1
+        if self._latency or self._jitter:
+            await asyncio.sleep(self._latency + self._rng.uniform(0, self._jitter))
+        if self._error_rate and self._rng.random() < self._error_rate:
+            raise self._error(f"{self.id} injected {self._error.__name__} in {method}")
+
+
+class MockPool():
+    """讓 Ccxt_bot / BotRunner 使用 MockExchange 的 ExchangePool"""
+    def __init__(self, exchanges: Dict[str, MockExchange], rate: float = 1e9):
+        """
+        Args:
+            exchanges (Dict[str, MockExchange]): 以交易對區分的 MockExchange, 或以 '*' 共用同一個
+            rate (float, optional): RateLimiter 每秒的額度. Defaults to 1e9.
+        """
+        self._exchanges = exchanges
+        self._limiter = RateLimiter(rate=rate)
+
+    def get(self, exchange_id: str, api_key: str = '', secret: str = '', options: Optional[dict] = None, pro: bool = False) -> MockExchange:
+        return self._exchanges.get(exchange_id, self._exchanges.get('*'))
+
+    def limiter(self, exchange_id: str, exchange=None) -> RateLimiter:
+        return self._limiter
+
+    async def close(self) -> None:
+        pass
+
+
+def synthetic_kbars(n: int, seed: int = 0, timeframe_ms: int = 3600 * 1000, start: int = 1672531200000, price: float = 1000.0) -> List[list]:
+    """固定 seed 的隨機漫步k線 [timestamp, open, high, low, close, volume], 相同參數產生相同資料"""
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.005, n)))
+    open = np.concatenate([[price], close[:-1]])
+    spread = np.abs(rng.normal(0, 0.003, (2, n))) * close
+    high = np.maximum(open, close) + spread[0]
+    low = np.minimum(open, close) - spread[1]
+    volume = rng.lognormal(3, 1, n)
+    timestamp = start + np.arange(n, dtype=np.int64) * timeframe_ms
+
+    return [
+        [int(t), float(o), float(h), float(l), float(c), float(v)]
+        for t, o, h, l, c, v in zip(timestamp, open, high, low, close, volume)
+    ]
+
+
+async def load_test(
+    bots: int = 100,
+    bars: int = 200,
+    window: int = 300,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    max_concurrency: int = 64,
+    seed: int = 0,
+) -> Dict[str, float]:
+    """load_test
+    每個 bot 交易自己的交易對 (各自的 MockExchange), 以重播的速度一根一根k線同時執行所有 bot 的 tick 並真實下單
+
+    Returns:
+        Dict[str, float]: 吞吐量與 tick 延遲的統計
+    """
+    exchanges = {}
+    for i in range(bots):
+        symbol = f"C{i}/USDT"
+        exchanges[symbol] = MockExchange(
+            {symbol: synthetic_kbars(window + bars + 1, seed=seed + i)},
+            start=window,
+            latency=latency,
+            jitter=jitter,
+            error_rate=error_rate,
+            seed=seed + i,
+        )
+
+    hub = MarketDataHub(store=CandleStore(window=window), window=window)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    notifier = Notifier(sink=FakeSink())
+    ccxt_bots = []
+    for symbol, exchange in exchanges.items():
+        bot = Ccxt_bot(
+            api_key='',
+            secret='',
+            exchange_id=symbol,
+            symbol=symbol,
+            timeframe='1h',
+            line_token='mock',
+            sandbox=False,
+            hub=hub,
+            pool=MockPool({symbol: exchange}),
+            semaphore=semaphore,
+            notifier=notifier,
+        )
+        bot.register_strategy(KD50Strategy())
+        bot.register_strategy(ImpulseMACDStrategy())
+        ccxt_bots.append(bot)
+
+    async def tick(bot) -> Tuple[float, bool]:
+        start = time.perf_counter()
+        try:
+            await bot.do_strategies()
+            return time.perf_counter() - start, True
+        except Exception as e:
+            logger.debug(f"{bot._symbol} {type(e).__name__}, {e}")
+            return time.perf_counter() - start, False
+
+    latencies, failures = [], 0
+    start = time.perf_counter()
+    for _ in range(bars):
+        for results in await asyncio.gather(*(tick(bot) for bot in ccxt_bots)):
+            latencies.append(results[0])
+            failures += not results[1]
+        for exchange in exchanges.values():
+            exchange.advance()
+    elapsed = time.perf_counter() - start
+    await notifier.close()
+
+    orders = sum(exchange.calls['create_order'] + exchange.calls['sapi_post_margin_order_oco'] for exchange in exchanges.values())
+    return {
+        'ticks': len(latencies),
+        'failures': failures,
+        'orders': orders,
+        'elapsed': elapsed,
+        'ticks_per_second': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="以 MockExchange 重播k線 量測所有 bot 同時執行的吞吐量")
+    parser.add_argument('--bots', type=int, default=100, help="bot 數量, 每個 bot 交易不同的交易對")
+    parser.add_argument('--bars', type=int, default=200, help="重播幾根k線")
+    parser.add_argument('--window', type=int, default=300, help="開始前的歷史k線數量")
+    parser.add_argument('--latency', type=float, default=0.0, help="每個請求的延遲秒數")
+    parser.add_argument('--jitter', type=float, default=0.0, help="延遲的隨機變動秒數")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="每個請求失敗的機率")
+    parser.add_argument('--max-concurrency', type=int, default=64, help="同時執行的 bot 數量")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stats = await load_test(
+        bots=args.bots,
+        bars=args.bars,
+        window=args.window,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        seed=args.seed,
+    )
+    logger.info(", ".join(f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}" for k, v in stats.items()))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Type
+
+import numpy as np
+import pandas as pd
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.trade.backtest import Backtester
+from ccxt_bot.trade.base import Strategy
+from ccxt_bot.trade.indicator import KBAR_COLUMNS, IndicatorParams, generate_indicator
+
+
+class Optimizer():
+    """Optimizer
+
+    以 grid search 或 random search 搜尋 指標參數(IndicatorParams 的欄位) 與 策略參數(策略建構子的參數)
+    k線只放進 shared memory 一次, 每個 worker process 直接讀取, 不需要每次都 pickle DataFrame
+    每組參數 都會重新計算指標 執行策略的 backtest 並用 Backtester 模擬成交
+
+    ex.
+        optimizer = Optimizer(ImpulseMACDStrategy, datas)
+        table = optimizer.grid({'impulse_length_ma': [21, 34, 55], 'atr_multiplier': [1.0, 1.5, 2.0]})
+    """
+    def __init__(
+        self,
+        strategy_class: Type[Strategy],
+        datas: pd.DataFrame,
+        backtester: Optional[Backtester] = None,
+        metric: str = 'sharpe',
+        max_workers: Optional[int] = None,
+    ):
+        """
+        Args:
+            strategy_class (Type[Strategy]): 策略類別
+            datas (pd.DataFrame): 包含 timestamp open high low close volume 的k線資料
+            backtester (Optional[Backtester], optional): 模擬成交的設定, 預設為 Backtester().
+            metric (str, optional): 排序用的指標 sharpe, total_return 或 max_drawdown. Defaults to 'sharpe'.
+            max_workers (Optional[int], optional): process 數量, 預設為 CPU 數量.
+        """
+        self._strategy_class = strategy_class
+        self._kbars = datas[KBAR_COLUMNS].to_numpy(dtype=float)
+        self._backtester = backtester or Backtester()
+        self._metric = metric
+        self._max_workers = max_workers or os.cpu_count()
+
+    def grid(self, param_grid: Dict[str, Sequence[Any]]) -> pd.DataFrame:
+        """grid
+        測試所有參數組合
+
+        Args:
+            param_grid (Dict[str, Sequence[Any]]): 參數名稱 與 要測試的值
+
+        Returns:
+            pd.DataFrame: 依 metric 由好到壞排序的結果
+        """
+        keys = list(param_grid)
+        combos = [dict(zip(keys, values)) for values in itertools.product(*param_grid.values())]
+
+        return self.run(combos)
+
+    def random(self, param_space: Dict[str, Sequence[Any]], n_iter: int, seed: Optional[int] = None) -> pd.DataFrame:
+        """random
+        隨機抽取 n_iter 組不重複的參數組合
+
+        Args:
+            param_space (Dict[str, Sequence[Any]]): 參數名稱 與 可以選擇的值
+            n_iter (int): 抽取的組合數量
+            seed (Optional[int], optional): 亂數種子.
+
+        Returns:
+            pd.DataFrame: 依 metric 由好到壞排序的結果
+        """
+        rng = random.Random(seed)
+        n_iter = min(n_iter, int(np.prod([len(values) for values in param_space.values()])))
+
+        combos = {}
+        while len(combos) < n_iter:
+            combo = tuple(rng.choice(values) for values in param_space.values())
+            combos[combo] = dict(zip(param_space, combo))
+
+        return self.run(list(combos.values()))
+
+    def run(self, combos: List[Dict[str, Any]]) -> pd.DataFrame:
+        logger.info(f"optimize {self._strategy_class.__name__} with {len(combos)} combinations on {self._max_workers} workers")
+
+        shm = shared_memory.SharedMemory(create=True, size=self._kbars.nbytes)
+        try:
+            np.ndarray(self._kbars.shape, dtype=float, buffer=shm.buf)[:] = self._kbars
+
+            with ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, self._kbars.shape),
+            ) as executor:
+                rows = list(executor.map(
+                    _evaluate,
+                    [(self._strategy_class, params, self._backtester) for params in combos],
+                    chunksize=max(len(combos) // (self._max_workers * 4), 1),
+                ))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return pd.DataFrame(rows).sort_values(self._metric, ascending=False, ignore_index=True)
+
+
+# worker process 的 shared memory
+_worker = {}
+
+
+def _init_worker(name: str, shape: tuple) -> None:
+    shm = shared_memory.SharedMemory(name=name)
+    _worker['shm'] = shm
+    _worker['kbars'] = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    _worker['kbars'].flags.writeable = False
+
+
+def _evaluate(args: tuple) -> Dict[str, Any]:
+    strategy_class, params, backtester = args
+
+    indicator_params = {k: v for k, v in params.items() if k in IndicatorParams.__fields__}
+    strategy_params = {k: v for k, v in params.items() if k not in indicator_params}
+
+    kbars = _worker['kbars']
+    datas = pd.DataFrame(kbars[:, 1:].copy(), columns=KBAR_COLUMNS[1:], index=pd.to_datetime(kbars[:, 0].astype(np.int64), unit='ms'))
+    datas['timestamp'] = kbars[:, 0].astype(np.int64)
+    datas = generate_indicator(datas, IndicatorParams(**indicator_params))
+
+    report = backtester.run_strategy(strategy_class(**strategy_params), datas)
+
+    return {
+        **params,
+        'trades': len(report.trades['pnl']),
+        'total_return': report.total_return,
+        'max_drawdown': report.max_drawdown,
+        'sharpe': report.sharpe,
+    }
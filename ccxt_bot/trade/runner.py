@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import tomllib
+from typing import Any, Dict, List, Tuple, Type
+
+from pydantic import BaseModel, validator
+
+from ccxt_bot.core import config
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.notifier import Notifier, notifier
+from ccxt_bot.core.scheduler import BarScheduler
+from ccxt_bot.trade.base import Strategy
+from ccxt_bot.trade.book import AccountBook
+from ccxt_bot.trade.bot import Ccxt_bot
+from ccxt_bot.trade.exchange import ExchangePool, exchange_pool
+from ccxt_bot.trade.indicator import IndicatorParams
+from ccxt_bot.trade.market import MarketDataHub, market_hub
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+from ccxt_bot.trade.stream import CcxtProStream
+
+
+# 設定檔中可以使用的策略
+STRATEGIES: Dict[str, Type[Strategy]] = {
+    'KD50Strategy': KD50Strategy,
+    'ImpulseMACDStrategy': ImpulseMACDStrategy,
+}
+
+# 各交易所的 (api key, secret)
+CREDENTIALS: Dict[str, Tuple[str, str]] = {
+    'binance': (config.BINANCE_API_KEY, config.BINANCE_SECRET),
+}
+
+
+class StrategyConfig(BaseModel):
+    name: str
+    params: Dict[str, Any] = {} # 策略建構子的參數
+
+    @validator('name')
+    def check_name(cls, name: str) -> str:
+        if name not in STRATEGIES:
+            raise ValueError(f"unknown strategy {name}, available: {', '.join(STRATEGIES)}")
+        return name
+
+
+class BotConfig(BaseModel):
+    exchange: str = 'binance'
+    symbol: str
+    timeframe: str
+    percent_of_equity: float = 30
+    strategies: List[StrategyConfig]
+    indicator: IndicatorParams = IndicatorParams()
+
+
+class RunnerConfig(BaseModel):
+    max_concurrency: int = 8 # 同時執行策略的 bot 數量
+    bots: List[BotConfig]
+
+
+class BotRunner():
+    """BotRunner
+
+    依照設定檔 在同一個 process 中執行所有 bot
+    bot 共用交易所 client 與 k線/指標, 每個交易所只載入一次交易市場資訊, 並以 semaphore 限制同時執行的數量
+    真實下單時 每個 (交易所, 交易對) 以 AccountBook 訂閱委託單與持倉
+
+    ex.
+        await BotRunner.from_toml('ccxt_bot/bots.toml').run()
+    """
+    def __init__(
+        self,
+        runner_config: RunnerConfig,
+        line_token: str = config.LINE_TOKEN,
+        backtest: bool = config.BACKTEST,
+        sandbox: bool = config.SANDBOX,
+        pool: ExchangePool = exchange_pool,
+        hub: MarketDataHub = market_hub,
+        notifier: Notifier = notifier,
+    ):
+        self._config = runner_config
+        self._notifier = notifier
+        self._pool = pool
+        self._hub = hub
+        self._semaphore = asyncio.Semaphore(runner_config.max_concurrency)
+        self._bots: List[Ccxt_bot] = []
+        self._books: Dict[Tuple[str, str], AccountBook] = {}
+
+        # book 的持倉是整個交易對的淨持倉, 只有一個策略在該交易對下單時 才能用來修正策略的持倉
+        n_strategies: Dict[Tuple[str, str], int] = {}
+        for bot_config in runner_config.bots:
+            key = (bot_config.exchange, bot_config.symbol)
+            n_strategies[key] = n_strategies.get(key, 0) + len(bot_config.strategies)
+        for (exchange_id, symbol), n in n_strategies.items():
+            if n > 1 and not sandbox and not backtest:
+                logger.warning(f"{n} strategies trade {exchange_id} {symbol}, positions are not synced from the account book")
+
+        for bot_config in runner_config.bots:
+            api_key, secret = CREDENTIALS.get(bot_config.exchange, ('', ''))
+            book = None
+            if not sandbox and not backtest:
+                key = (bot_config.exchange, bot_config.symbol)
+                if key not in self._books:
+                    self._books[key] = AccountBook(
+                        pool.get(bot_config.exchange, api_key=api_key, secret=secret, pro=True),
+                        bot_config.symbol,
+                    )
+                book = self._books[key]
+            bot = Ccxt_bot(
+                api_key=api_key,
+                secret=secret,
+                exchange_id=bot_config.exchange,
+                symbol=bot_config.symbol,
+                timeframe=bot_config.timeframe,
+                line_token=line_token,
+                backtest=backtest,
+                sandbox=sandbox,
+                hub=hub,
+                indicator_params=bot_config.indicator,
+                pool=pool,
+                percent_of_equity=bot_config.percent_of_equity,
+                semaphore=self._semaphore,
+                book=book,
+                notifier=notifier,
+                position_sync=n_strategies[(bot_config.exchange, bot_config.symbol)] == 1,
+            )
+            for strategy in bot_config.strategies:
+                bot.register_strategy(STRATEGIES[strategy.name](**strategy.params))
+            self._bots.append(bot)
+
+    @classmethod
+    def from_toml(cls, path: str, **kwargs) -> 'BotRunner':
+        with open(path, 'rb') as f:
+            return cls(RunnerConfig.parse_obj(tomllib.load(f)), **kwargs)
+
+    @property
+    def bots(self) -> List[Ccxt_bot]:
+        return self._bots
+
+    async def load_markets(self) -> None:
+        """每個交易所 client 只載入一次交易市場資訊"""
+        exchanges = {id(bot._exchange): bot._exchange for bot in self._bots}
+        await asyncio.gather(*(exchange.load_markets() for exchange in exchanges.values()))
+        logger.info(f"loaded markets of {len(exchanges)} exchanges for {len(self._bots)} bots")
+
+    def start_books(self) -> List[asyncio.Task]:
+        """在背景訂閱所有 AccountBook 的委託單更新"""
+        loop = asyncio.get_running_loop()
+        return [loop.create_task(book.run()) for book in self._books.values()]
+
+    async def run(self, stream: bool = False) -> None:
+        """run
+
+        Args:
+            stream (bool, optional): 以 websocket 訂閱k線, 否則在k線收盤時向交易所請求. Defaults to False.
+        """
+        books = []
+        try:
+            await self.load_markets()
+            books = self.start_books()
+
+            if stream:
+                streams = {}
+                for bot_config in self._config.bots:
+                    if bot_config.exchange not in streams:
+                        api_key, secret = CREDENTIALS.get(bot_config.exchange, ('', ''))
+                        streams[bot_config.exchange] = CcxtProStream(
+                            self._pool.get(bot_config.exchange, api_key=api_key, secret=secret, pro=True)
+                        )
+                await asyncio.gather(*(
+                    bot.stream(streams[bot_config.exchange])
+                    for bot, bot_config in zip(self._bots, self._config.bots)
+                ))
+                return
+
+            # 以第一個 bot 的交易所時間計算k線收盤
+            scheduler = BarScheduler(exchange=self._bots[0]._exchange)
+            await asyncio.gather(*(bot.join_schedule(scheduler=scheduler) for bot in self._bots))
+            await scheduler.run()
+        finally:
+            for task in books:
+                task.cancel()
+            await self._notifier.close()
+            await self._pool.close()
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+import itertools
+import multiprocessing as mp
+import os
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ccxt_bot.core.logger import logger
+from ccxt_bot.core.metrics import tracer
+from ccxt_bot.core.scheduler import BarScheduler
+from ccxt_bot.trade.base import StrategyResult
+from ccxt_bot.trade.bot import evaluate_strategies, sync_positions
+from ccxt_bot.trade.indicator import IndicatorEngine
+from ccxt_bot.trade.runner import CREDENTIALS, STRATEGIES, BotConfig, BotRunner
+from ccxt_bot.trade.stream import CcxtProStream
+
+
+_FIELDS = 6 # timestamp open high low close volume
+_WATCH_INTERVAL = 1.0 # 檢查 worker 是否存活的間隔秒數
+
+
+class ShardSupervisor(BotRunner):
+    """ShardSupervisor
+
+    將設定檔中的 (交易所, 交易對, 週期) 分配到多個 worker process 計算指標與執行策略, 不受 GIL 限制
+    supervisor 是唯一向交易所請求與下單的 process:
+        1. k線收盤時 supervisor 取得最新的k線 寫入該k線的 shared memory (兩個 slot 輪流使用)
+        2. 以 queue 通知負責的 worker 只傳送 (slot, 數量, book 的持倉方向) 等小訊息
+        3. worker 計算指標與策略後 以各自的 pipe 回傳策略結果, supervisor 發送通知並建立訂單
+
+    同一組k線的 bot 會分配到同一個 worker, 指標只計算一次
+    worker 異常結束時 (OOM, segfault) 尚未回傳的請求會失敗, 並重新啟動該 worker,
+    重新啟動的 worker 策略狀態會被重設, 只有持倉能由 book 修正
+    """
+    def __init__(
+        self,
+        *args,
+        workers: Optional[int] = None,
+        window: int = 300,
+        limit: int = 200,
+        timeout: float = 30,
+        **kwargs,
+    ):
+        """
+        Args:
+            workers (Optional[int], optional): worker process 數量, 預設為 CPU 數量.
+            window (int, optional): 傳給 worker 的k線數量. Defaults to 300.
+            limit (int, optional): 策略使用最後幾根k線. Defaults to 200.
+            timeout (float, optional): 等待 worker 回傳結果的秒數. Defaults to 30.
+            其餘參數與 BotRunner 相同
+        """
+        super().__init__(*args, **kwargs)
+        self._window = window
+        self._limit = limit
+        self._timeout = timeout
+
+        self._series: List[Tuple[str, str, str]] = []
+        self._series_bots: Dict[int, List[int]] = {}
+        for idx, bot_config in enumerate(self._config.bots):
+            series = (bot_config.exchange, bot_config.symbol, bot_config.timeframe)
+            if series not in self._series:
+                self._series.append(series)
+            self._series_bots.setdefault(self._series.index(series), []).append(idx)
+
+        self._n_workers = max(1, min(workers or os.cpu_count(), len(self._series)))
+        self._ctx = mp.get_context('spawn')
+        self._shms: List[shared_memory.SharedMemory] = []
+        self._slots: Dict[int, int] = {}
+        self._processes: List[mp.Process] = []
+        self._requests: List[mp.Queue] = []
+        self._receivers: List[Optional[Connection]] = []
+        self._watchdog: Optional[asyncio.Task] = None
+        # seq -> (worker, future)
+        self._pending: Dict[int, Tuple[int, asyncio.Future]] = {}
+        self._running: set = set()
+        self._seq = itertools.count()
+
+    def _worker_of(self, series_id: int) -> int:
+        return series_id % self._n_workers
+
+    def start(self) -> None:
+        """建立 shared memory 並啟動 worker process"""
+        self._shms = [
+            shared_memory.SharedMemory(create=True, size=2 * self._window * _FIELDS * 8)
+            for _ in self._series
+        ]
+        self._requests = [None] * self._n_workers
+        self._processes = [None] * self._n_workers
+        self._receivers = [None] * self._n_workers
+        for worker in range(self._n_workers):
+            self._spawn(worker)
+
+        self._watchdog = asyncio.get_running_loop().create_task(self._watch_workers())
+        logger.info(f"start {self._n_workers} workers for {len(self._series)} series")
+
+    def _spawn(self, worker: int) -> None:
+        # 每次啟動都使用新的 queue, 結束的 process 可能還持有舊 queue 的 lock
+        # 結果使用每個 worker 各自的 pipe (沒有 lock), worker 結束時讀取端會收到 EOF
+        series_ids = [sid for sid in range(len(self._series)) if self._worker_of(sid) == worker]
+        self._requests[worker] = self._ctx.Queue()
+        receiver, sender = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(
+                {sid: self._shms[sid].name for sid in series_ids},
+                {sid: [(idx, self._config.bots[idx]) for idx in self._series_bots[sid]] for sid in series_ids},
+                self._window,
+                self._limit,
+                self._bots[0]._backtest,
+                self._requests[worker],
+                sender,
+            ),
+            daemon=True,
+        )
+        process.start()
+        sender.close()
+        self._processes[worker] = process
+        self._receivers[worker] = receiver
+        asyncio.get_running_loop().add_reader(receiver.fileno(), self._on_result, worker)
+
+    def _close_receiver(self, worker: int) -> None:
+        receiver = self._receivers[worker]
+        if receiver is not None:
+            asyncio.get_running_loop().remove_reader(receiver.fileno())
+            receiver.close()
+            self._receivers[worker] = None
+
+    async def _watch_workers(self) -> None:
+        while True:
+            await asyncio.sleep(_WATCH_INTERVAL)
+            for worker, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+
+                logger.error(f"worker {worker} exited with code {process.exitcode}, restart")
+                # 重新啟動的 worker 從頭建立策略, 持倉在下一次 tick 由 book 修正 (有開啟 position_sync 時)
+                # 停損價與最後訊號的時間無法還原
+                logger.warning(
+                    f"strategies of worker {worker} restart from scratch: stop prices and last signals are lost, "
+                    f"positions are resynced from the account book only when position_sync is enabled"
+                )
+                for seq, (owner, future) in list(self._pending.items()):
+                    if owner != worker:
+                        continue
+                    del self._pending[seq]
+                    if not future.done():
+                        future.set_exception(RuntimeError(f"worker {worker} exited with code {process.exitcode}"))
+                self._close_receiver(worker)
+                self._spawn(worker)
+
+    async def stop(self) -> None:
+        """結束 worker process 並釋放 shared memory"""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            try:
+                await self._watchdog
+            except asyncio.CancelledError:
+                pass
+        for queue in self._requests:
+            queue.put(None)
+        for process in self._processes:
+            await asyncio.get_running_loop().run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.terminate()
+        for worker in range(len(self._receivers)):
+            self._close_receiver(worker)
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+        self._processes, self._requests, self._receivers, self._shms, self._watchdog = [], [], [], [], None
+
+    async def tick(self, series_id: int, skip_order: bool = False) -> Dict[int, List[StrategyResult]]:
+        """tick
+        取得一組k線的最新資料, 交給 worker 執行策略 並建立訂單
+
+        Returns:
+            Dict[int, List[StrategyResult]]: 每個 bot(設定檔中的順序) 的策略結果
+        """
+        if series_id in self._running:
+            logger.warning(f"skip {self._series[series_id]}, previous tick is still running")
+            return {}
+
+        self._running.add(series_id)
+        try:
+            _, symbol, timeframe = self._series[series_id]
+            with tracer.trace('tick', symbol=symbol, timeframe=timeframe):
+                async with self._semaphore:
+                    bot = self._bots[self._series_bots[series_id][0]]
+                    with tracer.span('candles'):
+                        kbars = (await self._hub.candles(bot._exchange, symbol, timeframe))[-self._window:]
+
+                    # 兩個 slot 輪流寫入, worker 還在讀取上一次的資料時不會被覆蓋
+                    slot = self._slots[series_id] = self._slots.get(series_id, 1) ^ 1
+                    buffer = np.ndarray((2, self._window, _FIELDS), dtype=float, buffer=self._shms[series_id].buf)
+                    buffer[slot, :len(kbars)] = kbars
+
+                    # worker 在執行策略前 以 book 的持倉方向修正策略的持倉
+                    directions = {
+                        idx: direction
+                        for idx in self._series_bots[series_id]
+                        if (direction := self._bots[idx].position_direction()) is not None
+                    }
+
+                    worker = self._worker_of(series_id)
+                    seq = next(self._seq)
+                    future = asyncio.get_running_loop().create_future()
+                    self._pending[seq] = (worker, future)
+                    self._requests[worker].put((seq, series_id, slot, len(kbars), directions))
+                    try:
+                        with tracer.span('worker'):
+                            results = await asyncio.wait_for(future, timeout=self._timeout)
+                    except asyncio.TimeoutError:
+                        logger.error(f"{symbol} {timeframe} worker {worker} did not respond in {self._timeout}s")
+                        raise
+                    finally:
+                        # 逾時或被取消的請求 之後才回傳的結果會被忽略
+                        self._pending.pop(seq, None)
+
+                await asyncio.gather(*(
+                    self._bots[idx].execute(bot_results, skip_order=skip_order)
+                    for idx, bot_results in results.items()
+                ))
+
+            return results
+        finally:
+            self._running.discard(series_id)
+
+    async def run(self, stream: bool = False) -> None:
+        books = []
+        try:
+            await self.load_markets()
+            books = self.start_books()
+            self.start()
+
+            # 第一次進入會無條件先執行一次
+            await asyncio.gather(*(self.tick(sid) for sid in range(len(self._series))))
+
+            if stream:
+                await asyncio.gather(*(self._stream(sid) for sid in range(len(self._series))))
+                return
+
+            scheduler = BarScheduler(exchange=self._bots[0]._exchange)
+            for sid, (_, _, timeframe) in enumerate(self._series):
+                scheduler.register(timeframe, functools.partial(self.tick, sid))
+            await scheduler.run()
+        finally:
+            for task in books:
+                task.cancel()
+            await self.stop()
+            await self._notifier.close()
+            await self._pool.close()
+
+    async def _stream(self, series_id: int) -> None:
+        exchange_id, symbol, timeframe = self._series[series_id]
+        exchange = self._bots[self._series_bots[series_id][0]]._exchange
+        api_key, secret = CREDENTIALS.get(exchange_id, ('', ''))
+        stream = CcxtProStream(self._pool.get(exchange_id, api_key=api_key, secret=secret, pro=True))
+
+        async for closed, forming in stream.watch(symbol, timeframe):
+            await self._hub.push(exchange, symbol, timeframe, closed)
+            await self._hub.push(exchange, symbol, timeframe, forming)
+            try:
+                await self.tick(series_id)
+            except Exception as e:
+                logger.error(f"{symbol} {timeframe} {type(e).__name__}, {e.args}, {e}")
+
+    def _on_result(self, worker: int) -> None:
+        try:
+            seq, results = self._receivers[worker].recv()
+        except (EOFError, OSError):
+            # worker 已結束, 由 watchdog 重新啟動
+            asyncio.get_running_loop().remove_reader(self._receivers[worker].fileno())
+            return
+
+        _, future = self._pending.pop(seq, (None, None))
+        if future is None or future.done():
+            return
+        if isinstance(results, Exception):
+            future.set_exception(results)
+        else:
+            future.set_result(results)
+
+
+def _worker_main(
+    shm_names: Dict[int, str],
+    series_bots: Dict[int, List[Tuple[int, BotConfig]]],
+    window: int,
+    limit: int,
+    backtest: bool,
+    requests: mp.Queue,
+    results: Connection,
+) -> None:
+    shms = {sid: shared_memory.SharedMemory(name=name) for sid, name in shm_names.items()}
+    for shm in shms.values():
+        # shared memory 由 supervisor 釋放
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    buffers = {sid: np.ndarray((2, window, _FIELDS), dtype=float, buffer=shm.buf) for sid, shm in shms.items()}
+
+    engines = {}
+    strategies = {}
+    for sid, bots in series_bots.items():
+        for idx, bot_config in bots:
+            key = (sid, bot_config.indicator.json())
+            if key not in engines:
+                engines[key] = IndicatorEngine(params=bot_config.indicator, window=window)
+            strategies[idx] = [STRATEGIES[s.name](**s.params) for s in bot_config.strategies]
+
+    while (msg := requests.get()) is not None:
+        seq, sid, slot, n, directions = msg
+        try:
+            for idx, direction in directions.items():
+                sync_positions(strategies[idx], direction)
+            kbars = [[int(kbar[0]), *kbar[1:]] for kbar in buffers[sid][slot, :n].tolist()]
+
+            frames = {}
+            out = {}
+            for idx, bot_config in series_bots[sid]:
+                key = (sid, bot_config.indicator.json())
+                if key not in frames:
+                    frames[key] = engines[key].update(kbars).tail(limit)
+                out[idx] = evaluate_strategies(
+                    strategies[idx],
+                    frames[key],
+                    backtest=backtest,
+                    percent_of_equity=bot_config.percent_of_equity,
+                    label=f"{bot_config.symbol} {bot_config.timeframe}",
+                )
+            # send 會先 pickle 完整個結果, 無法 pickle 時不會寫入一半的資料
+            results.send((seq, out))
+        except Exception as e:
+            results.send((seq, RuntimeError(f"{type(e).__name__}, {e}")))
+
+    for shm in shms.values():
+        shm.close()
+    results.close()
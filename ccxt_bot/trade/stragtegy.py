@@ -2,8 +2,16 @@
 
 from typing import List
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError: # numba 為選用套件
+    njit = None
+
 from ccxt_bot.core.logger import logger
-from ccxt_bot.trade.base import StrategyResult, Suggestion
+from ccxt_bot.trade.base import SignalBatch, StrategyResult, Suggestion, match_transition
+from ccxt_bot.trade.indicator import ImpulseColor
 
 
 class KD50Strategy():
@@ -14,7 +22,12 @@ class KD50Strategy():
     以上皆非 則 發送 不做事
     
     """
-    def __init__(self):
+    def __init__(self, level: float = 50):
+        """
+        Args:
+            level (float, optional): KD 穿越的水平線. Defaults to 50.
+        """
+        self._level = level
         self._long_date = None
         self._short_date = None
     
@@ -38,7 +51,7 @@ class KD50Strategy():
         
         
         # KD轉多
-        if prev_kd < 50 and curr_kd >= 50:
+        if prev_kd < self._level and curr_kd >= self._level:
             
             stop_price = datas['low'][curr_idx]
             date = datas.index[curr_idx]
@@ -54,12 +67,13 @@ class KD50Strategy():
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Long,
                 msg = msg,
+                date=date,
                 stop_price=stop_price,
             )
             results.append(r)
         
         # KD轉空
-        elif prev_kd > 50 and curr_kd <= 50:
+        elif prev_kd > self._level and curr_kd <= self._level:
             stop_price = datas['high'][curr_idx]
             date = datas.index[curr_idx]
             
@@ -74,6 +88,7 @@ class KD50Strategy():
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Short,
                 msg = msg,
+                date=date,
                 stop_price=stop_price,
             )
             results.append(r)
@@ -81,75 +96,97 @@ class KD50Strategy():
         return results
 
     def backtest(self, datas) -> List[StrategyResult]:
+        """backtest
+        一次計算所有k線的KD穿越50, 只回傳有訊號的結果
+
+        Args:
+            datas (Union[Candles, pd.DataFrame]): 包含 kdj_k open high low 的k線資料
+
+        Returns:
+            List[StrategyResult]: 做多 與 做空 的結果
+        """
+        return self.signals(datas).to_results()
+
+    def signals(self, datas) -> SignalBatch:
+        """signals
+        與 backtest 相同, 但以 SignalBatch 回傳 不建立 StrategyResult 與訊息
+
+        Args:
+            datas (Union[Candles, pd.DataFrame]): 包含 kdj_k open high low 的k線資料
+
+        Returns:
+            SignalBatch: 做多 與 做空 的訊號
+        """
         logger.info(f"Run {self.__class__.__name__} backtest ...")
-        results = []
-        
-        for i in range(1, len(datas)):
-            
-            curr_idx = i
-            prev_kd = datas['kdj_k'][curr_idx-1]
-            curr_kd = datas['kdj_k'][curr_idx]
-            
-            result = StrategyResult(
-                name=self.__class__.__name__,
-                suggestion=Suggestion.DoNothing,
-            )
-            
-            if prev_kd < 50 and curr_kd >= 50:
-                stop_price = datas['low'][curr_idx]
-                date = datas.index[curr_idx]
-                # msg = f"KD轉多 {prev_kd} -> {curr_kd} at {date}"
-                msg = f"做多 {datas['open'][curr_idx]}, 停損 {stop_price} at {date}"
-                
-                if self._long_date and self._long_date >= date:
-                    results.append(result)
-                    continue
-                    
-                self._long_date = date
-                
-                results.append(
-                    StrategyResult(
-                        name=self.__class__.__name__,
-                        suggestion=Suggestion.Long,
-                        msg = msg,
-                        stop_price=stop_price,
-                    )
-                )
-                
-            elif prev_kd > 50 and curr_kd <= 50:
-                stop_price = datas['high'][curr_idx]
-                date = datas.index[curr_idx]
-                # msg = f"KD轉空 {prev_kd} -> {curr_kd} at {datas.index[-1]}"
-                msg = f"做空 {datas['open'][curr_idx]}, 停損 {stop_price} at {date}"
-                
-                if self._short_date and self._short_date >= date:
-                    results.append(result)
-                    continue
-            
-                self._short_date = date
-
-                results.append(
-                    StrategyResult(
-                        name=self.__class__.__name__,
-                        suggestion=Suggestion.Short,
-                        msg = msg,
-                        stop_price=stop_price,
-                    )
-                )
-            
-            results.append(result)
-        
-        return results
+
+        kd = np.asarray(datas['kdj_k'])
+        prev_kd, curr_kd = kd[:-1], kd[1:]
+        dates = datas.index[1:]
+        opens = np.asarray(datas['open'])[1:]
+        lows = np.asarray(datas['low'])[1:]
+        highs = np.asarray(datas['high'])[1:]
+
+        # KD轉多 / KD轉空
+        long_mask = (prev_kd < self._level) & (curr_kd >= self._level)
+        short_mask = (prev_kd > self._level) & (curr_kd <= self._level)
+
+        # 略過已經發送過的訊號
+        if self._long_date:
+            long_mask &= dates > self._long_date
+        if self._short_date:
+            short_mask &= dates > self._short_date
+
+        idxs = np.flatnonzero(long_mask | short_mask)
+        is_long = long_mask[idxs]
+        if is_long.any():
+            self._long_date = dates[idxs[is_long][-1]]
+        if (~is_long).any():
+            self._short_date = dates[idxs[~is_long][-1]]
+
+        stop_prices = np.where(is_long, lows[idxs], highs[idxs])
+
+        def message(i: int) -> str:
+            # msg = f"KD轉多 {prev_kd} -> {curr_kd} at {date}"
+            side = "做多" if is_long[i] else "做空"
+            return f"{side} {opens[idxs[i]]}, 停損 {stop_prices[i]} at {dates[idxs[i]]}"
+
+        return SignalBatch(
+            name=self.__class__.__name__,
+            codes=np.where(is_long, Suggestion.Long.value, Suggestion.Short.value),
+            dates=dates[idxs],
+            stop_prices=stop_prices,
+            message=message,
+        )
 
 
 class ImpulseMACDStrategy():
-    def __init__(self):
+    def __init__(self, atr_multiplier: float = 1.5):
+        """
+        Args:
+            atr_multiplier (float, optional): 停損距離開盤價幾倍的 ATR. Defaults to 1.5.
+        """
+        self._atr_multiplier = atr_multiplier
         self._position_size = 0 # 持倉數量
         self._long_stop_price = 0.0
         self._short_stop_price = 0.0
         self._long_stop_price = None
         self._short_stop_price = None
     
+    def sync_position(self, direction: int) -> None:
+        """sync_position
+        以交易所的持倉方向修正策略的持倉 (ex. 停損單已經在交易所成交)
+
+        Args:
+            direction (int): 1: 多單, -1: 空單, 0: 沒有持倉
+        """
+        if direction == self._position_size:
+            return
+        
+        logger.info(f"[{self.__class__.__name__}] sync position {self._position_size} -> {direction}")
+        self._position_size = direction
+        if direction <= 0: self._long_stop_price = None
+        if direction >= 0: self._short_stop_price = None
+    
     def run(self, datas, curr_idx = -2) -> List[StrategyResult]:
         results = []
         # curr_idx = -2
@@ -160,12 +197,12 @@ class ImpulseMACDStrategy():
         
         # logger.info(f"Run {self.__class__.__name__} at {date} {self._position_size}...")
         
-        long_cond = self._position_size <=0 and datas['mdc'][curr_idx-3] == 'red' and datas['mdc'][curr_idx-2] == 'red' and \
-                    datas['mdc'][curr_idx-1] == 'green' and datas['mdc'][curr_idx] == 'green'
-        
-                    
-        short_cond = self._position_size >=0 and datas['mdc'][curr_idx-3] == 'lime' and datas['mdc'][curr_idx-2] == 'lime' and \
-                    datas['mdc'][curr_idx-1] == 'orange' and datas['mdc'][curr_idx] == 'orange'
+        # 到 curr_idx 為止的 4 根k線, 只有一根k線 直接比較比 match_transition 快
+        mdc = np.asarray(datas['mdc'])
+        end = curr_idx + 1 if curr_idx >= 0 else len(mdc) + curr_idx + 1
+        colors = mdc[end-4:end].tolist()
+        long_cond = self._position_size <=0 and colors == _LONG_COLORS
+        short_cond = self._position_size >=0 and colors == _SHORT_COLORS
         
         # logger.info(f"{'Long' if long_cond else 'Short' if short_cond else ''} {datas['mdc'][curr_idx-3]} {datas['mdc'][curr_idx-2]} {datas['mdc'][curr_idx-1]} {datas['mdc'][curr_idx]}")
         
@@ -184,6 +221,7 @@ class ImpulseMACDStrategy():
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Long_SL if long_stop_cond else Suggestion.Long_TP,
                 msg = msg,
+                date=date,
             )
             results.append(r)
             
@@ -197,19 +235,21 @@ class ImpulseMACDStrategy():
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Short_SL if short_stop_cond else Suggestion.Short_TP,
                 msg = msg,
+                date=date,
             )
             results.append(r)
             
             self._position_size = 0
     
         if short_cond:
-            self._short_stop_price = open + 1.5 * atr
+            self._short_stop_price = open + self._atr_multiplier * atr
             msg = f"做空 {close}, 停損 {self._short_stop_price:.2f} at {date}"
             
             r = StrategyResult(
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Short,
                 msg = msg,
+                date=date,
                 stop_price=self._short_stop_price,
             )
             results.append(r)
@@ -217,13 +257,14 @@ class ImpulseMACDStrategy():
             self._position_size = -1
         
         if long_cond:
-            self._long_stop_price = open - 1.5 * atr
+            self._long_stop_price = open - self._atr_multiplier * atr
             msg = f"做多 {close}, 停損 {self._long_stop_price:.2f} at {date}"
             
             r = StrategyResult(
                 name=self.__class__.__name__,
                 suggestion=Suggestion.Long,
                 msg = msg,
+                date=date,
                 stop_price=self._long_stop_price,
             )
             results.append(r)
@@ -234,13 +275,133 @@ class ImpulseMACDStrategy():
         return results
 
     def backtest(self, datas) -> List[StrategyResult]:
+        """backtest
+        以 match_transition 一次找出所有k線的進場 pattern, 在迴圈中執行與 run 相同的持倉/停損狀態機
+        有安裝 numba 時會編譯該迴圈
+
+        Args:
+            datas (Union[Candles, pd.DataFrame]): 包含 mdc close open atr 的k線資料
+
+        Returns:
+            List[StrategyResult]: 與逐根k線執行 run 相同的結果
+        """
+        return self.signals(datas).to_results()
+
+    def signals(self, datas) -> SignalBatch:
+        """signals
+        與 backtest 相同, 但以 SignalBatch 回傳 不建立 StrategyResult 與訊息
+
+        Args:
+            datas (Union[Candles, pd.DataFrame]): 包含 mdc close open atr 的k線資料
+
+        Returns:
+            SignalBatch: 進場 停損 與 停利的訊號, 進場的停損價為 stop_prices
+        """
         logger.info(f"Run {self.__class__.__name__} backtest ...")
-        results = []
-        
-        for i in range(3, len(datas)-1):
-            
-            result = self.run(datas, curr_idx=i)
-            
-            results.extend(result)
-        
-        return results
\ No newline at end of file
+
+        codes = np.asarray(datas['mdc'])
+        long_patterns = match_transition(codes, *_LONG_TRANSITION)
+        short_patterns = match_transition(codes, *_SHORT_TRANSITION)
+        closes = np.asarray(datas['close'], dtype=float)
+        opens = np.asarray(datas['open'], dtype=float)
+        atrs = np.asarray(datas['atr'], dtype=float)
+        dates = datas.index
+
+        idxs, kinds, prices, position, long_stop, short_stop = _impulse_macd_machine(
+            long_patterns, short_patterns, closes, opens, atrs,
+            3, len(datas)-1,
+            self._position_size,
+            np.nan if self._long_stop_price is None else self._long_stop_price,
+            np.nan if self._short_stop_price is None else self._short_stop_price,
+            self._atr_multiplier,
+        )
+
+        self._position_size = int(position)
+        self._long_stop_price = None if np.isnan(long_stop) else long_stop
+        self._short_stop_price = None if np.isnan(short_stop) else short_stop
+
+        def message(i: int) -> str:
+            suggestion = Suggestion(kinds[i])
+            close, price, date = closes[idxs[i]], prices[i], dates[idxs[i]]
+            if suggestion in (Suggestion.Long_SL, Suggestion.Long_TP):
+                return f"{f'多單止損 止損價:{price:.2f}' if suggestion == Suggestion.Long_SL else '多單停利'}, 止損當前價:{close}, at {date}"
+            if suggestion in (Suggestion.Short_SL, Suggestion.Short_TP):
+                return f"{f'空單止損 止損價:{price:.2f}' if suggestion == Suggestion.Short_SL else '空單停利'} 止損當前價:{close}, at {date}"
+            if suggestion == Suggestion.Short:
+                return f"做空 {close}, 停損 {price:.2f} at {date}"
+            return f"做多 {close}, 停損 {price:.2f} at {date}"
+
+        # 停損/停利的價格只用在訊息, 進場訊號才有停損價
+        entry = (kinds == _LONG) | (kinds == _SHORT)
+        return SignalBatch(
+            name=self.__class__.__name__,
+            codes=kinds,
+            dates=dates[idxs],
+            stop_prices=np.where(entry, prices, np.nan),
+            message=message,
+        )
+
+
+# ImpulseMACD 的進場 pattern: 兩根 before 接著兩根 after
+_LONG_TRANSITION = (ImpulseColor.RED, ImpulseColor.GREEN)    # 紅紅綠綠
+_SHORT_TRANSITION = (ImpulseColor.LIME, ImpulseColor.ORANGE) # 亮綠亮綠橘橘
+_LONG_COLORS = [_LONG_TRANSITION[0]] * 2 + [_LONG_TRANSITION[1]] * 2
+_SHORT_COLORS = [_SHORT_TRANSITION[0]] * 2 + [_SHORT_TRANSITION[1]] * 2
+
+_LONG, _LONG_SL, _LONG_TP = Suggestion.Long.value, Suggestion.Long_SL.value, Suggestion.Long_TP.value
+_SHORT, _SHORT_SL, _SHORT_TP = Suggestion.Short.value, Suggestion.Short_SL.value, Suggestion.Short_TP.value
+
+
+def _impulse_macd_machine(long_patterns, short_patterns, closes, opens, atrs, start, end, position, long_stop, short_stop, atr_multiplier):
+    """ImpulseMACDStrategy.run 的持倉/停損狀態機, 停損價以 NaN 表示沒有, 進場的 pattern 由 match_transition 預先計算
+
+    Returns:
+        tuple: 訊號的k線位置, Suggestion 的值, 停損價 與 最後的 position, long_stop, short_stop
+    """
+    size = max(end - start, 0) * 2
+    idxs = np.empty(size, dtype=np.int64)
+    kinds = np.empty(size, dtype=np.int64)
+    prices = np.empty(size, dtype=np.float64)
+    n = 0
+
+    for i in range(start, end):
+        close = closes[i]
+
+        long_cond = position <= 0 and long_patterns[i]
+        short_cond = position >= 0 and short_patterns[i]
+
+        long_exit_cond = short_cond and position > 0
+        short_exit_cond = long_cond and position < 0
+
+        long_stop_cond = position > 0 and not np.isnan(long_stop) and close <= long_stop
+        short_stop_cond = position < 0 and not np.isnan(short_stop) and close >= short_stop
+
+        if long_exit_cond or long_stop_cond:
+            idxs[n], kinds[n], prices[n] = i, _LONG_SL if long_stop_cond else _LONG_TP, long_stop
+            n += 1
+            long_stop = np.nan
+            position = 0
+
+        if short_exit_cond or short_stop_cond:
+            idxs[n], kinds[n], prices[n] = i, _SHORT_SL if short_stop_cond else _SHORT_TP, short_stop
+            n += 1
+            short_stop = np.nan
+            position = 0
+
+        if short_cond:
+            short_stop = opens[i+1] + atr_multiplier * atrs[i+1]
+            idxs[n], kinds[n], prices[n] = i, _SHORT, short_stop
+            n += 1
+            position = -1
+
+        if long_cond:
+            long_stop = opens[i+1] - atr_multiplier * atrs[i+1]
+            idxs[n], kinds[n], prices[n] = i, _LONG, long_stop
+            n += 1
+            position = 1
+
+    return idxs[:n], kinds[:n], prices[:n], position, long_stop, short_stop
+
+
+if njit is not None:
+    _impulse_macd_machine = njit(cache=True)(_impulse_macd_machine)
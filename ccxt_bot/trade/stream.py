@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List, Optional, Protocol, Tuple
+
+
+class KlineStream(Protocol):
+    def watch(self, symbol: str, timeframe: str) -> AsyncIterator[Tuple[list, list]]:
+        """每根k線收盤時產生 (收盤的k線, 新的尚未收盤的k線)"""
+        ...
+
+
+async def closed_bars(updates: AsyncIterator[list]) -> AsyncIterator[Tuple[list, list]]:
+    """closed_bars
+    將k線的更新轉換成收盤事件: 出現新的開始時間時 前一根k線就已經收盤
+
+    Args:
+        updates (AsyncIterator[list]): [timestamp, open, high, low, close, volume] 的更新
+
+    Yields:
+        Tuple[list, list]: (收盤的k線, 新的尚未收盤的k線)
+    """
+    last: Optional[list] = None
+    async for kbar in updates:
+        if last is not None:
+            if kbar[0] < last[0]:
+                continue
+            if kbar[0] > last[0]:
+                yield last, list(kbar)
+        last = list(kbar)
+
+
+class CcxtProStream():
+    """CcxtProStream
+
+    使用 ccxt.pro 的 watch_ohlcv 訂閱k線 (websocket), 不需要輪詢 REST
+    """
+    def __init__(self, exchange):
+        """
+        Args:
+            exchange (ccxt_pro.Exchange): 支援 watch_ohlcv 的交易所
+        """
+        self._exchange = exchange
+
+    def watch(self, symbol: str, timeframe: str) -> AsyncIterator[Tuple[list, list]]:
+        return closed_bars(self._updates(symbol, timeframe))
+
+    async def _updates(self, symbol: str, timeframe: str) -> AsyncIterator[list]:
+        while True:
+            # 回傳最近的k線快取, 較舊的k線會被 closed_bars 忽略
+            for kbar in await self._exchange.watch_ohlcv(symbol, timeframe):
+                yield kbar
+
+
+class FakeKlineStream():
+    """FakeKlineStream
+
+    測試用的k線串流, 以 feed 推送k線的更新, close 結束所有訂閱
+    """
+    def __init__(self):
+        self._queues: Dict[Tuple[str, str], asyncio.Queue] = defaultdict(asyncio.Queue)
+
+    def feed(self, symbol: str, timeframe: str, kbars: List[list]) -> None:
+        for kbar in kbars:
+            self._queues[(symbol, timeframe)].put_nowait(kbar)
+
+    def close(self) -> None:
+        for queue in self._queues.values():
+            queue.put_nowait(None)
+
+    def watch(self, symbol: str, timeframe: str) -> AsyncIterator[Tuple[list, list]]:
+        return closed_bars(self._updates(symbol, timeframe))
+
+    async def _updates(self, symbol: str, timeframe: str) -> AsyncIterator[list]:
+        queue = self._queues[(symbol, timeframe)]
+        while (kbar := await queue.get()) is not None:
+            yield kbar
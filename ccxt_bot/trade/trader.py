@@ -1,27 +1,84 @@
-from typing import Union
+import asyncio
+import time
+from typing import Awaitable, Dict, Optional, Tuple, TypeVar, Union
 
-import ccxt
+import ccxt.async_support as ccxt_async
 
 from ccxt_bot.trade.base import StrategyResult, Suggestion
+from ccxt_bot.trade.book import AccountBook, cancel_targets
 from ccxt_bot.core.logger import logger
+from ccxt_bot.core.metrics import tracer
+from ccxt_bot.core.utils import TTLCache
+
+
+T = TypeVar('T')
 
 
 class Trader():
-    def __init__(self, exchange: ccxt.binance, symbol: str, sandbox: bool = True):
+    def __init__(
+        self,
+        exchange: ccxt_async.binance,
+        symbol: str,
+        sandbox: bool = True,
+        balance_ttl: float = 5.0,
+        ticker_ttl: float = 2.0,
+        book: Optional[AccountBook] = None,
+    ):
+        """Trader
+        依照策略結果下單, 餘額與最新價格會快取 balance_ttl / ticker_ttl 秒, 自己下單後會清除餘額的快取
+
+        Args:
+            exchange (ccxt_async.binance): 交易所
+            symbol (str): 交易對, ex. ETH/USDT
+            sandbox (bool, optional): 沙盒模式 不會真實下單. Defaults to True.
+            balance_ttl (float, optional): 餘額快取秒數. Defaults to 5.0.
+            ticker_ttl (float, optional): 最新價格快取秒數. Defaults to 2.0.
+            book (Optional[AccountBook], optional): 本機的委託單與持倉, 平倉時以此取消委託 不需要向交易所請求.
+        """
         self._exchange = exchange
         self._symbol = symbol
         self._sandbox = sandbox
+        self._ticker_ttl = ticker_ttl
+        self._cache = TTLCache(ttl=balance_ttl)
+        self._market_id = None
+        self._latency: Dict[str, float] = {}
+        self._book = book
+    
+    @property
+    def market_id(self) -> str:
+        """交易所的交易對id, ex. ETHUSDT"""
+        if self._market_id is None:
+            self._market_id = self._exchange.market(self._symbol)['id']
+        return self._market_id
+    
+    def invalidate(self) -> None:
+        """清除餘額的快取, 自己的訂單成交 借款 還款後呼叫"""
+        self._cache.invalidate('balance')
+    
+    async def refresh(self) -> None:
+        """同時更新過期的餘額與最新價格"""
+        await asyncio.gather(self.fetch_balance(), self.fetch_ticker())
     
-    def fetch_balance(self) -> tuple:
-        balance = self._exchange.fetch_balance(
-            params={'type':'margin', 'isIsolated': 'TRUE'}
+    async def fetch_ticker(self) -> dict:
+        return await self._cache.get_or_fetch(
+            'ticker',
+            lambda: self._exchange.fetch_ticker(self._symbol),
+            ttl=self._ticker_ttl,
+        )
+    
+    async def fetch_balance(self) -> tuple:
+        balance = await self._cache.get_or_fetch(
+            'balance',
+            lambda: self._exchange.fetch_balance(
+                params={'type':'margin', 'isIsolated': 'TRUE'}
+            ),
         )
 
         currency1, currency2 = self._symbol.split("/")
         
         return (currency1, currency2), (balance[currency1], balance[currency2])
     
-    def calc_amount(self):
+    async def calc_amount(self):
         """獲取目前可以交易的金額
    
    
@@ -31,8 +88,10 @@ class Trader():
         ETH: {'free': 0.7, 'used': 0.0, 'total': 0.7, 'debt': 0}
         USDT: {'free': 464.1267597, 'used': 0.0, 'total': 464.1267597, 'debt': 900}
         """
-        _, currency_balance = self.fetch_balance()
-        ticker = self._exchange.fetch_ticker(self._symbol)
+        (_, currency_balance), ticker = await asyncio.gather(
+            self.fetch_balance(),
+            self.fetch_ticker(),
+        )
         # logger.debug(f"ticker :{ticker['close']}"
         
         bal_total_0 = currency_balance[0]["total"] - currency_balance[0]["debt"]
@@ -40,13 +99,16 @@ class Trader():
         
         return bal_total_1/ticker["close"] + bal_total_0
         
-    def create_order(self, result: StrategyResult, percent_of_equity: int = 30):
+    async def create_order(self, result: StrategyResult, percent_of_equity: int = 30):
         """ create_order
         
         做多: 還款 獲取目前總體餘額 並使用其30%買入
         做空: 還款 獲取目前總體餘額 並使用其30%買入
         做多平倉(TP or SL): 將目前ETH/USDT的ETH total變成0，也就是賣出所有可以用的餘額
         做空平倉(TP or SL): 
+        
+        停利/停損價的精度在開倉前計算, 開倉單回應後立即送出保護單; 平倉時同時取消所有委託
+        每個步驟的耗時記錄在 latency
 
         Args:
             suggestion (Suggestion): _description_
@@ -55,258 +117,267 @@ class Trader():
             logger.debug(f'suggest do nothing 💎')
             return
         
-        (currency1, currency2), currency_balance = self.fetch_balance()
+        try:
+            await self._create_order(result, percent_of_equity)
+        finally:
+            # 訂單可能已經成交 餘額需要重新獲取
+            if not self._sandbox: self.invalidate()
+    
+    async def _create_order(self, result: StrategyResult, percent_of_equity: int = 30):
+        self._latency = {}
+        start = time.perf_counter()
+        
+        # 餘額與最新價格一起更新
+        await self._timed('refresh', self.refresh())
         amount = self._exchange.amount_to_precision(
             self._symbol,
-            self.calc_amount() * percent_of_equity/100
+            await self.calc_amount() * percent_of_equity/100
         )
         
-        if result.suggestion == Suggestion.Long:
-            # 將獲取總額 並計算3成的錢
-            # 買入訂單 並設定OCO或停損單
-
+        handlers = {
+            Suggestion.Long: self._open_long,
+            Suggestion.Short: self._open_short,
+            Suggestion.Long_SL: self._close_long,
+            Suggestion.Long_TP: self._close_long,
+            Suggestion.Short_SL: self._close_short,
+            Suggestion.Short_TP: self._close_short,
+        }
+        if result.suggestion not in handlers:
+            logger.error(f'Unknown Suggestion: {result.suggestion}')
+            return
+        
+        logger.info(
+            f"""
+            [{result.suggestion.name}] (sandbox mode {"🟢"if self._sandbox else "🔴"}):
+                amount:      {amount}
+                Stop Loss:   {result.stop_price}
+                Take profit: {result.tp_price}
+            """
+        )
+        
+        # 如果是沙盒模式 則跳過購買
+        if self._sandbox: return
+        
+        try:
+            await handlers[result.suggestion](result, amount)
+        finally:
+            self._latency['total'] = (time.perf_counter() - start) * 1000
             logger.info(
-                f"""
-                [{result.suggestion.name}] (sandbox mode {"🟢"if self._sandbox else "🔴"}):
-                    amount:      {amount}
-                    Stop Loss:   {result.stop_price}
-                    Take profit: {result.tp_price}
-                """
+                f"[{result.suggestion.name}] latency: "
+                + ", ".join(f"{step} {ms:.0f}ms" for step, ms in self._latency.items())
             )
-            
-            # 如果是沙盒模式 則跳過購買
-            if self._sandbox: return
-            
-            # 市價買入
-            order = self._exchange.create_order(
+    
+    @property
+    def latency(self) -> Dict[str, float]:
+        """最後一次 create_order 每個步驟的耗時(ms)
+        
+        unprotected 為送出開倉單到停損單被交易所接受的時間, 這段時間倉位沒有停損
+        """
+        return dict(self._latency)
+    
+    async def _timed(self, step: str, aw: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            with tracer.span('order', leg=step):
+                return await aw
+        finally:
+            self._latency[step] = (time.perf_counter() - start) * 1000
+    
+    def _bracket_prices(self, result: StrategyResult) -> Tuple[Optional[str], Optional[str]]:
+        """在送出開倉單之前 先計算好停利/停損價的精度, 成交後可以立即送出保護單"""
+        tp_price = None if result.tp_price is None else self._exchange.price_to_precision(self._symbol, result.tp_price)
+        stop_price = None if result.stop_price is None else self._exchange.price_to_precision(self._symbol, result.stop_price)
+        return tp_price, stop_price
+    
+    def _record(self, order: dict) -> None:
+        """以下單的回應更新本機的委託單, 不需要等待 watch_orders"""
+        if self._book is None:
+            return
+        # OCO 的回應是交易所的原始格式
+        for report in order.get('orderReports', [order]):
+            if report is not order:
+                report = self._exchange.parse_order(report, self._exchange.market(self._symbol))
+            self._book.apply(report)
+    
+    def _filled(self, order: dict, amount: str) -> str:
+        """保護單的數量, 以開倉單回應的成交量為準"""
+        if order.get('filled'):
+            return self._exchange.amount_to_precision(self._symbol, order['filled'])
+        return amount
+    
+    async def _open_long(self, result: StrategyResult, amount: str) -> None:
+        """市價買入 並設定OCO或停損單"""
+        tp_price, stop_price = self._bracket_prices(result)
+        
+        start = time.perf_counter()
+        # 市價買入
+        order = await self._timed('entry', self._exchange.create_order(
+            symbol=self._symbol, 
+            type='market',
+            side='buy',
+            amount=amount,
+            price=None,
+            params={
+                # 'clientOrderId': 'ccxt_bot',
+                'type':'margin',
+            }
+        ))
+        if stop_price is not None:
+            protect = await self._timed('protect', self._protect('sell', self._filled(order, amount), tp_price, stop_price))
+            self._latency['unprotected'] = (time.perf_counter() - start) * 1000
+            tracer.observe('order', self._latency['unprotected'] / 1000, leg='unprotected')
+            self._record(protect)
+        self._record(order)
+        logger.info(f"[Buy]: {order}")
+    
+    async def _open_short(self, result: StrategyResult, amount: str) -> None:
+        """借款賣出 並設定OCO或停損單"""
+        tp_price, stop_price = self._bracket_prices(result)
+        
+        start = time.perf_counter()
+        # 借款並市價賣出, MARGIN_BUY 由交易所在同一個請求中借款 不需要先等待 borrowMargin
+        order = await self._timed('entry', self._exchange.create_order(
+            symbol=self._symbol, 
+            type='market',
+            side='sell',
+            amount=amount,
+            price=None,
+            params={
+                # 'clientOrderId': 'ccxt_bot',
+                'type':'margin',
+                'sideEffectType': 'MARGIN_BUY',
+            }
+        ))
+        if stop_price is not None:
+            protect = await self._timed('protect', self._protect('buy', self._filled(order, amount), tp_price, stop_price))
+            self._latency['unprotected'] = (time.perf_counter() - start) * 1000
+            tracer.observe('order', self._latency['unprotected'] / 1000, leg='unprotected')
+            self._record(protect)
+        self._record(order)
+        logger.info(f"[Sell]: {order}")
+    
+    async def _protect(self, side: str, amount: str, tp_price: Optional[str], stop_price: str) -> dict:
+        """送出保護單, 有停利價為OCO 否則為停損單"""
+        if tp_price is not None:
+            # https://github.com/ccxt/ccxt/issues/8241
+            # https://github.com/ccxt/ccxt/blob/7b9badf71d85bf67f8d8799d3f17fdc1516718be/python/ccxt/abstract/binance.py#L199
+            order = await self._exchange.sapi_post_margin_order_oco({
+                    'symbol': self.market_id,
+                    'side': side.upper(),  # SELL, BUY
+                    'quantity': amount,
+                    'price': tp_price,
+                    'stopPrice': stop_price,
+                    'stopLimitPrice': stop_price,  # If provided, stopLimitTimeInForce is required
+                    'stopLimitTimeInForce': 'GTC',  # GTC, FOK, IOC
+                    # 'listClientOrderId': exchange.uuid(),  # A unique Id for the entire orderList
+                    # 'limitClientOrderId': exchange.uuid(),  # A unique Id for the limit order
+                    # 'limitIcebergQty': exchangea.amount_to_precision(symbol, limit_iceberg_quantity),
+                    # 'stopClientOrderId': exchange.uuid()  # A unique Id for the stop loss/stop loss limit leg
+                    # 'stopIcebergQty': exchange.amount_to_precision(symbol, stop_iceberg_quantity),
+                    # 'newOrderRespType': 'ACK',  # ACK, RESULT, FULL
+            })
+            logger.info(f"[{side.capitalize()}] OCO: {order}")
+            return order
+        
+        order = await self._exchange.create_order(
+            symbol=self._symbol,
+            type='stop_loss_limit',
+            side=side,
+            amount=amount,
+            price=stop_price, 
+            params={
+                # 'clientOrderId': 'ccxt_bot',
+                'type':'margin',
+                'stopPrice': stop_price
+            }
+        )
+        logger.info(f"[{side.capitalize()}] SL: {order}")
+        return order
+    
+    async def _cancel_open_orders(self, side: str) -> None:
+        """同時取消所有 side 方向的委託單, OCO 的兩張委託只需要取消一次
+        
+        有與交易所校正過的 book 時 直接取消本機記錄的委託單, 不需要請求委託單
+        """
+        if self._book is not None and self._book.synced:
+            order_ids = self._book.cancel_targets(side)
+        else:
+            # 獲取委託單
+            open_orders = await self._timed('fetch_orders', self._exchange.fetch_open_orders(
                 symbol=self._symbol, 
-                type='market',
-                side='buy',
-                amount=amount,
-                price=None,
                 params={
-                    # 'clientOrderId': 'ccxt_bot',
                     'type':'margin',
                 }
-            )
-            logger.info(f"[Buy]: {order}")
-            # 如果有停損價 市價買入
-            if result.stop_price is not None and result.tp_price is not None:
-                # https://github.com/ccxt/ccxt/issues/8241
-                # https://github.com/ccxt/ccxt/blob/7b9badf71d85bf67f8d8799d3f17fdc1516718be/python/ccxt/abstract/binance.py#L199
-                order = self._exchange.sapi_post_margin_order_oco({
-                        'symbol': self._exchange.market(self._symbol)['id'],
-                        'side': 'SELL',  # SELL, BUY
-                        'quantity': amount,
-                        'price': self._exchange.price_to_precision(self._symbol, result.tp_price),
-                        'stopPrice': self._exchange.price_to_precision(self._symbol, result.stop_price),
-                        'stopLimitPrice': self._exchange.price_to_precision(self._symbol, result.stop_price),  # If provided, stopLimitTimeInForce is required
-                        'stopLimitTimeInForce': 'GTC',  # GTC, FOK, IOC
-                        # 'listClientOrderId': exchange.uuid(),  # A unique Id for the entire orderList
-                        # 'limitClientOrderId': exchange.uuid(),  # A unique Id for the limit order
-                        # 'limitIcebergQty': exchangea.amount_to_precision(symbol, limit_iceberg_quantity),
-                        # 'stopClientOrderId': exchange.uuid()  # A unique Id for the stop loss/stop loss limit leg
-                        # 'stopIcebergQty': exchange.amount_to_precision(symbol, stop_iceberg_quantity),
-                        # 'newOrderRespType': 'ACK',  # ACK, RESULT, FULL
-                })
-                logger.info(f"[Buy] OCO: {order}")
-            elif result.stop_price is not None:
-                stop_price = self._exchange.price_to_precision(self._symbol, result.stop_price)
-                
-                order = self._exchange.create_order(
-                    symbol=self._symbol,
-                    type='stop_loss_limit',
-                    side='sell',
-                    amount=amount,
-                    price=stop_price, 
-                    params={
-                        # 'clientOrderId': 'ccxt_bot',
-                        'type':'margin',
-                        'stopPrice': stop_price
-                    }
-                )
-            
-                logger.info(f"[Buy] SL: {order}")
-        elif result.suggestion == Suggestion.Short:
-            # 將獲取總額 並計算3成的錢
-            # 借款賣出訂單 並設定OCO或停損單
-            
-            logger.info(
-                f"""
-                [{result.suggestion.name}] (sandbox mode {"🟢"if self._sandbox else "🔴"}):
-                    amount:      {amount}
-                    Stop Loss:   {result.stop_price}
-                    Take profit: {result.tp_price}
-                """
-            )
-            
-            # 如果是沙盒模式 則跳過購買
-            if self._sandbox: return
-            
-            # 借款
-            self._exchange.borrowMargin (
-                currency1, # ETH
-                amount,
+            ))
+            order_ids = cancel_targets(open_orders, self._symbol, side)
+        
+        results = await self._timed('cancel', asyncio.gather(
+            *(self._exchange.cancel_order(order_id, self._symbol) for order_id in order_ids),
+            return_exceptions=True,
+        ))
+        for order_id, result in zip(order_ids, results):
+            # 委託已經成交或被取消
+            if isinstance(result, Exception):
+                logger.warning(f"cancel {order_id} {type(result).__name__}, {result}")
+            elif self._book is not None:
+                self._book.remove(order_id)
+        
+        # 取消委託後 可用餘額改變
+        self.invalidate()
+    
+    async def _close_long(self, result: StrategyResult, amount: str) -> None:
+        """取消委託賣出單 並賣出所有可以用的餘額"""
+        await self._cancel_open_orders('sell')
+        
+        _, currency_balance = await self._timed('balance', self.fetch_balance())
+        amount = self._exchange.amount_to_precision(
+            self._symbol,
+            currency_balance[0]['free']
+        )
+        if float(amount) <= 0:
+            # 停損/停利單已經在交易所成交
+            logger.info(f"[{result.suggestion.name}] no position to close")
+            return
+        
+        order = await self._timed('exit', self._exchange.create_order(
                 symbol=self._symbol,
-                params={
-                    # 'clientOrderId': 'ccxt_bot',
-                    'type':'margin',
-                    'isIsolated': 'FALSE'
-                }
-            )
-            # 市價賣出
-            order = self._exchange.create_order(
-                symbol=self._symbol, 
                 type='market',
                 side='sell',
                 amount=amount,
-                price=None,
+                price=None, 
                 params={
                     # 'clientOrderId': 'ccxt_bot',
                     'type':'margin',
                 }
-            )
-            logger.info(f"[Sell]: {order}")
-            # 如果有停損價 市價買入
-            if result.stop_price is not None and result.tp_price is not None:
-                # https://github.com/ccxt/ccxt/issues/8241
-                # https://github.com/ccxt/ccxt/blob/7b9badf71d85bf67f8d8799d3f17fdc1516718be/python/ccxt/abstract/binance.py#L199
-                order = self._exchange.sapi_post_margin_order_oco({
-                        'symbol': self._exchange.market(self._symbol)['id'],
-                        'side': 'BUY',  # SELL, BUY
-                        'quantity': amount,
-                        'price': self._exchange.price_to_precision(self._symbol, result.tp_price),
-                        'stopPrice': self._exchange.price_to_precision(self._symbol, result.stop_price),
-                        'stopLimitPrice': self._exchange.price_to_precision(self._symbol, result.stop_price),  # If provided, stopLimitTimeInForce is required
-                        'stopLimitTimeInForce': 'GTC',  # GTC, FOK, IOC
-                        # 'listClientOrderId': exchange.uuid(),  # A unique Id for the entire orderList
-                        # 'limitClientOrderId': exchange.uuid(),  # A unique Id for the limit order
-                        # 'limitIcebergQty': exchangea.amount_to_precision(symbol, limit_iceberg_quantity),
-                        # 'stopClientOrderId': exchange.uuid()  # A unique Id for the stop loss/stop loss limit leg
-                        # 'stopIcebergQty': exchange.amount_to_precision(symbol, stop_iceberg_quantity),
-                        # 'newOrderRespType': 'ACK',  # ACK, RESULT, FULL
-                })
-                logger.info(f"[Sell] OCO: {order}")
-            elif result.stop_price is not None:
-                stop_price = self._exchange.price_to_precision(self._symbol, result.stop_price)
-                
-                order = self._exchange.create_order(
-                    symbol=self._symbol,
-                    type='stop_loss_limit',
-                    side='buy',
-                    amount=amount,
-                    price=stop_price, 
-                    params={
-                        # 'clientOrderId': 'ccxt_bot',
-                        'type':'margin',
-                        'stopPrice': stop_price
-                    }
-                )
-            
-                logger.info(f"[Sell] SL: {order}")
-        elif result.suggestion == Suggestion.Long_SL or result.suggestion == Suggestion.Long_TP:
-            logger.info(
-                f"""
-                [{result.suggestion.name}] (sandbox mode {"🟢"if self._sandbox else "🔴"}):
-                    amount:      {amount}
-                    Stop Loss:   {result.stop_price}
-                    Take profit: {result.tp_price}
-                """
-            )
-            
-            # 如果是沙盒模式 則跳過購買
-            if self._sandbox: return
-            
-            # 獲取委託單
-            open_orders = self._exchange.fetch_open_orders(
-                symbol=self._symbol, 
-                params={
-                    'type':'margin',
-                }
-            )
-            
-            # 取消 委託賣出單
-            for order in open_orders:
-                if order['info']['symbol'] == self._exchange.market(self._symbol)['id'] and \
-                    order['info']['side'] == 'SELL':
-                    self._exchange.cancel_order(order['info']['orderId'])
-            
-            _, currency_balance = self.fetch_balance()
+            ))
+        self._record(order)
+        logger.info(f"[Sell]: {order}")
+    
+    async def _close_short(self, result: StrategyResult, amount: str) -> None:
+        """取消委託買入單 買回做空的幣並還款"""
+        await self._cancel_open_orders('buy')
+        
+        _, currency_balance = await self._timed('balance', self.fetch_balance())
+        
+        if currency_balance[0]['debt'] > 0:
             amount = self._exchange.amount_to_precision(
                 self._symbol,
-                currency_balance[0]['free']
+                currency_balance[0]['debt']
             )
             
-            order = self._exchange.create_order(
+            # 買回做空的幣, AUTO_REPAY 成交後由交易所還款 不需要再等待 repayMargin
+            # https://docs.ccxt.com/#/?id=borrow-and-repay-margin
+            order = await self._timed('exit', self._exchange.create_order(
                     symbol=self._symbol,
                     type='market',
-                    side='sell',
+                    side='buy',
                     amount=amount,
                     price=None, 
                     params={
                         # 'clientOrderId': 'ccxt_bot',
                         'type':'margin',
+                        'sideEffectType': 'AUTO_REPAY',
                     }
-                )
-            
-        elif result.suggestion == Suggestion.Short_SL or result.suggestion == Suggestion.Short_TP:
-            logger.info(
-                f"""
-                [{result.suggestion.name}] (sandbox mode {"🟢"if self._sandbox else "🔴"}):
-                    amount:      {amount}
-                    Stop Loss:   {result.stop_price}
-                    Take profit: {result.tp_price}
-                """
-            )
-            
-            # 如果是沙盒模式 則跳過購買
-            if self._sandbox: return
-            
-            # 獲取委託單
-            open_orders = self._exchange.fetch_open_orders(
-                symbol=self._symbol, 
-                params={
-                    'type':'margin',
-                }
-            )
-            # 取消 委託買入單
-            for order in open_orders:
-                if order['info']['symbol'] == self._exchange.market(self._symbol)['id'] and \
-                    order['info']['side'] == 'BUY':
-                    self._exchange.cancel_order(order['info']['orderId'])
-            
-            (currency1, currency2), currency_balance = self.fetch_balance()
-            
-            if currency_balance[0]['debt'] > 0:
-                amount = self._exchange.amount_to_precision(
-                    self._symbol,
-                    currency_balance[0]['debt']
-                )
-                
-                # 買回做空的幣
-                order = self._exchange.create_order(
-                        symbol=self._symbol,
-                        type='market',
-                        side='buy',
-                        amount=amount,
-                        price=None, 
-                        params={
-                            # 'clientOrderId': 'ccxt_bot',
-                            'type':'margin',
-                        }
-                    )
-        
-                # 還款 
-                # #https://docs.ccxt.com/#/?id=borrow-and-repay-margin
-                self._exchange.repayMargin(
-                    code=currency1,
-                    amount=amount,
-                    symbol=self._symbol,
-                    params={
-                        'type':'margin',
-                        'isIsolated': 'FALSE'
-                    }
-                )
-        else:
-            logger.error(f'Unknown Suggestion: {result.suggestion}')
-            return
\ No newline at end of file
+                ))
+            self._record(order)
+            logger.info(f"[Buy]: {order}")
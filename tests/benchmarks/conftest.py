@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import os
+
+import pandas as pd
+import pytest
+
+from ccxt_bot.trade.indicator import generate_indicator, to_frame
+from ccxt_bot.trade.mock_exchange import synthetic_kbars
+
+SIZES = [300, 10_000]
+# 1M 根k線需要數分鐘 與數 GB 記憶體, 以 BENCH_LARGE=1 開啟
+if os.environ.get('BENCH_LARGE') == '1':
+    SIZES.append(1_000_000)
+
+
+_frames = {}
+
+
+def kbar_frame(n: int) -> pd.DataFrame:
+    if ('kbars', n) not in _frames:
+        _frames[('kbars', n)] = to_frame(synthetic_kbars(n))
+    return _frames[('kbars', n)]
+
+
+def indicator_frame(n: int) -> pd.DataFrame:
+    if ('indicator', n) not in _frames:
+        _frames[('indicator', n)] = generate_indicator(kbar_frame(n).copy())
+    return _frames[('indicator', n)]
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}bars")
+def size(request) -> int:
+    return request.param
+
+
+@pytest.fixture
+def event_loop_runner():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
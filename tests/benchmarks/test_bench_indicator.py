@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from ccxt_bot.trade.indicator import calc_smma, calc_zlema, generate_indicator
+from tests.benchmarks.conftest import kbar_frame
+
+
+def test_generate_indicator(benchmark, size):
+    df = kbar_frame(size)
+
+    result = benchmark.pedantic(generate_indicator, setup=lambda: ((df.copy(),), {}), rounds=5, warmup_rounds=1)
+
+    assert len(result) == size
+
+
+def test_calc_smma(benchmark, size):
+    src = kbar_frame(size)['close']
+
+    result = benchmark(calc_smma, src, 34)
+
+    assert len(result) == size
+
+
+def test_calc_zlema(benchmark, size):
+    src = kbar_frame(size)['close']
+
+    result = benchmark(calc_zlema, src, 9)
+
+    assert len(result) == size
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from ccxt_bot.trade.backtest import Backtester
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+from tests.benchmarks.conftest import indicator_frame
+
+
+def test_kd50_backtest(benchmark, size):
+    df = indicator_frame(size)
+
+    # 策略會記住已經發送過的訊號, 每一輪使用新的策略
+    benchmark.pedantic(lambda strategy: strategy.backtest(df), setup=lambda: ((KD50Strategy(),), {}), rounds=10, warmup_rounds=1)
+
+
+def test_impulse_macd_backtest(benchmark, size):
+    df = indicator_frame(size)
+
+    benchmark.pedantic(lambda strategy: strategy.backtest(df), setup=lambda: ((ImpulseMACDStrategy(),), {}), rounds=10, warmup_rounds=1)
+
+
+def test_impulse_macd_run(benchmark):
+    df = indicator_frame(300).tail(200)
+    strategy = ImpulseMACDStrategy()
+
+    benchmark(strategy.run, df)
+
+
+def test_kd50_signals_backtester(benchmark, size):
+    """以 SignalBatch 回測, 不建立 StrategyResult 與訊息"""
+    df = indicator_frame(size)
+    backtester = Backtester()
+
+    benchmark.pedantic(lambda strategy: backtester.run_strategy(strategy, df), setup=lambda: ((KD50Strategy(),), {}), rounds=10, warmup_rounds=1)
+
+
+def test_kd50_results_backtester(benchmark, size):
+    """以 List[StrategyResult] 回測, 與 test_kd50_signals_backtester 比較"""
+    df = indicator_frame(size)
+    backtester = Backtester()
+
+    benchmark.pedantic(lambda strategy: backtester.run(df, strategy.backtest(df)), setup=lambda: ((KD50Strategy(),), {}), rounds=10, warmup_rounds=1)
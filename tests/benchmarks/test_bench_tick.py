@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from ccxt_bot.trade.bot import Ccxt_bot
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.market import MarketDataHub
+from ccxt_bot.trade.mock_exchange import MockExchange, MockPool, synthetic_kbars
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+
+ROUNDS = 100
+
+
+def test_do_strategies_tick(benchmark, event_loop_runner):
+    """一次完整的 tick: 取得新收盤的k線 增量計算指標 執行策略 (不下單)"""
+    # 每一輪前進一根k線, 每次 tick 都是新收盤的k線
+    exchange = MockExchange({'ETH/USDT': synthetic_kbars(300 + ROUNDS + 10)}, start=300)
+    bot = Ccxt_bot(
+        api_key='',
+        secret='',
+        exchange_id='bench',
+        symbol='ETH/USDT',
+        timeframe='1h',
+        line_token='',
+        hub=MarketDataHub(store=CandleStore()),
+        pool=MockPool({'*': exchange}),
+    )
+    bot.register_strategy(KD50Strategy())
+    bot.register_strategy(ImpulseMACDStrategy())
+    event_loop_runner(bot.do_strategies(skip_order=True))
+
+    def tick():
+        exchange.advance()
+        event_loop_runner(bot.do_strategies(skip_order=True))
+
+    benchmark.pedantic(tick, rounds=ROUNDS, warmup_rounds=5)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+from typing import List, Optional
+
+from ccxt_bot.core.ratelimit import RateLimiter
+
+HOUR = 3600 * 1000
+
+
+class FakeExchange():
+    """FakeExchange
+
+    回放給定的k線, fetch_ohlcv 的請求記錄在 calls: (timeframe, since, limit)
+    now 為交易所時間(ms), 沒有指定時為最後一根k線開盤後 10ms
+    """
+    def __init__(self, kbars: List[list], now: Optional[int] = None, id: str = 'fake', delay: bool = False):
+        """
+        Args:
+            kbars (List[list]): [timestamp, open, high, low, close, volume] 的列表
+            now (Optional[int], optional): 交易所時間(ms).
+            id (str, optional): 交易所的id. Defaults to 'fake'.
+            delay (bool, optional): fetch_ohlcv 是否先讓出 event loop, 用來測試同時的請求. Defaults to False.
+        """
+        self.id = id
+        self.kbars = kbars
+        self.now = now
+        self.delay = delay
+        self.calls = []
+        self.load_markets_calls = 0
+
+    def parse_timeframe(self, timeframe: str) -> int:
+        return int(timeframe[:-1]) * 3600
+
+    def milliseconds(self) -> int:
+        return self.now if self.now is not None else self.kbars[-1][0] + 10
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        self.calls.append((timeframe, since, limit))
+        if self.delay:
+            await asyncio.sleep(0)
+        kbars = [k for k in self.kbars if since is None or k[0] >= since]
+        return kbars[:limit] if since is not None else kbars[-limit:]
+
+    async def load_markets(self):
+        self.load_markets_calls += 1
+
+
+class FakePool():
+    """所有交易所都回傳同一個 FakeExchange 的 ExchangePool"""
+    def __init__(self, exchange: Optional[FakeExchange] = None):
+        self.exchange = exchange or FakeExchange([], id='binance')
+
+    def get(self, exchange_id, api_key='', secret='', options=None, pro=False):
+        return self.exchange
+
+    def limiter(self, exchange_id, exchange=None):
+        return RateLimiter(rate=1000)
+
+    async def close(self):
+        pass
+
+
+def make_kbars(n: int, start: int = 0, close: Optional[float] = 1.5) -> List[list]:
+    """n 根 1h 的k線, close 為 None 時收盤價逐根遞增 (1.0, 2.0, ...)"""
+    return [[start + i * HOUR, 1.0, 2.0, 0.5, 1.0 + i if close is None else close, 10.0] for i in range(n)]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from ccxt_bot.trade.archive import CandleArchive, records_to_frame
+from ccxt_bot.trade.candle import CandleStore
+from tests.conftest import HOUR, FakeExchange, make_kbars
+
+
+def test_append_and_read(tmp_path):
+    archive = CandleArchive(str(tmp_path))
+
+    assert archive.append('fake', 'ETH/USDT', '1h', make_kbars(5)) == 5
+    # 重複的k線會被忽略
+    assert archive.append('fake', 'ETH/USDT', '1h', make_kbars(8)) == 3
+
+    kbars = archive.read('fake', 'ETH/USDT', '1h', start=2 * HOUR, end=4 * HOUR)
+
+    assert kbars['timestamp'].tolist() == [2 * HOUR, 3 * HOUR, 4 * HOUR]
+    assert isinstance(kbars.base, np.memmap) or isinstance(kbars, np.memmap)
+    assert len(CandleArchive(str(tmp_path)).read('fake', 'ETH/USDT', '1h')) == 8
+    assert records_to_frame(kbars)['close'].tolist() == [1.5, 1.5, 1.5]
+
+
+@pytest.mark.asyncio
+async def test_backfill(tmp_path):
+    exchange = FakeExchange(make_kbars(25), now=24 * HOUR + 10)
+    archive = CandleArchive(str(tmp_path))
+
+    assert await archive.backfill(exchange, 'ETH/USDT', '1h', since=0, limit=10) == 24
+    assert exchange.calls == [('1h', 0, 10), ('1h', 10 * HOUR, 10), ('1h', 20 * HOUR, 10)]
+
+    # 只下載新收盤的k線
+    exchange.kbars = make_kbars(27)
+    exchange.now = 26 * HOUR + 10
+    assert await archive.backfill(exchange, 'ETH/USDT', '1h', limit=10) == 2
+
+
+@pytest.mark.asyncio
+async def test_candle_store_warm_up(tmp_path):
+    archive = CandleArchive(str(tmp_path))
+    archive.append('fake', 'ETH/USDT', '1h', make_kbars(9))
+
+    exchange = FakeExchange(make_kbars(11), now=10 * HOUR + 10)
+    store = CandleStore(window=5, archive=archive)
+    kbars = await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    assert exchange.calls == [('1h', 8 * HOUR, 4)]
+    assert [k[0] for k in kbars] == [i * HOUR for i in range(6, 11)]
+    assert archive.last_timestamp('fake', 'ETH/USDT', '1h') == 9 * HOUR
+
+
+def test_partial_record(tmp_path):
+    archive = CandleArchive(str(tmp_path))
+    archive.append('fake', 'ETH/USDT', '1h', make_kbars(3))
+    # 模擬寫入中斷
+    with open(archive.path('fake', 'ETH/USDT', '1h'), 'ab') as f:
+        f.write(b'\0' * 10)
+
+    archive = CandleArchive(str(tmp_path))
+    assert len(archive.read('fake', 'ETH/USDT', '1h')) == 3
+    assert archive.append('fake', 'ETH/USDT', '1h', make_kbars(5)) == 2
+    assert archive.read('fake', 'ETH/USDT', '1h')['timestamp'].tolist() == [i * HOUR for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_candle_store_backfills_gap(tmp_path):
+    archive = CandleArchive(str(tmp_path))
+    archive.append('fake', 'ETH/USDT', '1h', make_kbars(9))
+
+    # 停機超過 window, 重新下載只拿到最後 window 根
+    exchange = FakeExchange(make_kbars(30), now=29 * HOUR + 10)
+    store = CandleStore(window=5, archive=archive)
+    kbars = await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    assert [k[0] for k in kbars] == [i * HOUR for i in range(25, 30)]
+    assert archive.read('fake', 'ETH/USDT', '1h')['timestamp'].tolist() == [i * HOUR for i in range(29)]
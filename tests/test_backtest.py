@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ccxt_bot.trade.backtest import Backtester
+from ccxt_bot.trade.base import SignalBatch, StrategyResult, Suggestion
+
+
+@pytest.fixture
+def datas() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            'open':  [100.0, 100.0, 110.0, 120.0, 130.0, 120.0],
+            'high':  [101.0, 111.0, 121.0, 131.0, 131.0, 121.0],
+            'low':   [99.0, 99.0, 109.0, 119.0, 95.0, 119.0],
+            'close': [100.0, 110.0, 120.0, 130.0, 120.0, 120.0],
+        },
+        index=pd.date_range('2023-01-01', periods=6, freq='H'),
+    )
+
+
+def test_backtest_stop_loss(datas: pd.DataFrame):
+    results = [
+        StrategyResult(name='test', suggestion=Suggestion.Long, date=datas.index[0], stop_price=98.0),
+    ]
+
+    report = Backtester(initial_capital=1000, percent_of_equity=50, fee_rate=0).run(datas, results)
+
+    # 在第二根開盤 100 買入 5 單位, 第五根最低價觸發停損 98
+    assert report.trades['entry_idx'].tolist() == [1]
+    assert report.trades['exit_idx'].tolist() == [4]
+    assert report.trades['reason'].tolist() == [Suggestion.Long_SL.value]
+    assert report.trades['pnl'].tolist() == [-10.0]
+    np.testing.assert_allclose(report.equity, [1000, 1050, 1100, 1150, 990, 990])
+    assert report.max_drawdown == pytest.approx(990 / 1150 - 1)
+
+
+def test_backtest_reverse_with_fee(datas: pd.DataFrame):
+    results = [
+        StrategyResult(name='test', suggestion=Suggestion.Short, date=datas.index[0]),
+        StrategyResult(name='test', suggestion=Suggestion.Long, date=datas.index[1]),
+        StrategyResult(name='test', suggestion=Suggestion.Long_TP, date=datas.index[3]),
+    ]
+
+    report = Backtester(initial_capital=1000, percent_of_equity=100, fee_rate=0.01).run(datas, results)
+
+    # 空單 100 -> 110 平倉, 反手做多 110 -> 130
+    long_qty = (1000 - 121) / 110
+    assert report.trades['side'].tolist() == [-1, 1]
+    assert report.trades['exit_price'].tolist() == [110.0, 130.0]
+    np.testing.assert_allclose(report.trades['fee'], [210 * 10 * 0.01, 240 * long_qty * 0.01])
+    np.testing.assert_allclose(report.trades['pnl'], [-100 - 21, 20 * long_qty - 240 * long_qty * 0.01])
+    assert report.equity[-1] == pytest.approx(1000 + report.trades['pnl'].sum())
+
+
+def test_backtest_signal_batch(datas: pd.DataFrame):
+    results = [
+        StrategyResult(name='test', suggestion=Suggestion.Short, date=datas.index[0], tp_price=95.0),
+        StrategyResult(name='test', suggestion=Suggestion.DoNothing, date=datas.index[1]),
+        StrategyResult(name='test', suggestion=Suggestion.Long, date=None),
+        StrategyResult(name='test', suggestion=Suggestion.Long, date=datas.index[2], stop_price=100.0),
+    ]
+    batch = SignalBatch.from_results(results)
+
+    assert batch.to_results() == results
+
+    backtester = Backtester(initial_capital=1000, fee_rate=0.001)
+    expected, report = backtester.run(datas, results), backtester.run(datas, batch)
+    assert report.trades['side'].tolist() == [-1, 1]
+    for col in report.trades:
+        np.testing.assert_array_equal(report.trades[col], expected.trades[col])
+    np.testing.assert_array_equal(report.equity, expected.equity)
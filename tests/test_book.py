@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from ccxt_bot.trade.base import StrategyResult, Suggestion
+from ccxt_bot.trade.book import AccountBook, cancel_targets
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy
+from ccxt_bot.trade.trader import Trader
+from tests.test_trader import FakeMarginExchange
+
+
+def _order(order_id, side, status='open', filled=0.0, list_id=-1, symbol='ETH/USDT'):
+    return {
+        'id': order_id, 'symbol': symbol, 'side': side, 'status': status,
+        'filled': filled, 'info': {'orderListId': list_id},
+    }
+
+
+class FakeUserStream(FakeMarginExchange):
+    def __init__(self):
+        super().__init__(delay=0)
+        self.updates = asyncio.Queue()
+        self.balance = {'ETH': {'total': 0.0, 'debt': 0.0}, 'USDT': {'total': 500, 'debt': 0.0}}
+
+    async def fetch_balance(self, params=None):
+        await self._request('fetch_balance')
+        return self.balance
+
+    async def watch_orders(self, symbol):
+        return [await self.updates.get()]
+
+
+def test_apply_fills_once():
+    book = AccountBook(FakeUserStream(), 'ETH/USDT', dust=0.001)
+
+    book.apply(_order('1', 'sell', status='open', filled=0.05))
+    book.apply(_order('1', 'sell', status='closed', filled=0.1))
+    # 重複的事件 與其他交易對 不影響持倉
+    book.apply(_order('1', 'sell', status='closed', filled=0.1))
+    book.apply(_order('2', 'buy', status='closed', filled=1.0, symbol='BTC/USDT'))
+
+    assert book.position == pytest.approx(-0.1)
+    assert book.direction == -1
+    assert book.open_orders() == []
+
+
+def test_cancel_targets_oco():
+    book = AccountBook(FakeUserStream(), 'ETH/USDT')
+    for order in [_order('1', 'buy', list_id=7), _order('2', 'buy', list_id=7), _order('3', 'buy'), _order('4', 'sell')]:
+        book.apply(order)
+
+    assert book.cancel_targets('buy') == ['1', '3']
+    assert cancel_targets(book.open_orders(), 'ETH/USDT', 'sell') == ['4']
+
+    book.remove('1')
+    assert [order['id'] for order in book.open_orders()] == ['3', '4']
+
+
+@pytest.mark.asyncio
+async def test_run_and_reconcile():
+    exchange = FakeUserStream()
+    exchange.open_orders = [_order('1', 'sell', list_id=7), _order('2', 'sell', list_id=7)]
+    exchange.balance['ETH'] = {'total': 0.3, 'debt': 0.0}
+    book = AccountBook(exchange, 'ETH/USDT', dust=0.001)
+
+    task = asyncio.get_running_loop().create_task(book.run())
+    await asyncio.sleep(0.01)
+    assert book.synced and book.position == 0.3 and book.direction == 1
+
+    # 停損單在交易所成交
+    exchange.updates.put_nowait(_order('2', 'sell', status='closed', filled=0.3, list_id=7))
+    exchange.updates.put_nowait(_order('1', 'sell', status='expired', list_id=7))
+    await asyncio.sleep(0.01)
+    assert book.direction == 0 and book.open_orders() == []
+
+    exchange.open_orders = []
+    exchange.balance['ETH'] = {'total': 0.0, 'debt': 0.0}
+    await book.reconcile()
+    assert book.position == 0.0
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+@pytest.mark.asyncio
+async def test_trader_exit_with_book():
+    exchange = FakeMarginExchange(delay=0)
+    exchange.open_orders = [_order('1', 'buy', list_id=7), _order('2', 'buy', list_id=7)]
+    book = AccountBook(exchange, 'ETH/USDT')
+    await book.reconcile()
+    exchange.calls.clear()
+
+    trader = Trader(exchange=exchange, symbol="ETH/USDT", sandbox=False, book=book)
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Short_TP))
+
+    names = [name for name, _, _ in exchange.calls]
+    assert 'fetch_open_orders' not in names
+    assert [args[0] for name, args, _ in exchange.calls if name == 'cancel_order'] == ['1']
+    assert book.open_orders() == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('suggestion', [Suggestion.Short_SL, Suggestion.Short_TP])
+async def test_close_short_flattens_book(suggestion):
+    exchange = FakeUserStream()
+    exchange.balance['ETH'] = {'total': 0.0, 'debt': 0.1}
+    book = AccountBook(exchange, 'ETH/USDT', dust=0.001)
+    await book.reconcile()
+    assert book.direction == -1
+
+    trader = Trader(exchange=exchange, symbol="ETH/USDT", sandbox=False, book=book)
+    await trader.create_order(StrategyResult(name='test', suggestion=suggestion))
+
+    # AUTO_REPAY 的買回單成交後 不需要等待 watch_orders
+    assert book.position == pytest.approx(0.0)
+    assert book.direction == 0
+
+
+def test_sync_position():
+    strategy = ImpulseMACDStrategy()
+    strategy._position_size = 1
+    strategy._long_stop_price = 900.0
+
+    strategy.sync_position(0)
+
+    assert strategy._position_size == 0
+    assert strategy._long_stop_price is None
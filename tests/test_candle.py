@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ccxt_bot.trade.candle import CandleBuffer, CandleStore
+from tests.conftest import HOUR, FakeExchange, make_kbars
+
+
+@pytest.mark.asyncio
+async def test_fetch_incremental():
+    exchange = FakeExchange(make_kbars(10), now=9 * HOUR + 10)
+    store = CandleStore(window=5)
+
+    assert [k[0] for k in await store.fetch(exchange, 'ETH/USDT', '1h')] == [i * HOUR for i in range(5, 10)]
+
+    # 最後一根收盤 並產生新的k線
+    exchange.kbars = make_kbars(11)
+    exchange.kbars[9][4] = 3.0
+    exchange.now = 10 * HOUR + 10
+    kbars = await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    assert exchange.calls[-1] == ('1h', 9 * HOUR, 3)
+    assert [k[0] for k in kbars] == [i * HOUR for i in range(6, 11)]
+    assert kbars[-2][4] == 3.0
+
+
+@pytest.mark.asyncio
+async def test_fetch_refresh_when_stale():
+    exchange = FakeExchange(make_kbars(10), now=9 * HOUR)
+    store = CandleStore(window=5)
+    await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    exchange.kbars = make_kbars(21)
+    # 距離上次更新太久
+    exchange.now = 20 * HOUR
+    kbars = await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    assert exchange.calls[-1] == ('1h', None, 5)
+    assert [k[0] for k in kbars] == [i * HOUR for i in range(16, 21)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_refresh_on_gap():
+    exchange = FakeExchange(make_kbars(10), now=9 * HOUR)
+    store = CandleStore(window=5)
+    await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    # 交易所少了 9h 的k線
+    exchange.kbars = make_kbars(9) + make_kbars(2, start=10 * HOUR)
+    exchange.now = 11 * HOUR
+    kbars = await store.fetch(exchange, 'ETH/USDT', '1h')
+
+    assert exchange.calls[-1] == ('1h', None, 5)
+    assert kbars[-1][0] == 11 * HOUR
+
+
+
+def _rows(n: int, start: int = 0) -> list:
+    return [[(start + i) * HOUR, float(start + i)] for i in range(n)]
+
+
+def test_candle_buffer_ring():
+    buffer = CandleBuffer(['timestamp', 'close'], capacity=4)
+    rows = _rows(20)
+
+    for i, row in enumerate(rows[:-1]):
+        buffer.append(row)
+        buffer.set_forming(rows[i + 1])
+        datas = buffer.view()
+        assert datas['timestamp'].tolist() == [r[0] for r in rows[max(0, i - 2):i + 2]]
+        assert datas['close'].tolist() == [r[1] for r in rows[max(0, i - 2):i + 2]]
+
+    assert len(buffer) == 4
+    assert datas['timestamp'].dtype == np.int64
+    assert datas.index[-1] == pd.Timestamp(rows[-1][0], unit='ms')
+    assert datas.tail(2)['close'].tolist() == [18.0, 19.0]
+    with pytest.raises(ValueError):
+        datas['close'][0] = 0.0
+
+
+def test_candle_buffer_view_survives_compaction():
+    buffer = CandleBuffer(['timestamp', 'close'], capacity=3)
+    for row in _rows(5):
+        buffer.append(row)
+    before = buffer.view()
+
+    # 寫到陣列尾端時 搬移到新的陣列, 之前的 view 不會被覆蓋
+    for row in _rows(10, start=5):
+        buffer.append(row)
+
+    assert before['close'].tolist() == [2.0, 3.0, 4.0]
+    df = buffer.view().to_pandas()
+    assert df['close'].tolist() == [12.0, 13.0, 14.0]
+    assert df.index.name == 'dt'
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ccxt_bot.trade.exchange import ExchangePool
+
+
+@pytest.mark.asyncio
+async def test_exchange_pool_shares_client():
+    pool = ExchangePool()
+
+    client = pool.get('binance', api_key='key', secret='secret')
+
+    assert pool.get('binance', api_key='key', secret='secret') is client
+    assert pool.get('binance', api_key='other', secret='secret') is not client
+
+    await pool.close()
+    assert pool.get('binance', api_key='key', secret='secret') is not client
+    await pool.close()
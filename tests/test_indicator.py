@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ccxt_bot.trade.indicator import IndicatorEngine, calc_smma, generate_indicator
+from ccxt_bot.trade.mock_exchange import synthetic_kbars
+
+
+@pytest.fixture
+def kbars() -> list:
+    return synthetic_kbars(400)
+
+
+def test_incremental_indicator(kbars: list):
+    engine = IndicatorEngine(window=300)
+
+    for end in range(300, len(kbars) + 1, 7):
+        df = engine.update(kbars[end - 300:end])
+
+    assert len(df) == 300
+    assert df['timestamp'][-1] == kbars[end - 1][0]
+    assert engine.verify(df) == {}
+
+
+def test_generate_indicator_macd_columns(kbars: list):
+    df = pd.DataFrame(kbars, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df = generate_indicator(df)
+
+    # pandas_ta 回傳 MACD, MACDh, MACDs 的順序, 欄位必須依名稱對應
+    tail = df.iloc[50:][['macd', 'macd_signal', 'macd_hist']].astype(float)
+    np.testing.assert_allclose(tail['macd_hist'], tail['macd'] - tail['macd_signal'], rtol=1e-10, atol=1e-10)
+    # 信號線為 MACD 的 EMA, 起始值的影響衰減後才比對
+    signal = tail['macd'].ewm(span=9, adjust=False).mean()
+    np.testing.assert_allclose(tail['macd_signal'][100:], signal[100:], rtol=1e-6)
+
+
+def test_calc_smma():
+    rng = np.random.default_rng(1)
+    src = pd.Series(1000 + np.cumsum(rng.normal(0, 5, 1000)))
+    length = 34
+
+    # 原本逐筆計算的版本
+    expected = src.rolling(length).mean()
+    for i in range(length, len(src)):
+        expected[i] = (expected[i-1] * (length - 1) + src[i])/length
+
+    np.testing.assert_allclose(calc_smma(src, length), expected, rtol=1e-10)
+    assert calc_smma(src[:10], length).isna().all()
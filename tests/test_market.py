@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.market import MarketDataHub, resample
+from ccxt_bot.trade.mock_exchange import synthetic_kbars
+from tests.conftest import HOUR, FakeExchange
+
+
+@pytest.fixture
+def kbars() -> list:
+    return synthetic_kbars(2000, start=0)
+
+
+def test_resample(kbars: list):
+    # 從 1h 開始, 第一根 4h 不完整
+    derived = resample(kbars[1:11], 4 * HOUR)
+
+    df = pd.DataFrame(kbars[4:11], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df.index = pd.to_datetime(df['timestamp'], unit='ms')
+    expected = df.resample('4h').agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+
+    assert [k[0] for k in derived] == [4 * HOUR, 8 * HOUR]
+    np.testing.assert_allclose([k[1:] for k in derived], expected.to_numpy())
+
+
+@pytest.mark.asyncio
+async def test_hub_fetch_once(kbars: list):
+    exchange = FakeExchange(kbars, now=1999 * HOUR + 10, delay=True)
+    hub = MarketDataHub(store=CandleStore(), window=100)
+    hub.subscribe(exchange, 'ETH/USDT', '4h')
+    hub.subscribe(exchange, 'ETH/USDT', '1h')
+
+    df_1h, df_4h, df_4h_again = await asyncio.gather(
+        hub.get(exchange, 'ETH/USDT', '1h'),
+        hub.get(exchange, 'ETH/USDT', '4h'),
+        hub.get(exchange, 'ETH/USDT', '4h'),
+    )
+
+    # 4h 由 1h 推導, 只請求一次
+    assert exchange.calls == [('1h', None, 404)]
+    assert df_4h is df_4h_again
+    assert len(df_1h) == len(df_4h) == 100
+    assert df_4h['timestamp'][-1] == 1996 * HOUR
+    assert df_4h['close'][-1] == kbars[-1][4]
+
+    # 同一根k線內不會再請求
+    await hub.get(exchange, 'ETH/USDT', '1h')
+    assert len(exchange.calls) == 1
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+import pytest
+
+from ccxt_bot.core.metrics import Histogram, Tracer
+
+
+def test_histogram_cumulative():
+    histogram = Histogram(buckets=(0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 1.0):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [('0.01', 2), ('0.1', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+
+
+@pytest.mark.asyncio
+async def test_trace_spans(tmp_path):
+    trace_file = tmp_path / 'trace.jsonl'
+    metrics_file = tmp_path / 'metrics.prom'
+    tracer = Tracer(trace_file=str(trace_file), metrics_file=str(metrics_file))
+
+    async def leg(name):
+        with tracer.span('order', leg=name):
+            await asyncio.sleep(0.01)
+
+    with tracer.trace('tick', symbol='ETH/USDT', timeframe='4h'):
+        with tracer.span('fetch'):
+            pass
+        # gather 的 task 也屬於同一個 trace
+        await asyncio.gather(leg('entry'), leg('protect'))
+    with pytest.raises(ValueError):
+        with tracer.trace('tick', symbol='ETH/USDT', timeframe='4h'):
+            raise ValueError()
+    tracer.close()
+
+    records = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [r['span'] for r in records] == ['fetch', 'order', 'order', 'tick', 'tick']
+    assert {r['trace'] for r in records[:4]} == {1}
+    assert records[1]['parent'] == 'tick' and records[1]['symbol'] == 'ETH/USDT'
+    assert records[1]['duration_ms'] >= 10
+    assert records[-1]['error'] == 'ValueError'
+
+    assert tracer.histogram('tick', symbol='ETH/USDT', timeframe='4h').count == 2
+    assert tracer.histogram('order', symbol='ETH/USDT', timeframe='4h', leg='entry').count == 1
+
+    text = metrics_file.read_text()
+    assert '# TYPE ccxt_bot_span_seconds histogram' in text
+    assert 'ccxt_bot_span_seconds_bucket{span="order",leg="entry",symbol="ETH/USDT",timeframe="4h",le="+Inf"} 1' in text
+    assert 'ccxt_bot_span_seconds_count{span="tick",symbol="ETH/USDT",timeframe="4h"} 2' in text
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import ccxt
+import pytest
+
+from ccxt_bot.core.ratelimit import retry
+from ccxt_bot.trade.base import StrategyResult, Suggestion
+from ccxt_bot.trade.mock_exchange import MockExchange, load_test, synthetic_kbars
+from ccxt_bot.trade.trader import Trader
+from tests.conftest import HOUR
+
+
+def _kbars(n, price=1000.0):
+    return [[i * HOUR, price, price + 1, price - 1, price, 1.0] for i in range(n)]
+
+
+@pytest.mark.asyncio
+async def test_fetch_ohlcv_does_not_leak_future():
+    replay = synthetic_kbars(10)
+    exchange = MockExchange({'ETH/USDT': replay}, start=5)
+
+    kbars = await exchange.fetch_ohlcv('ETH/USDT', '1h', limit=3)
+    assert kbars[:2] == replay[3:5]
+    assert kbars[-1][0] == replay[5][0]
+    # 尚未收盤的k線只有開盤價
+    assert kbars[-1][1:5] == [kbars[-1][1]] * 4
+    assert exchange.milliseconds() == kbars[-1][0] + 1
+
+    exchange.advance()
+    since = await exchange.fetch_ohlcv('ETH/USDT', '1h', since=kbars[-1][0])
+    assert len(since) == 2 and since[0][2] >= since[0][1]
+
+    with pytest.raises(ccxt.BadRequest):
+        await exchange.fetch_ohlcv('ETH/USDT', '4h')
+
+
+@pytest.mark.asyncio
+async def test_long_bracket_take_profit():
+    kbars = _kbars(10)
+    kbars[5] = [5 * HOUR, 1000.0, 1150.0, 999.0, 1120.0, 1.0]
+    exchange = MockExchange({'ETH/USDT': kbars}, start=5, balance={'USDT': 1000}, fee=0)
+    trader = Trader(exchange=exchange, symbol='ETH/USDT', sandbox=False)
+
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Long, stop_price=950, tp_price=1100))
+    balance = await exchange.fetch_balance()
+    position = balance['ETH']['total']
+    assert position > 0
+    assert len(await exchange.fetch_open_orders('ETH/USDT')) == 2
+
+    # 停利成交, 停損單由交易所取消
+    exchange.advance()
+    balance = await exchange.fetch_balance()
+    assert balance['ETH']['total'] == pytest.approx(0)
+    assert balance['USDT']['total'] == pytest.approx(1000 + position * 100)
+    assert await exchange.fetch_open_orders('ETH/USDT') == []
+    assert [e['status'] for e in await exchange.watch_orders('ETH/USDT')][-2:] == ['closed', 'expired']
+
+    # 沒有持倉時 平倉不下單
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Long_SL))
+    assert exchange.calls['create_order'] == 1
+
+
+@pytest.mark.asyncio
+async def test_short_borrow_and_repay():
+    exchange = MockExchange({'ETH/USDT': _kbars(10)}, start=5, balance={'USDT': 1000}, fee=0)
+    trader = Trader(exchange=exchange, symbol='ETH/USDT', sandbox=False)
+
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Short, stop_price=1050, tp_price=900))
+    balance = await exchange.fetch_balance()
+    assert balance['ETH']['debt'] > 0
+    assert balance['USDT']['used'] > 0
+
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Short_TP))
+    balance = await exchange.fetch_balance()
+    assert balance['ETH']['debt'] == pytest.approx(0)
+    assert balance['USDT']['total'] == pytest.approx(1000)
+    assert await exchange.fetch_open_orders('ETH/USDT') == []
+
+
+@pytest.mark.asyncio
+async def test_injected_errors_are_deterministic():
+    async def failures(seed):
+        exchange = MockExchange({'ETH/USDT': _kbars(10)}, start=5, error_rate=0.3, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                await exchange.fetch_ticker('ETH/USDT')
+                results.append(True)
+            except ccxt.RequestTimeout:
+                results.append(False)
+        return results
+
+    assert await failures(1) == await failures(1)
+    assert not all(await failures(1))
+
+    exchange = MockExchange({'ETH/USDT': _kbars(10)}, start=5, error_rate=0.5, seed=1)
+    ticker = await retry(lambda: exchange.fetch_ticker('ETH/USDT'), attempts=10, base=0.001)
+    assert ticker['last'] == 1000.0
+
+
+@pytest.mark.asyncio
+async def test_load_test():
+    stats = await load_test(bots=3, bars=5, window=100)
+
+    assert stats['ticks'] == 15
+    assert stats['ticks_per_second'] > 0
+    assert stats['p99_ms'] >= stats['p50_ms']
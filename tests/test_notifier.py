@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+
+from ccxt_bot.core.notifier import FakeSink, Notifier, chunk_message
+
+
+class SlowSink(FakeSink):
+    def send(self, token: str, msg: str) -> None:
+        time.sleep(0.2)
+        super().send(token, msg)
+
+
+def test_chunk_message():
+    msg = '\n'.join(['a' * 6] * 5)
+
+    chunks = chunk_message(msg, max_chars=15)
+
+    assert chunks == ['aaaaaa\naaaaaa', 'aaaaaa\naaaaaa', 'aaaaaa']
+    assert chunk_message('b' * 25, max_chars=10) == ['b' * 10, 'b' * 10, 'b' * 5]
+
+
+@pytest.mark.asyncio
+async def test_notify_coalesce():
+    sink = FakeSink()
+    notifier = Notifier(sink=sink, linger=0.05, max_chars=20)
+
+    for i in range(5):
+        notifier.notify('token', f"signal {i}")
+    notifier.notify('other', 'hello')
+    notifier.notify('', 'no token')
+    await notifier.close()
+
+    assert sink.messages == [
+        ('token', 'signal 0\nsignal 1'),
+        ('token', 'signal 2\nsignal 3'),
+        ('token', 'signal 4'),
+        ('other', 'hello'),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_notify_does_not_block():
+    sink = SlowSink()
+    notifier = Notifier(sink=sink, linger=0)
+
+    start = time.monotonic()
+    notifier.notify('token', 'msg')
+    await asyncio.sleep(0.01)
+    # 發送在背景的 thread 執行, event loop 不會被阻塞
+    assert time.monotonic() - start < 0.1
+    assert sink.messages == []
+
+    await notifier.close()
+    assert sink.messages == [('token', 'msg')]
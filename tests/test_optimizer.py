@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from ccxt_bot.trade.archive import KBAR_DTYPE, records_to_frame
+from ccxt_bot.trade.mock_exchange import synthetic_kbars
+from ccxt_bot.trade.optimizer import Optimizer
+from ccxt_bot.trade.stragtegy import KD50Strategy
+
+
+@pytest.fixture(scope='module')
+def datas():
+    kbars = np.array([tuple(kbar) for kbar in synthetic_kbars(500)], dtype=KBAR_DTYPE)
+    return records_to_frame(kbars)
+
+
+def test_grid(datas):
+    optimizer = Optimizer(KD50Strategy, datas, max_workers=2)
+    table = optimizer.grid({'kdj_length': [9, 14], 'level': [40, 50, 60]})
+
+    assert len(table) == 6
+    assert sorted(zip(table['kdj_length'], table['level'])) == [(9, 40), (9, 50), (9, 60), (14, 40), (14, 50), (14, 60)]
+    assert table['sharpe'].is_monotonic_decreasing
+
+
+def test_random(datas):
+    optimizer = Optimizer(KD50Strategy, datas, metric='total_return', max_workers=2)
+    space = {'kdj_length': [9, 14, 21], 'level': [40, 50, 60]}
+
+    table = optimizer.random(space, n_iter=5, seed=1)
+    again = optimizer.random(space, n_iter=5, seed=1)
+
+    assert len(table) == 5
+    assert not table.duplicated(['kdj_length', 'level']).any()
+    assert table.equals(again)
+    assert table['total_return'].is_monotonic_decreasing
+    # 超過所有組合數量時 只測試每組一次
+    assert len(optimizer.random(space, n_iter=20, seed=1)) == 9
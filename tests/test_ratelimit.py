@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import ccxt
+import pytest
+
+from ccxt_bot.core.ratelimit import Priority, RateLimiter, request_priority, retry
+
+
+@pytest.mark.asyncio
+async def test_acquire_rate():
+    limiter = RateLimiter(rate=100, burst=0.02)
+
+    start = time.monotonic()
+    for _ in range(6):
+        await limiter.acquire(1)
+    # 前 2 個使用累積的額度, 之後每 10ms 一個
+    assert 0.03 < time.monotonic() - start < 0.1
+    assert limiter.stats[Priority.MARKET_DATA].count == 6
+    assert limiter.stats[Priority.MARKET_DATA].max > 0
+
+
+@pytest.mark.asyncio
+async def test_order_before_market_data():
+    limiter = RateLimiter(rate=100, burst=0.01)
+    await limiter.acquire(1)
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire(1, priority)
+        order.append(name)
+
+    tasks = [asyncio.create_task(request(f"kline{i}", Priority.MARKET_DATA)) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request('order', Priority.ORDER)))
+    await asyncio.gather(*tasks)
+
+    assert order == ['order', 'kline0', 'kline1', 'kline2']
+    assert limiter.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_attach_priority():
+    class FakeExchange(ccxt.Exchange):
+        async def fetch2(self, path, api='public', method='GET', params={}, headers=None, body=None, config={}):
+            await self.throttle(config.get('cost', 1))
+
+    limiter = RateLimiter(rate=1000)
+    exchange = FakeExchange()
+    limiter.attach(exchange)
+
+    await exchange.fetch2('klines', 'public', 'GET', config={'cost': 2})
+    await exchange.fetch2('margin/order', 'sapi', 'POST')
+
+    assert limiter.stats[Priority.MARKET_DATA].count == 1
+    assert limiter.stats[Priority.ORDER].count == 1
+    assert request_priority('private', 'GET', 'account') == Priority.ACCOUNT
+
+
+@pytest.mark.asyncio
+async def test_retry_bounded(mocker):
+    sleep = mocker.patch('ccxt_bot.core.ratelimit.asyncio.sleep')
+    limiter = RateLimiter(rate=10)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        raise ccxt.RateLimitExceeded('429')
+
+    with pytest.raises(ccxt.RateLimitExceeded):
+        await retry(fetch, attempts=4, base=1, cap=3, limiter=limiter)
+
+    assert len(calls) == 4
+    # full jitter, 每次等待不超過 min(cap, base * 2^n)
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert all(0 <= delay <= bound for delay, bound in zip(delays, [1, 2, 3]))
+    assert limiter._paused_until > 0
+
+
+@pytest.mark.asyncio
+async def test_retry_success():
+    results = iter([ccxt.RequestTimeout('timeout'), 'ok'])
+
+    async def fetch():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert await retry(fetch, base=0.001) == 'ok'
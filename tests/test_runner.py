@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import pydantic
+import pytest
+
+from ccxt_bot.core import config
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.market import MarketDataHub
+from ccxt_bot.trade.runner import BotRunner, RunnerConfig
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+from tests.conftest import FakePool
+
+
+@pytest.mark.asyncio
+async def test_runner_from_default_config():
+    pool = FakePool()
+    runner = BotRunner.from_toml(config.BOTS_CONFIG, pool=pool, hub=MarketDataHub(store=CandleStore()))
+
+    assert [(bot._symbol, bot._timeframe) for bot in runner.bots] == [('ETH/USDT', '4h'), ('ETH/USDT', '1h')]
+    assert [type(s) for s in runner.bots[1]._strategies] == [KD50Strategy, ImpulseMACDStrategy]
+    assert runner.bots[1]._strategies[1]._atr_multiplier == 1.5
+
+    # 共用的 client 只載入一次交易市場資訊
+    await runner.load_markets()
+    assert pool.exchange.load_markets_calls == 1
+
+
+def test_runner_unknown_strategy():
+    with pytest.raises(pydantic.ValidationError):
+        RunnerConfig.parse_obj({
+            'bots': [{'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'Nope'}]}],
+        })
+
+
+@pytest.mark.asyncio
+async def test_runner_position_sync_per_symbol():
+    runner_config = RunnerConfig.parse_obj({'bots': [
+        {'symbol': 'ETH/USDT', 'timeframe': '4h', 'strategies': [{'name': 'KD50Strategy'}]},
+        {'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'ImpulseMACDStrategy'}]},
+        {'symbol': 'BTC/USDT', 'timeframe': '1h', 'strategies': [{'name': 'ImpulseMACDStrategy'}]},
+    ]})
+    runner = BotRunner(runner_config, backtest=False, sandbox=False, pool=FakePool(), hub=MarketDataHub(store=CandleStore()))
+    for book in runner._books.values():
+        book._position, book._dust, book._synced = 1.0, 0.0, True
+
+    for bot in runner.bots:
+        bot.sync_positions()
+
+    # ETH/USDT 的持倉可能是 KD50Strategy 開的, 不會修正 ImpulseMACDStrategy
+    eth_macd, btc_macd = runner.bots[1]._strategies[0], runner.bots[2]._strategies[0]
+    assert runner.bots[1].position_direction() is None
+    assert eth_macd._position_size == 0
+    assert runner.bots[2].position_direction() == 1
+    assert btc_macd._position_size == 1
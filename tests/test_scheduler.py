@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from ccxt_bot.core.scheduler import BarScheduler, next_boundary
+
+
+def ms(*args) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+@pytest.mark.parametrize("timeframe, now, expected", [
+    ('1s', ms(2023, 5, 17, 10, 0, 0) + 500, ms(2023, 5, 17, 10, 0, 1)),
+    ('15m', ms(2023, 5, 17, 10, 14, 59), ms(2023, 5, 17, 10, 15)),
+    ('4h', ms(2023, 5, 17, 10, 0), ms(2023, 5, 17, 12)),
+    ('4h', ms(2023, 5, 17, 12, 0), ms(2023, 5, 17, 16)),
+    ('1d', ms(2023, 5, 17, 23, 59), ms(2023, 5, 18)),
+    # 2023-05-17 是星期三
+    ('1w', ms(2023, 5, 17, 10), ms(2023, 5, 22)),
+    ('1M', ms(2023, 5, 17, 10), ms(2023, 6, 1)),
+    ('1M', ms(2023, 12, 31, 23), ms(2024, 1, 1)),
+    ('3M', ms(2023, 5, 17), ms(2023, 7, 1)),
+    ('1y', ms(2023, 5, 17), ms(2024, 1, 1)),
+])
+def test_next_boundary(timeframe: str, now: int, expected: int):
+    assert next_boundary(timeframe, now) == expected
+
+
+class FakeExchange():
+    async def fetch_time(self) -> int:
+        return int(time.time() * 1000) + 5000
+
+
+@pytest.mark.asyncio
+async def test_bar_scheduler_dispatch():
+    scheduler = BarScheduler(exchange=FakeExchange(), settle=0.0)
+    fired = []
+
+    async def job():
+        fired.append(scheduler.now())
+
+    for _ in range(100):
+        scheduler.register('1s', job)
+    scheduler.register('1m', lambda: None)
+
+    # 從每秒的 0.2 秒開始, 1.2 秒內只會經過一次收盤
+    await asyncio.sleep((1.2 - time.time() % 1) % 1)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(1.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # 所有工作在同一個收盤時間同時執行, 時間以交易所為準
+    assert len(fired) == 100
+    assert max(fired) % 1000 < 200
+    assert 4000 < scheduler._offset < 6000
+
+
+@pytest.mark.asyncio
+async def test_bar_scheduler_keeps_running_jobs():
+    scheduler = BarScheduler(settle=0.0)
+    release = asyncio.Event()
+
+    async def job():
+        await release.wait()
+
+    scheduler.register('1s', job)
+    scheduler._dispatch(0, ['1s'])
+
+    # 執行中的工作由 scheduler 保留引用, 完成後移除
+    assert len(scheduler._tasks) == 1
+    release.set()
+    await asyncio.gather(*scheduler._tasks)
+    await asyncio.sleep(0)
+    assert scheduler._tasks == set()
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from ccxt_bot.trade import shard
+from ccxt_bot.trade.base import Suggestion
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.indicator import IndicatorEngine
+from ccxt_bot.trade.market import MarketDataHub
+from ccxt_bot.trade.mock_exchange import synthetic_kbars
+from ccxt_bot.trade.runner import RunnerConfig
+from ccxt_bot.trade.shard import ShardSupervisor
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+from tests.conftest import FakeExchange, FakePool
+
+
+@pytest.fixture
+def kbars() -> list:
+    return synthetic_kbars(400)
+
+
+@pytest.mark.asyncio
+async def test_shard_matches_in_process(kbars: list):
+    runner_config = RunnerConfig.parse_obj({'bots': [
+        {'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'KD50Strategy'}]},
+        {'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'ImpulseMACDStrategy'}]},
+        {'symbol': 'BTC/USDT', 'timeframe': '1h', 'strategies': [{'name': 'KD50Strategy'}]},
+    ]})
+    supervisor = ShardSupervisor(
+        runner_config,
+        workers=2,
+        backtest=True,
+        line_token='',
+        pool=FakePool(FakeExchange(kbars, id='binance')),
+        hub=MarketDataHub(store=CandleStore()),
+    )
+    supervisor.start()
+    try:
+        eth = await supervisor.tick(0, skip_order=True)
+        btc = await supervisor.tick(1, skip_order=True)
+    finally:
+        await supervisor.stop()
+
+    df = IndicatorEngine().update(kbars[-300:]).tail(200)
+
+    assert sorted(eth) == [0, 1] and sorted(btc) == [2]
+    assert eth[0] == btc[2] == KD50Strategy().backtest(df)
+    assert eth[1] == ImpulseMACDStrategy().backtest(df)
+    assert len(eth[0]) > 0
+
+
+@pytest.mark.asyncio
+async def test_shard_recovers_from_dead_worker(kbars: list, monkeypatch, caplog):
+    monkeypatch.setattr(shard, '_WATCH_INTERVAL', 0.05)
+    runner_config = RunnerConfig.parse_obj({'bots': [
+        {'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'KD50Strategy'}]},
+    ]})
+    supervisor = ShardSupervisor(
+        runner_config,
+        workers=1,
+        backtest=True,
+        line_token='',
+        pool=FakePool(FakeExchange(kbars, id='binance')),
+        hub=MarketDataHub(store=CandleStore()),
+    )
+    supervisor.start()
+    try:
+        # 策略不會重複回傳同一根k線的訊號, 之後的 tick 只比對是否有回應
+        assert len((await supervisor.tick(0, skip_order=True))[0]) > 0
+
+        # 被取消的 tick 之後才回傳的結果會被忽略
+        task = asyncio.ensure_future(supervisor.tick(0, skip_order=True))
+        while not supervisor._pending:
+            await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert list(await supervisor.tick(0, skip_order=True)) == [0]
+
+        # worker 異常結束 等待中的請求失敗 並重新啟動 worker
+        dead = supervisor._processes[0]
+        dead.kill()
+        dead.join()
+        supervisor._requests[0].put((-1, 0, 0, 0, {}))
+        future = asyncio.get_running_loop().create_future()
+        supervisor._pending[-1] = (0, future)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(future, timeout=5)
+        assert supervisor._processes[0] is not dead
+        assert 'restart from scratch' in caplog.text
+
+        assert list(await supervisor.tick(0, skip_order=True)) == [0]
+        assert supervisor._pending == {}
+    finally:
+        await supervisor.stop()
+
+
+@pytest.mark.asyncio
+async def test_shard_syncs_book_position(kbars: list):
+    # 找一根 ImpulseMACDStrategy 在沒有持倉時做多的k線
+    end = next(
+        end for end in range(300, len(kbars))
+        if ImpulseMACDStrategy().run(IndicatorEngine().update(kbars[end - 300:end]).tail(200))
+    )
+    assert [r.suggestion for r in ImpulseMACDStrategy().run(IndicatorEngine().update(kbars[end - 300:end]).tail(200))] == [Suggestion.Long]
+
+    runner_config = RunnerConfig.parse_obj({'bots': [
+        {'symbol': 'ETH/USDT', 'timeframe': '1h', 'strategies': [{'name': 'ImpulseMACDStrategy'}]},
+    ]})
+    supervisor = ShardSupervisor(
+        runner_config,
+        workers=1,
+        backtest=False,
+        sandbox=False,
+        line_token='',
+        pool=FakePool(FakeExchange(kbars[:end], id='binance')),
+        hub=MarketDataHub(store=CandleStore()),
+    )
+    # 交易所上還有空單 (ex. 策略重新啟動)
+    book = supervisor._books[('binance', 'ETH/USDT')]
+    book._position, book._dust, book._synced = -1.0, 0.0, True
+
+    supervisor.start()
+    try:
+        results = await supervisor.tick(0, skip_order=True)
+    finally:
+        await supervisor.stop()
+
+    assert [r.suggestion for r in results[0]] == [Suggestion.Short_TP, Suggestion.Long]
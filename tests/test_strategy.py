@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pandas as pd
+
+from ccxt_bot.trade.base import Suggestion, match_transition
+from ccxt_bot.trade.indicator import ImpulseColor
+from ccxt_bot.trade.stragtegy import ImpulseMACDStrategy, KD50Strategy
+
+
+def test_kd50_backtest():
+    datas = pd.DataFrame(
+        {
+            'kdj_k': [40.0, 55.0, 60.0, 45.0, 50.0, 50.0, 30.0],
+            'open':  [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0],
+            'high':  [11.0, 12.0, 13.0, 14.0, 15.0, 16.0, 17.0],
+            'low':   [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+        },
+        index=pd.date_range('2023-01-01', periods=7, freq='H'),
+    )
+    strategy = KD50Strategy()
+
+    results = strategy.backtest(datas)
+
+    assert [(r.suggestion, r.stop_price) for r in results] == [
+        (Suggestion.Long, 0.2),
+        (Suggestion.Short, 14.0),
+        (Suggestion.Long, 0.5),
+    ]
+    assert results[0].msg == f"做多 2.0, 停損 0.2 at {datas.index[1]}"
+
+    # 已經發送過的訊號不會再發送
+    assert strategy.backtest(datas) == []
+
+
+def test_impulse_macd_backtest():
+    rng = np.random.default_rng(0)
+    n = 2000
+    # 重複的顏色 讓 紅紅綠綠 與 亮綠亮綠橘橘 的組合容易出現
+    colors = np.repeat(rng.choice(np.array(list(ImpulseColor), dtype=np.int8), n // 2), 2)
+    close = 1000 + np.cumsum(rng.normal(0, 5, n))
+    datas = pd.DataFrame(
+        {
+            'mdc': colors,
+            'close': close,
+            'open': close + rng.normal(0, 1, n),
+            'atr': rng.random(n) * 10,
+        },
+        index=pd.date_range('2023-01-01', periods=n, freq='H'),
+    )
+
+    expected_strategy = ImpulseMACDStrategy()
+    expected = []
+    for i in range(3, len(datas)-1):
+        expected.extend(expected_strategy.run(datas, curr_idx=i))
+
+    strategy = ImpulseMACDStrategy()
+    results = strategy.backtest(datas)
+
+    assert len(expected) > 0
+    assert results == expected
+    assert strategy._position_size == expected_strategy._position_size
+    assert strategy._long_stop_price == expected_strategy._long_stop_price
+    assert strategy._short_stop_price == expected_strategy._short_stop_price
+
+
+def test_signals_batch_matches_backtest():
+    rng = np.random.default_rng(1)
+    n = 500
+    datas = pd.DataFrame(
+        {
+            'kdj_k': rng.random(n) * 100,
+            'open':  rng.random(n) + 1,
+            'high':  rng.random(n) + 2,
+            'low':   rng.random(n),
+        },
+        index=pd.date_range('2023-01-01', periods=n, freq='H', tz='UTC'),
+    )
+    calls = []
+
+    batch = KD50Strategy().signals(datas)
+    message = batch._message
+    batch._message = lambda i: calls.append(i) or message(i)
+
+    assert len(batch) > 0
+    assert calls == []
+    assert batch.to_results() == KD50Strategy().backtest(datas)
+    assert calls == list(range(len(batch)))
+
+
+def test_match_transition():
+    R, G, L, O = ImpulseColor.RED, ImpulseColor.GREEN, ImpulseColor.LIME, ImpulseColor.ORANGE
+    codes = np.array([R, R, G, G, G, R, R, R, G, G, L, O], dtype=np.int8)
+
+    assert np.flatnonzero(match_transition(codes, R, G)).tolist() == [3, 9]
+    assert np.flatnonzero(match_transition(codes, R, G, length=3)).tolist() == []
+    assert np.flatnonzero(match_transition(codes, L, O, length=1)).tolist() == [11]
+    assert not match_transition(codes[:3], R, G).any()
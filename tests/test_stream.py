@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from ccxt_bot.trade.candle import CandleStore
+from ccxt_bot.trade.market import MarketDataHub
+from ccxt_bot.trade.stream import FakeKlineStream
+from tests.conftest import HOUR, FakeExchange, make_kbars
+
+
+@pytest.mark.asyncio
+async def test_fake_stream_closed_bars():
+    stream = FakeKlineStream()
+    stream.feed('ETH/USDT', '1h', [
+        [0, 1.0, 1.0, 1.0, 1.0, 1.0],
+        [0, 1.0, 2.0, 1.0, 2.0, 2.0],
+        [HOUR, 2.0, 2.0, 2.0, 2.0, 1.0],
+        [HOUR, 2.0, 3.0, 2.0, 3.0, 2.0],
+        [2 * HOUR, 3.0, 3.0, 3.0, 3.0, 1.0],
+    ])
+    stream.close()
+
+    events = [event async for event in stream.watch('ETH/USDT', '1h')]
+
+    assert events == [
+        ([0, 1.0, 2.0, 1.0, 2.0, 2.0], [HOUR, 2.0, 2.0, 2.0, 2.0, 1.0]),
+        ([HOUR, 2.0, 3.0, 2.0, 3.0, 2.0], [2 * HOUR, 3.0, 3.0, 3.0, 3.0, 1.0]),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_hub_push_without_rest():
+    exchange = FakeExchange(make_kbars(200, close=None), now=199 * HOUR + 10)
+    hub = MarketDataHub(store=CandleStore(window=100), window=100)
+    await hub.get(exchange, 'ETH/USDT', '1h')
+
+    # 收盤事件: 更新收盤的k線 並附加新的k線
+    closed, forming = make_kbars(201, close=None)[199:]
+    closed[4] = 500.0
+    exchange.now = 200 * HOUR + 10
+    await hub.push(exchange, 'ETH/USDT', '1h', closed)
+    await hub.push(exchange, 'ETH/USDT', '1h', forming)
+    df = await hub.get(exchange, 'ETH/USDT', '1h')
+
+    assert len(exchange.calls) == 1
+    assert df['timestamp'][-1] == 200 * HOUR
+    assert df['close'][-2] == 500.0
+    assert len(df) == 100
+
+
+@pytest.mark.asyncio
+async def test_hub_push_gap_refetch():
+    exchange = FakeExchange(make_kbars(200, close=None), now=199 * HOUR + 10)
+    hub = MarketDataHub(store=CandleStore(window=100), window=100)
+    await hub.get(exchange, 'ETH/USDT', '1h')
+
+    # 漏掉 200h 的k線
+    exchange.kbars = make_kbars(202, close=None)
+    exchange.now = 201 * HOUR + 10
+    await hub.push(exchange, 'ETH/USDT', '1h', exchange.kbars[-1])
+    df = await hub.get(exchange, 'ETH/USDT', '1h')
+
+    assert exchange.calls[-1] == ('1h', None, 100)
+    assert df['timestamp'][-1] == 201 * HOUR
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+
 import pytest
 import pytest_mock
-import ccxt
+import ccxt.async_support as ccxt_async
 from ccxt_bot.core import config
 
+from ccxt_bot.core.utils import TTLCache
+from ccxt_bot.trade.base import StrategyResult, Suggestion
 from ccxt_bot.trade.trader import Trader
 
 @pytest.fixture
@@ -17,16 +21,17 @@ def balance_data() -> tuple:
 
 
 
+@pytest.mark.asyncio
 @pytest.mark.parametrize("expected", [
     (0.450),
 ])
-def test_calc_amount(balance_data: tuple,
+async def test_calc_amount(balance_data: tuple,
                     mocker: pytest_mock.MockFixture,
                     expected
                     ):
     
-    exchange_class = getattr(ccxt, 'binance')
-    exchange:ccxt.binance = exchange_class({
+    exchange_class = getattr(ccxt_async, 'binance')
+    exchange:ccxt_async.binance = exchange_class({
         'apiKey': config.BINANCE_API_KEY,
         'secret': config.BINANCE_SECRET,
     })
@@ -36,6 +41,139 @@ def test_calc_amount(balance_data: tuple,
         symbol="ETH/USDT",
     )
     mocker.patch.object(Trader, "fetch_balance", return_value=balance_data)
-    mocker.patch.object(ccxt.binance, "fetch_ticker", return_value={'close':1000.0})
+    mocker.patch.object(ccxt_async.binance, "fetch_ticker", return_value={'close':1000.0})
     
-    assert trader.calc_amount() == expected
+    assert await trader.calc_amount() == expected
+    await exchange.close()
+
+
+@pytest.mark.asyncio
+async def test_ttl_cache_expire_and_invalidate():
+    now = [0.0]
+    cache = TTLCache(ttl=5, clock=lambda: now[0])
+    calls = []
+
+    async def fetch():
+        calls.append(now[0])
+        return len(calls)
+
+    assert await cache.get_or_fetch('balance', fetch) == 1
+    now[0] = 4.9
+    assert await cache.get_or_fetch('balance', fetch) == 1
+    now[0] = 5.0
+    assert await cache.get_or_fetch('balance', fetch) == 2
+
+    cache.invalidate('balance')
+    assert cache.get('balance') is None
+    assert await cache.get_or_fetch('balance', fetch) == 3
+
+
+@pytest.mark.asyncio
+async def test_fetch_balance_cached(balance_data: tuple, mocker: pytest_mock.MockFixture):
+    exchange = ccxt_async.binance()
+    raw = {'ETH': balance_data[1][0], 'USDT': balance_data[1][1]}
+    fetch_balance = mocker.patch.object(ccxt_async.binance, "fetch_balance", return_value=raw)
+    mocker.patch.object(ccxt_async.binance, "fetch_ticker", return_value={'close':1000.0})
+
+    trader = Trader(exchange=exchange, symbol="ETH/USDT")
+    await trader.refresh()
+    assert await trader.calc_amount() == 0.450
+    assert fetch_balance.call_count == 1
+
+    # 自己下單後重新獲取
+    trader.invalidate()
+    assert await trader.fetch_balance() == balance_data
+    assert fetch_balance.call_count == 2
+    await exchange.close()
+
+
+class FakeMarginExchange():
+    """記錄請求順序, 每個請求延遲 delay 秒, max_in_flight 為同時執行中的 cancel_order 最大數量"""
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = []
+        self.open_orders = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def market(self, symbol):
+        return {'id': symbol.replace('/', '')}
+
+    def amount_to_precision(self, symbol, amount):
+        return f"{float(amount):.3f}"
+
+    def price_to_precision(self, symbol, price):
+        return f"{float(price):.2f}"
+
+    async def _request(self, name, *args, **kwargs):
+        self.calls.append((name, args, kwargs))
+        await asyncio.sleep(self.delay)
+
+    async def fetch_balance(self, params=None):
+        await self._request('fetch_balance')
+        return {
+            'ETH': {'free': 0.2, 'used': 0.0, 'total': 0.2, 'debt': 0.1},
+            'USDT': {'free': 500, 'used': 0.0, 'total': 500, 'debt': 0.0},
+        }
+
+    async def fetch_ticker(self, symbol):
+        await self._request('fetch_ticker')
+        return {'close': 1000.0}
+
+    async def create_order(self, **kwargs):
+        await self._request('create_order', **kwargs)
+        return {'id': '1', 'symbol': kwargs['symbol'], 'side': kwargs['side'], 'status': 'closed', 'filled': float(kwargs['amount'])}
+
+    async def sapi_post_margin_order_oco(self, params):
+        await self._request('oco', params)
+        return {'orderListId': 1}
+
+    async def fetch_open_orders(self, symbol, params=None):
+        await self._request('fetch_open_orders')
+        return self.open_orders
+
+    async def cancel_order(self, order_id, symbol):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await self._request('cancel_order', order_id, symbol)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_open_long_bracket():
+    exchange = FakeMarginExchange()
+    trader = Trader(exchange=exchange, symbol="ETH/USDT", sandbox=False)
+
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Long, stop_price=950.123, tp_price=1100.456))
+
+    names = [name for name, _, _ in exchange.calls]
+    assert names == ['fetch_balance', 'fetch_ticker', 'create_order', 'oco']
+    oco = exchange.calls[-1][1][0]
+    assert oco['symbol'] == 'ETHUSDT' and oco['side'] == 'SELL'
+    assert (oco['price'], oco['stopPrice']) == ('1100.46', '950.12')
+    assert {'refresh', 'entry', 'protect', 'unprotected', 'total'} <= set(trader.latency)
+
+
+@pytest.mark.asyncio
+async def test_close_short_cancel_concurrently():
+    exchange = FakeMarginExchange(delay=0.1)
+    exchange.open_orders = [
+        # OCO 的兩張委託只取消一次
+        {'id': 1, 'symbol': 'ETH/USDT', 'side': 'buy', 'info': {'orderListId': 7}},
+        {'id': 2, 'symbol': 'ETH/USDT', 'side': 'buy', 'info': {'orderListId': 7}},
+        {'id': 3, 'symbol': 'ETH/USDT', 'side': 'buy', 'info': {'orderListId': -1}},
+        {'id': 4, 'symbol': 'ETH/USDT', 'side': 'sell', 'info': {'orderListId': -1}},
+    ]
+    trader = Trader(exchange=exchange, symbol="ETH/USDT", sandbox=False)
+
+    await trader.create_order(StrategyResult(name='test', suggestion=Suggestion.Short_SL))
+
+    cancels = [args[0] for name, args, _ in exchange.calls if name == 'cancel_order']
+    assert cancels == [1, 3]
+    # 兩張委託同時取消
+    assert exchange.max_in_flight == 2
+    _, _, exit_order = exchange.calls[-1]
+    assert exit_order['side'] == 'buy' and exit_order['amount'] == '0.100'
+    assert exit_order['params']['sideEffectType'] == 'AUTO_REPAY'